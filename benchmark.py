@@ -0,0 +1,277 @@
+"""Benchmarks headless da Plataforma de Estudos.
+
+Gera um banco sintético (BD/*.json) num diretório temporário e mede as
+operações de dados principais sem abrir nenhuma janela Tk. O resultado sai
+em JSON para comparar versões:
+
+    python benchmark.py --students 2000 --output depois.json --compare antes.json
+"""
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+SUBJECTS = ["Matemática", "Português", "Programação"]
+CURSOS = ["ADS", "Engenharia", "Administração"]
+PERIODOS = ["Manhã", "Tarde", "Noite"]
+WORDS = ("algoritmo dados lista função classe variável laço banco consulta tabela "
+         "resposta exercício projeto relatório análise sistema rede memória").split()
+
+
+def _text(rng, n_words):
+    return " ".join(rng.choice(WORDS) for _ in range(n_words))
+
+
+def generate_dataset(m, args):
+    """Write a synthetic school into m.DB_FILES using the app's own encryption."""
+    rng = random.Random(args.seed)
+    turmas = [f"T{i:02d}" for i in range(1, args.turmas + 1)]
+    start = datetime.date(2025, 2, 3)
+
+    students = []
+    for i in range(args.students):
+        turma = turmas[i % len(turmas)]
+        grades = {subj: {"sem1": round(rng.uniform(0, 10), 1), "sem2": None} for subj in SUBJECTS}
+        students.append({
+            "username": f"aluno{i}",
+            "password": m.encrypt_field(f"senha{i}"),
+            "name": m.encrypt_field(f"Aluno {i}"),
+            "age": m.encrypt_field(str(rng.randint(17, 40))),
+            "email": m.encrypt_field(f"aluno{i}@escola.br"),
+            "cpf": m.encrypt_field(f"{rng.randint(0, 10**11 - 1):011d}"),
+            "curso": m.encrypt_field(rng.choice(CURSOS)),
+            "turma": m.encrypt_field(turma),
+            "semestre": m.encrypt_field(str(rng.randint(1, 8))),
+            "periodo": m.encrypt_field(rng.choice(PERIODOS)),
+            "grades": grades,
+        })
+
+    professors = []
+    for i in range(args.professors):
+        professors.append({
+            "username": f"prof{i}",
+            "password": m.encrypt_field(f"senha{i}"),
+            "name": m.encrypt_field(f"Professor {i}"),
+            "turma": m.encrypt_field(turmas[i % len(turmas)]),
+            "curso": m.encrypt_field(rng.choice(CURSOS)),
+            "grades": {},
+        })
+
+    activities = []
+    for aid in range(1, args.activities + 1):
+        turma = rng.choice(turmas)
+        roster = [s["username"] for idx, s in enumerate(students) if turmas[idx % len(turmas)] == turma]
+        subs = []
+        for uname in rng.sample(roster, min(len(roster), args.submissions)):
+            # same write path as submit_resp: long texts are stored compressed
+            subs.append({"student": uname, "text": m.pack_text(_text(rng, args.words)),
+                         "date": start.isoformat(), "grade": rng.choice([None, round(rng.uniform(0, 10), 1)])})
+        comments = [{"author": "prof0", "text": _text(rng, 12)} for _ in range(rng.randint(0, 3))]
+        deadline = start + datetime.timedelta(days=rng.randint(0, 200))
+        activities.append({
+            "id": aid, "title": f"Atividade {aid}", "description": _text(rng, 30),
+            "deadline": deadline.isoformat(), "comments": comments, "submissions": subs,
+            "attachments": [], "target": {"curso": None, "turma": turma, "semestre": None, "periodo": None},
+        })
+
+    m.save_db("Aluno", students)
+    m.save_db("Professor", professors)
+    m.save_db("Atividades", activities)
+    # grades are generated in the legacy record shape and moved to BD/boletim
+    m.migrate_grades_to_gradebook()
+
+    for turma in turmas:
+        roster = [s["username"] for idx, s in enumerate(students) if turmas[idx % len(turmas)] == turma]
+        for d in range(args.attendance_days):
+            day = (start + datetime.timedelta(days=d)).isoformat()
+            absent = [u for u in roster if rng.random() < 0.1]
+            m.mark_absences(turma, day, absent, "prof0")
+    return {"turmas": turmas}
+
+
+def measure(fn, repeat):
+    """Run fn `repeat` times and return timing statistics in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return {
+        "min_ms": round(min(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "max_ms": round(max(samples), 3),
+        "runs": repeat,
+    }
+
+
+def run_benchmarks(m, meta, args):
+    rng = random.Random(args.seed + 1)
+    results = {}
+    last = args.students - 1
+    turma = meta["turmas"][0]
+
+    def login():
+        found = m.login_lookup("Aluno", f"aluno{last}", f"senha{last}")
+        assert found is not None
+        # the landing view reads the name
+        m.LazyUser(found, "Aluno").get("name")
+    results["login_lookup"] = measure(login, args.repeat)
+
+    def home():
+        m.home_summary(f"aluno{last}", meta["turmas"][last % len(meta["turmas"])])
+    results["student_home"] = measure(home, args.repeat)
+
+    def roster():
+        m.turma_roster(turma)
+    results["roster_by_turma"] = measure(roster, args.repeat)
+
+    def grades():
+        studs = m.turma_roster(turma)
+        values = {s["username"]: f"{rng.uniform(0, 10):.1f}" for s in m.filter_by_turma(studs, turma)}
+        m.save_turma_grades("Matemática", "2", values)
+    results["save_grades"] = measure(grades, args.repeat)
+
+    def card():
+        m.report_card(f"aluno{last}")
+    results["report_card"] = measure(card, args.repeat)
+
+    def class_stats():
+        m.grade_stats(turma)
+    results["grade_stats_turma"] = measure(class_stats, args.repeat)
+
+    def export_turma():
+        m.export_gradebook(os.path.join(os.environ["BD_DIR"], "export.csv"), turma)
+    results["export_turma_csv"] = measure(export_turma, args.repeat)
+
+    m.search("warm-up")  # builds BD_BUSCA.json for the generated activities
+    def search_query():
+        m.search("análise dos dados do sistema", "Professor")
+    results["search_query"] = measure(search_query, args.repeat)
+
+    def similar_pairs():
+        m.similar_submissions(args.activities // 2)
+    results["similar_submissions"] = measure(similar_pairs, args.repeat)
+
+    def open_submissions():
+        act = m.get_activity(1) or {}
+        for sub in act.get("submissions", []):
+            m.submission_text(sub)
+    results["open_submissions"] = measure(open_submissions, args.repeat)
+
+    def grade_one():
+        act = m.get_activity(args.activities // 2) or {}
+        for sub in act.get("submissions", [])[:1]:
+            m.grade_submission(act["id"], sub["student"], sub["date"], 7.5, "prof0")
+    results["grade_one_submission"] = measure(grade_one, args.repeat)
+
+    def mark_day():
+        roster_names = [s["username"] for s in m.turma_roster(turma)]
+        m.mark_absences(turma, "2025-12-01", rng.sample(roster_names, max(1, len(roster_names) // 10)), "prof0")
+    results["mark_attendance"] = measure(mark_day, args.repeat)
+
+    def absence_report():
+        m.attendance_report(turma, "2025-03-01", "2025-03-31")
+    results["absence_report_month"] = measure(absence_report, args.repeat)
+
+    def chart():
+        m.turma_submission_rates(turma)
+    results["performance_chart"] = measure(chart, args.repeat)
+
+    plain = [f"campo sensível {i}" for i in range(args.crypto_ops)]
+    tokens = []
+    t0 = time.perf_counter()
+    for p in plain:
+        tokens.append(m.encrypt_field(p))
+    enc_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for t in tokens:
+        m.decrypt_field(t)
+    dec_s = time.perf_counter() - t0
+    results["encrypt_throughput"] = {"ops": len(plain), "ops_per_s": round(len(plain) / enc_s, 1) if enc_s else None}
+    results["decrypt_throughput"] = {"ops": len(tokens), "ops_per_s": round(len(tokens) / dec_s, 1) if dec_s else None}
+    return results
+
+
+def compare(current, baseline):
+    """Print the ratio of median times (current / baseline) for shared benchmarks."""
+    base = baseline.get("results", {})
+    for name, res in current["results"].items():
+        old = base.get(name)
+        if not old:
+            continue
+        if "median_ms" in res and old.get("median_ms"):
+            ratio = res["median_ms"] / old["median_ms"]
+            print(f"{name:24s} {old['median_ms']:10.3f} ms -> {res['median_ms']:10.3f} ms  x{ratio:.2f}", file=sys.stderr)
+        elif "ops_per_s" in res and old.get("ops_per_s"):
+            ratio = res["ops_per_s"] / old["ops_per_s"]
+            print(f"{name:24s} {old['ops_per_s']:10.1f} op/s -> {res['ops_per_s']:10.1f} op/s  x{ratio:.2f}", file=sys.stderr)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmarks headless das operações de dados.")
+    ap.add_argument("--students", type=int, default=1000)
+    ap.add_argument("--professors", type=int, default=20)
+    ap.add_argument("--turmas", type=int, default=10)
+    ap.add_argument("--activities", type=int, default=100)
+    ap.add_argument("--submissions", type=int, default=30, help="submissões por atividade")
+    ap.add_argument("--words", type=int, default=80, help="palavras por submissão")
+    ap.add_argument("--attendance-days", type=int, default=60)
+    ap.add_argument("--crypto-ops", type=int, default=5000)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--format", choices=("json", "compact", "binary"), help="formato dos arquivos BD (BD_FORMAT)")
+    ap.add_argument("--activity-store", choices=("json", "jsonl"), default="json", help="armazenamento das atividades")
+    ap.add_argument("--partitions", choices=("unico", "turma"), default="unico", help="alunos e atividades num arquivo só ou um por turma")
+    ap.add_argument("--output", help="arquivo JSON de saída (padrão: stdout)")
+    ap.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    args = ap.parse_args(argv)
+    if args.format == "binary" and importlib.util.find_spec("msgpack") is None:
+        ap.error("--format binary precisa do pacote msgpack (pip install msgpack)")
+    if args.partitions == "turma" and args.activity_store == "jsonl":
+        ap.error("--partitions turma não funciona com --activity-store jsonl")
+
+    with tempfile.TemporaryDirectory(prefix="bd_bench_") as tmp:
+        # must be set before main is imported: BD_DIR and DB_FILES are resolved at import time
+        os.environ["BD_DIR"] = tmp
+        if args.format:
+            os.environ["BD_FORMAT"] = args.format
+        import main as m
+
+        t0 = time.perf_counter()
+        meta = generate_dataset(m, args)
+        m.convert_activity_store(args.activity_store)
+        m.convert_partitions(args.partitions)
+        gen_s = time.perf_counter() - t0
+        sizes = {p.relative_to(m.BD_DIR).as_posix(): os.path.getsize(p) for p in m.storage_paths()}
+        fmt = m.db_format()  # what the files were actually written in
+        results = run_benchmarks(m, meta, args)
+
+    report = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "dataset": {"generate_s": round(gen_s, 3), "format": fmt, "file_bytes": sizes},
+        "results": results,
+    }
+    out = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(out)
+    else:
+        print(out)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import tkinter as tk
+import tkinter.font as tkfont
 import ctypes
 import os
 import json
@@ -6,6 +7,34 @@ import base64
 import secrets
 from pathlib import Path
 import importlib
+import time
+import functools
+import contextlib
+import copy
+import random
+import inspect
+import threading
+import socket
+import sys
+import queue
+import zlib
+import lzma
+import mmap
+import array
+import struct
+import concurrent.futures
+import multiprocessing
+import hashlib
+import re
+import csv
+import codecs
+import unicodedata
+import math
+import heapq
+import atexit
+import weakref
+from collections import deque
+from collections.abc import MutableMapping
 # tkinter messagebox
 from tkinter import messagebox
 
@@ -29,8 +58,142 @@ ACCESSIBILITY = {
     'focus_mode': False,
 }
 
-DEFAULT_FONT = ("Arial", 11)
 
+
+# === Instrumentação (tempos e contadores) ===
+# Off by default; F12 toggles it at runtime and opens the debug window.
+PERF = {
+    'enabled': False,
+    'profile_next': False,  # capture the next view render with cProfile
+    'last_profile': None,   # path of the last .pstats dump
+    'last_view': None,      # (name, ms) of the last rendered view
+}
+PERF_SAMPLE_SIZE = 500
+_PERF_SAMPLES = {}
+_PERF_COUNTS = {}
+_PERF_LOCK = threading.Lock()  # timings also come from the prefetch and write-behind threads
+
+
+def record_timing(name, ms):
+    with _PERF_LOCK:
+        _PERF_COUNTS[name] = _PERF_COUNTS.get(name, 0) + 1
+        samples = _PERF_SAMPLES.get(name)
+        if samples is None:
+            samples = _PERF_SAMPLES[name] = deque(maxlen=PERF_SAMPLE_SIZE)
+        samples.append(ms)
+    if name.startswith('view.'):
+        PERF['last_view'] = (name, ms)
+
+
+def perf_reset():
+    with _PERF_LOCK:
+        _PERF_SAMPLES.clear()
+        _PERF_COUNTS.clear()
+    PERF['last_view'] = None
+
+
+def perf_report():
+    """Per-call stats (count, p50/p95/p99/max in ms) over the recent samples, slowest total first."""
+    with _PERF_LOCK:
+        snapshot = [(name, list(samples), _PERF_COUNTS.get(name, len(samples)))
+                    for name, samples in _PERF_SAMPLES.items()]
+    rows = []
+    for name, samples, count in snapshot:
+        ordered = sorted(samples)
+        n = len(ordered)
+        pct = lambda p: ordered[min(n - 1, int(p * n))]
+        rows.append({
+            'name': name,
+            'count': count,
+            'p50': pct(0.50),
+            'p95': pct(0.95),
+            'p99': pct(0.99),
+            'max': ordered[-1],
+            'total': sum(ordered),
+        })
+    rows.sort(key=lambda r: r['total'], reverse=True)
+    return rows
+
+
+def _profile_call(name, fn, args, kwargs):
+    import cProfile
+    PERF['profile_next'] = False
+    prof = cProfile.Profile()
+    t0 = time.perf_counter()
+    try:
+        return prof.runcall(fn, *args, **kwargs)
+    finally:
+        record_timing(name, (time.perf_counter() - t0) * 1000.0)
+        out_dir = BD_DIR / "perf"
+        out_dir.mkdir(exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = out_dir / f"{name}_{stamp}.pstats"
+        prof.dump_stats(str(path))
+        PERF['last_profile'] = str(path)
+
+
+def instrumented(name):
+    """Decorator: time calls under `name` when PERF['enabled'] (views may also be profiled)."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not PERF['enabled']:
+                return fn(*args, **kwargs)
+            if PERF['profile_next'] and name.startswith('view.'):
+                return _profile_call(name, fn, args, kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record_timing(name, (time.perf_counter() - t0) * 1000.0)
+        return wrapper
+    return deco
+
+
+def show_perf_window(root=None):
+    """Small debug window with the last view render time and per-call percentiles."""
+    win = tk.Toplevel(root)
+    win.title("Desempenho (debug)")
+    win.geometry("520x360")
+    enabled_var = tk.IntVar(value=1 if PERF['enabled'] else 0)
+    bar = tk.Frame(win)
+    bar.pack(fill="x", padx=6, pady=4)
+    tk.Checkbutton(bar, text="Coletar métricas", variable=enabled_var,
+                   command=lambda: PERF.__setitem__('enabled', bool(enabled_var.get()))).pack(side="left")
+    def arm_profile():
+        PERF['enabled'] = True
+        enabled_var.set(1)
+        PERF['profile_next'] = True
+    tk.Button(bar, text="Perfilar próxima tela", command=arm_profile).pack(side="left", padx=6)
+    tk.Button(bar, text="Limpar", command=perf_reset).pack(side="left", padx=6)
+    status = tk.Label(win, text="", anchor="w", justify="left")
+    status.pack(fill="x", padx=6)
+    txt = tk.Text(win, height=16, width=70, font=get_font(9, family="Courier"))
+    txt.pack(fill="both", expand=True, padx=6, pady=4)
+
+    def refresh():
+        if not win.winfo_exists():
+            return
+        lines = []
+        last = PERF.get('last_view')
+        lines.append(f"Última tela: {last[0]} {last[1]:.1f} ms" if last else "Última tela: -")
+        if PERF['profile_next']:
+            lines.append("Perfil: aguardando próxima tela...")
+        elif PERF.get('last_profile'):
+            lines.append(f"Perfil salvo em: {PERF['last_profile']}")
+        status.config(text="\n".join(lines))
+        txt.config(state="normal")
+        txt.delete("1.0", tk.END)
+        txt.insert(tk.END, f"{'chamada':28s}{'n':>6s}{'p50':>9s}{'p95':>9s}{'p99':>9s}{'max':>9s}\n")
+        for r in perf_report():
+            txt.insert(tk.END, f"{r['name'][:27]:28s}{r['count']:6d}{r['p50']:9.2f}{r['p95']:9.2f}{r['p99']:9.2f}{r['max']:9.2f}\n")
+        txt.config(state="disabled")
+        win.after(1000, refresh)
+    refresh()
+    return win
+
+
+@instrumented('tts.speak')
 def speak(text):
     """Speak text via TTS engine if available, otherwise quietly no-op."""
     if not ACCESSIBILITY.get('tts'):
@@ -60,10 +223,109 @@ def speak(text):
         # swallow tts errors
         pass
 
-def get_font(base_size=11):
+# === Estilo (fontes compartilhadas e alto contraste) ===
+# get_font() hands out one shared tkinter Font per (family, size, weight);
+# apply_text_size() resizes those (and Tk's named default fonts) in place, so
+# every widget using them follows without the view being rebuilt.
+# apply_contrast() recolors the live widgets in one pass; _THEMED remembers
+# each recolored widget's own colors to put back when contrast is turned off,
+# and widgets mapped while high contrast is on are recolored as they appear.
+_FONTS = {}
+_NAMED_FONT_SIZES = {}
+_TK_NAMED_FONTS = ("TkDefaultFont", "TkTextFont", "TkFixedFont", "TkMenuFont", "TkHeadingFont")
+_THEMED = weakref.WeakKeyDictionary()
+HIGH_CONTRAST = {
+    'bg': '#000000',
+    'fg': '#ffffff',
+    'button_fg': '#ffff00',
+    'active_bg': '#333333',
+}
+
+
+def _font_size(base_size):
     if ACCESSIBILITY.get('large_text'):
-        return ("Arial", max(base_size + 4, 14))
-    return ("Arial", base_size)
+        return max(base_size + 4, 14)
+    return base_size
+
+
+def get_font(base_size=11, weight="normal", family="Arial"):
+    key = (family, base_size, weight)
+    font = _FONTS.get(key)
+    if font is None:
+        try:
+            font = tkfont.Font(family=family, size=_font_size(base_size), weight=weight)
+        except RuntimeError:
+            # no Tk root yet: a plain tuple still works, it just won't follow toggles
+            return (family, _font_size(base_size), weight)
+        _FONTS[key] = font
+    return font
+
+
+def reset_style_registry():
+    """Forget fonts and themed widgets of a destroyed Tk root."""
+    _FONTS.clear()
+    _NAMED_FONT_SIZES.clear()
+    _THEMED.clear()
+
+
+def apply_text_size():
+    for (_family, base_size, _weight), font in _FONTS.items():
+        font.configure(size=_font_size(base_size))
+    for name in _TK_NAMED_FONTS:
+        try:
+            font = tkfont.nametofont(name)
+        except Exception:
+            continue
+        base = _NAMED_FONT_SIZES.setdefault(name, font.cget("size"))
+        # negative sizes are pixels
+        font.configure(size=_font_size(abs(base)) * (-1 if base < 0 else 1))
+
+
+def _contrast_colors(widget):
+    cls = widget.winfo_class()
+    if cls in ("Button", "Checkbutton", "Radiobutton", "Menubutton"):
+        return {"bg": HIGH_CONTRAST['bg'], "fg": HIGH_CONTRAST['button_fg'],
+                "activebackground": HIGH_CONTRAST['active_bg'], "activeforeground": HIGH_CONTRAST['button_fg']}
+    if cls in ("Entry", "Text", "Listbox"):
+        return {"bg": HIGH_CONTRAST['bg'], "fg": HIGH_CONTRAST['fg'], "insertbackground": HIGH_CONTRAST['fg']}
+    if cls in ("Label", "Message"):
+        return {"bg": HIGH_CONTRAST['bg'], "fg": HIGH_CONTRAST['fg']}
+    return {"bg": HIGH_CONTRAST['bg']}
+
+
+def _theme_widget(widget, contrast):
+    try:
+        if contrast:
+            colors = _contrast_colors(widget)
+            if widget not in _THEMED:
+                _THEMED[widget] = {k: widget.cget(k) for k in colors}
+            widget.configure(**colors)
+        elif widget in _THEMED:
+            widget.configure(**_THEMED.pop(widget))
+    except tk.TclError:
+        pass  # destroyed, or an option this widget doesn't have
+
+
+def apply_contrast(root):
+    """Recolor every live widget for the current high_contrast setting."""
+    if ACCESSIBILITY.get('high_contrast'):
+        stack = [root]
+        while stack:
+            widget = stack.pop()
+            _theme_widget(widget, True)
+            stack.extend(widget.winfo_children())
+    else:
+        for widget in list(_THEMED.keys()):
+            _theme_widget(widget, False)
+
+
+def install_contrast_hook(root):
+    """Recolor widgets created while high contrast is on as soon as they are shown."""
+    def on_map(evt):
+        if ACCESSIBILITY.get('high_contrast') and evt.widget not in _THEMED:
+            _theme_widget(evt.widget, True)
+    for cls in ("Frame", "Label", "Button", "Checkbutton", "Radiobutton", "Entry", "Text", "Listbox", "Toplevel", "Canvas"):
+        root.bind_class(cls, "<Map>", on_map, add="+")
 
 
 # Theme constants to make visual tuning easier
@@ -121,11 +383,16 @@ except Exception:
 # === Configuração da biblioteca C ===
 LIBRARY_NAME = "notas.dll"  # use "notas.so" ou "notas.dylib" conforme o sistema
 lib_path = os.path.join(os.path.dirname(__file__), LIBRARY_NAME)
-lib = ctypes.CDLL(lib_path)
+try:
+    lib = ctypes.CDLL(lib_path)
+except OSError:
+    # library missing (e.g. headless benchmarks on another OS): UI falls back gracefully
+    lib = None
 
 # Define tipos da função C
-lib.calcular_media.argtypes = [ctypes.c_float, ctypes.c_float, ctypes.c_float]
-lib.calcular_media.restype = ctypes.c_float
+if lib is not None:
+    lib.calcular_media.argtypes = [ctypes.c_float, ctypes.c_float, ctypes.c_float]
+    lib.calcular_media.restype = ctypes.c_float
 try:
     lib.semester_from_iso_date.argtypes = [ctypes.c_char_p]
     lib.semester_from_iso_date.restype = ctypes.c_int
@@ -140,7 +407,7 @@ def abrir_popup():
     popup.title("Cálculo de Média")
     popup.geometry("300x300")
 
-    tk.Label(popup, text="Digite as notas do aluno", font=("Arial", 12, "bold")).pack(pady=10)
+    tk.Label(popup, text="Digite as notas do aluno", font=get_font(12, "bold")).pack(pady=10)
 
     frame = tk.Frame(popup)
     frame.pack(pady=10)
@@ -157,7 +424,7 @@ def abrir_popup():
     n3_entry = tk.Entry(frame, width=10)
     n3_entry.grid(row=2, column=1, padx=5, pady=5)
 
-    resultado_label = tk.Label(popup, text="", font=("Arial", 12), fg="blue")
+    resultado_label = tk.Label(popup, text="", font=get_font(12), fg="blue")
     resultado_label.pack(pady=10)
 
     # Função interna para calcular e mostrar o resultado
@@ -166,6 +433,9 @@ def abrir_popup():
             n1 = float(n1_entry.get())
             n2 = float(n2_entry.get())
             n3 = float(n3_entry.get())
+            if lib is None:
+                resultado_label.config(text=f"Erro: {LIBRARY_NAME} não encontrada.", fg="red")
+                return
 
             media = lib.calcular_media(n1, n2, n3)
             resultado_label.config(text=f"Média final: {media:.2f}")
@@ -177,13 +447,22 @@ def abrir_popup():
 
 # === Banco de dados (JSON) ===
 BASE_DIR = Path(__file__).resolve().parent
-BD_DIR = BASE_DIR / "BD"
+# BD_DIR can be overridden (shared lab folders, benchmarks) through the environment
+BD_DIR = Path(os.environ.get("BD_DIR") or (BASE_DIR / "BD"))
+# Activities can alternatively live in a JSON Lines store (see convert_activity_store)
+ACTIVITY_JSON = BD_DIR / "BD_ACT.json"
+ACTIVITY_JSONL = BD_DIR / "BD_ACT.jsonl"
 DB_FILES = {
     "Aluno": BD_DIR / "BD_A.json",
     "Professor": BD_DIR / "BD_P.json",
     "Administrativo": BD_DIR / "BD_AD.json",
-    "Atividades": BD_DIR / "BD_ACT.json",
+    "Atividades": ACTIVITY_JSONL if ACTIVITY_JSONL.exists() else ACTIVITY_JSON,
 }
+# Students and activities can alternatively be split per turma (see convert_partitions)
+PARTITION_DIR = BD_DIR / "turmas"
+PARTITION_DIRECTORY = PARTITION_DIR / "diretorio.json"
+PARTITIONED_ROLES = ("Aluno", "Atividades")
+PARTITIONS = {"enabled": PARTITION_DIRECTORY.exists()}
 
 ATTACH_DIR = BD_DIR / "attachments"
 
@@ -191,14 +470,13 @@ ATTACH_DIR = BD_DIR / "attachments"
 def ensure_db_files():
     BD_DIR.mkdir(exist_ok=True)
     ATTACH_DIR.mkdir(exist_ok=True)
-    for path in DB_FILES.values():
-        if not path.exists():
-            path.write_text("[]", encoding="utf-8")
+    for role, path in DB_FILES.items():
+        if not path.exists() and not partitioned(role):
+            path.write_text("" if path.suffix == ".jsonl" else "[]", encoding="utf-8")
     # Ensure default admin exists in administrativo DB
     ad_path = DB_FILES["Administrativo"]
     try:
-        with open(ad_path, "r", encoding="utf-8") as f:
-            ad_users = json.load(f)
+        ad_users = _read_db(ad_path)
     except Exception:
         ad_users = []
     if not any(u.get("username") == "admin" for u in ad_users):
@@ -209,8 +487,7 @@ def ensure_db_files():
         admin_entry["password"] = encrypt_field("admin")
         admin_entry["name"] = encrypt_field("Administrador")
         ad_users.append(admin_entry)
-        with open(ad_path, "w", encoding="utf-8") as f:
-            json.dump(ad_users, f, indent=2, ensure_ascii=False)
+        _write_db(ad_path, ad_users)
 
 
 def key_path():
@@ -241,27 +518,97 @@ def xor_bytes(data, key):
     return bytes(out)
 
 
+# === Chaves (secret.key, rotação) ===
+# Until the first rotation every token is "ENC:<base64>" under secret.key.
+# Rotating starts writing tokens tagged with the id of their key,
+# "ENC@<kid>:" / "FERN@<kid>:", and keeps every key that ever encrypted
+# something in BD/keys/ ("legacy.key" is the one untagged tokens use), so any
+# token can be decrypted while the job runs, after it, or if it was
+# interrupted. The keyring is re-read at most every KEYRING_TTL seconds so
+# running instances pick up a rotation started by another process.
+KEYS_DIR = BD_DIR / "keys"
+KEYRING_TTL = 1.0
+_TOKEN_RE = re.compile(r"(ENC|FERN)(?:@([0-9a-f]{8}))?:")
+_KEYRING = {"checked": None}
+
+
+def key_id(key):
+    return hashlib.sha256(key).hexdigest()[:8]
+
+
+def next_key_path():
+    return BD_DIR / "secret.key.next"
+
+
+def _read_key(path):
+    return base64.b64decode(path.read_bytes())
+
+
+def _keyring():
+    now = time.monotonic()
+    if _KEYRING["checked"] is not None and now - _KEYRING["checked"] < KEYRING_TTL:
+        return _KEYRING
+    current = load_key()
+    keys = {key_id(current): current}
+    legacy = current
+    if KEYS_DIR.exists():
+        for p in KEYS_DIR.glob("*.key"):
+            raw = _read_key(p)
+            keys[key_id(raw)] = raw
+            if p.name == "legacy.key":
+                legacy = raw
+    write = current
+    if next_key_path().exists():
+        write = _read_key(next_key_path())
+        keys[key_id(write)] = write
+    scheme_file = KEYS_DIR / "scheme"
+    _KEYRING.update(checked=now, keys=keys, legacy=legacy, write=write,
+                    tagged=(KEYS_DIR / "legacy.key").exists(),
+                    scheme=scheme_file.read_text().strip() if scheme_file.exists() else "xor")
+    return _KEYRING
+
+
+def _encrypt_with(plaintext, key, scheme="xor", tagged=True):
+    data = plaintext.encode("utf-8")
+    if scheme == "fernet":
+        prefix, body = "FERN", Fernet(base64.urlsafe_b64encode(key[:32])).encrypt(data).decode("ascii")
+    else:
+        prefix, body = "ENC", base64.b64encode(xor_bytes(data, key)).decode("ascii")
+    return f"{prefix}@{key_id(key)}:{body}" if tagged else f"{prefix}:{body}"
+
+
+def _decrypt_with(token, keys, legacy):
+    m = _TOKEN_RE.match(token)
+    key = keys[m.group(2)] if m.group(2) else legacy
+    body = token[m.end():]
+    if m.group(1) == "FERN":
+        return Fernet(base64.urlsafe_b64encode(key[:32])).decrypt(body.encode("ascii")).decode("utf-8")
+    return xor_bytes(base64.b64decode(body), key).decode("utf-8")
+
+
+def is_token(value):
+    return isinstance(value, str) and _TOKEN_RE.match(value) is not None
+
+
+@instrumented('crypto.encrypt_field')
 def encrypt_field(plaintext):
     if plaintext is None:
         return None
-    key = load_key()
-    data = plaintext.encode("utf-8")
-    x = xor_bytes(data, key)
-    return "ENC:" + base64.b64encode(x).decode("ascii")
+    ring = _keyring()
+    scheme = ring["scheme"] if has_fernet else "xor"
+    return _encrypt_with(plaintext, ring["write"], scheme, ring["tagged"])
 
 
+@instrumented('crypto.decrypt_field')
 def decrypt_field(token):
+    """Plaintext of any ENC/FERN token (tagged or not); other values are returned unchanged."""
     if token is None:
         return None
-    if not isinstance(token, str):
-        return token
-    if not token.startswith("ENC:"):
+    if not is_token(token):
         return token
     try:
-        key = load_key()
-        b = base64.b64decode(token[4:])
-        p = xor_bytes(b, key)
-        return p.decode("utf-8")
+        ring = _keyring()
+        return _decrypt_with(token, ring["keys"], ring["legacy"])
     except Exception:
         return token
 
@@ -271,13 +618,16 @@ def get_field_str(obj, key):
     v = obj.get(key)
     if v is None:
         return ""
+    if isinstance(obj, LazyUser):
+        # already decrypted (and memoized) by the proxy
+        return str(v)
     if isinstance(v, str):
         # cache decrypted values on the object to avoid repeated decrypts during UI flows
         cache_key = f"_dec_{key}"
         if obj.get(cache_key) is not None:
             return obj.get(cache_key)
         try:
-            dv = migrate_decrypt_field(v) if v.startswith("FERN:") else decrypt_field(v)
+            dv = decrypt_field(v)
             obj[cache_key] = dv or ""
             return dv or ""
         except Exception:
@@ -286,39 +636,1013 @@ def get_field_str(obj, key):
 
 
 # Migration helpers: if Fernet available, support FERN: prefix
+@instrumented('crypto.migrate_encrypt_field')
 def migrate_encrypt_field(plaintext):
     if plaintext is None:
         return None
     if has_fernet:
         try:
-            k = load_key()
-            f = Fernet(base64.urlsafe_b64encode(k[:32]))
-            return "FERN:" + f.encrypt(plaintext.encode("utf-8")).decode("ascii")
+            ring = _keyring()
+            return _encrypt_with(plaintext, ring["write"], "fernet", ring["tagged"])
         except Exception:
             return encrypt_field(plaintext)
     return encrypt_field(plaintext)
 
 
+@instrumented('crypto.migrate_decrypt_field')
 def migrate_decrypt_field(token):
-    if token is None:
-        return None
-    if isinstance(token, str) and token.startswith("FERN:") and has_fernet:
-        try:
-            k = load_key()
-            f = Fernet(base64.urlsafe_b64encode(k[:32]))
-            return f.decrypt(token[5:].encode("ascii")).decode("utf-8")
-        except Exception:
-            return token
+    # decrypt_field understands FERN tokens too
     return decrypt_field(token)
 
 
-def load_db(role):
-    path = DB_FILES[role]
+# === Formato dos arquivos BD ===
+# "json"    - indented JSON (default, same as before)
+# "compact" - JSON without whitespace
+# "binary"  - MessagePack records (needs msgpack installed)
+# The format is detected on load, so files in different formats can coexist.
+# Saves use BD_FORMAT from the environment, else the format recorded in
+# BD/formato.txt by convert_db_format(), else "json". orjson is used for
+# both JSON formats when installed.
+DB_FORMATS = ("json", "compact", "binary")
+BINARY_MAGIC = b"BDMP\x01"
+try:
+    orjson = importlib.import_module("orjson")
+    has_orjson = True
+except Exception:
+    has_orjson = False
+try:
+    msgpack = importlib.import_module("msgpack")
+    has_msgpack = True
+except Exception:
+    has_msgpack = False
+
+
+def format_path():
+    return BD_DIR / "formato.txt"
+
+
+def db_format():
+    fmt = os.environ.get("BD_FORMAT")
+    if not fmt:
+        try:
+            fmt = format_path().read_text(encoding="utf-8").strip()
+        except OSError:
+            fmt = "json"
+    if fmt == "binary" and not has_msgpack:
+        # never write a different format than the one asked for without saying so
+        raise DataError("O formato binário precisa do pacote msgpack (pip install msgpack).")
+    return fmt if fmt in DB_FORMATS else "json"
+
+
+def encode_db(data, fmt=None):
+    fmt = fmt or db_format()
+    if fmt == "binary":
+        return BINARY_MAGIC + msgpack.packb(data, use_bin_type=True, default=_jsonable)
+    if has_orjson:
+        try:
+            return orjson.dumps(data, default=_jsonable, option=orjson.OPT_INDENT_2 if fmt == "json" else 0)
+        except TypeError:
+            pass  # e.g. non-string keys: let the stdlib handle it
+    if fmt == "compact":
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=_jsonable).encode("utf-8")
+    return json.dumps(data, indent=2, ensure_ascii=False, default=_jsonable).encode("utf-8")
+
+
+def decode_db(raw):
+    if raw.startswith(BINARY_MAGIC):
+        if not has_msgpack:
+            raise DataError("Arquivo BD em formato binário: instale o pacote msgpack.")
+        return msgpack.unpackb(raw[len(BINARY_MAGIC):], raw=False, strict_map_key=False)
+    if has_orjson:
+        return orjson.loads(raw)
+    return json.loads(raw.decode("utf-8"))
+
+
+# Submission texts longer than SUBMISSION_COMPRESS_MIN characters are stored
+# compressed as "ZLIB:<base64>" / "LZMA:<base64>" tokens (same idea as the
+# "ENC:" prefix). Records keep the token after load; only submission_text()
+# inflates it, when a submission is actually opened or exported.
+SUBMISSION_COMPRESS_MIN = 1024
+SUBMISSION_CODEC = os.environ.get("BD_TEXT_CODEC", "zlib")  # "zlib" or "lzma"
+
+
+def pack_text(text, codec=None):
+    if not isinstance(text, str) or len(text) < SUBMISSION_COMPRESS_MIN:
+        return text
+    codec = codec or SUBMISSION_CODEC
+    raw = text.encode("utf-8")
+    if codec == "lzma":
+        packed = "LZMA:" + base64.b64encode(lzma.compress(raw, preset=6)).decode("ascii")
+    else:
+        packed = "ZLIB:" + base64.b64encode(zlib.compress(raw, 6)).decode("ascii")
+    # incompressible text (already short or random) stays as-is
+    return packed if len(packed) < len(text) else text
+
+
+def unpack_text(value):
+    if not isinstance(value, str):
+        return value
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        if value.startswith("ZLIB:"):
+            return zlib.decompress(base64.b64decode(value[5:])).decode("utf-8")
+        if value.startswith("LZMA:"):
+            return lzma.decompress(base64.b64decode(value[5:])).decode("utf-8")
+    except Exception:
+        return value
+    return value
+
+
+def submission_text(sub):
+    """Plain text of a submission, inflating it if it was stored compressed."""
+    return unpack_text(sub.get("text")) or ""
+
+
+def _read_db(path):
+    if path.suffix == ".jsonl":
+        return _read_jsonl(path)
+    with open(path, "rb") as f:
+        return decode_db(f.read())
+
+
+STREAM_CHUNK = 1 << 16
+
+
+def iter_records(role):
+    """Yield the records of `role` one at a time, reading the file in chunks instead of whole."""
+    if partitioned(role):
+        for slug in shards(role):
+            yield from _iter_path(shard_path(role, slug))
+        return
+    yield from _iter_path(DB_FILES[role])
+
+
+def _iter_path(path):
+    if path.suffix == ".jsonl":
+        yield from _iter_jsonl(path)
+        return
+    with open(path, "rb") as f:
+        if f.read(len(BINARY_MAGIC)) == BINARY_MAGIC:
+            if not has_msgpack:
+                raise DataError("Arquivo BD em formato binário: instale o pacote msgpack.")
+            unpacker = msgpack.Unpacker(f, raw=False, strict_map_key=False, read_size=STREAM_CHUNK)
+            for _ in range(unpacker.read_array_header()):
+                yield unpacker.unpack()
+            return
+        f.seek(0)
+        yield from _iter_json_array(f)
+
+
+def _iter_json_array(f):
+    # records are objects, so raw_decode either returns a whole one or fails
+    # because the buffer ends inside it; then the next chunk is read
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buf, pos, eof = "", 0, False
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,[":
+            pos += 1
+        if pos < len(buf):
+            if buf[pos] == "]":
+                return
+            try:
+                obj, pos = decoder.raw_decode(buf, pos)
+                yield obj
+                continue
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+        elif eof:
+            return
+        chunk = f.read(STREAM_CHUNK)
+        eof = not chunk
+        buf = buf[pos:] + text.decode(chunk, final=eof)
+        pos = 0
+
+
+def _iter_jsonl(path):
+    # only the line the index points at is the current version of a record
+    for _ in range(5):
+        idx = _load_index(path)
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_ino != idx.get("ino"):
+                _JSONL_INDEX.pop(path, None)
+                continue
+            offsets = idx["offsets"]
+            pos = 0
+            for line in f:
+                if pos >= idx["size"]:
+                    break
+                if line.strip():
+                    rec = _jsonl_loads(line)
+                    if offsets.get(str(rec.get("id")), (None,))[0] == pos:
+                        yield rec
+                pos += len(line)
+        return
+    raise ConflictError(f"Não foi possível ler {path.name}: arquivo em reorganização.")
+
+
+# === Atividades em JSON Lines (BD_ACT.jsonl + BD_ACT.idx) ===
+# One activity per line. Updates append the new version of the record and
+# repoint the sidecar index ({id: [offset, length]}) at it, so reading or
+# updating one activity touches one line through mmap instead of parsing the
+# whole file. Superseded lines are dropped by compaction once they make up
+# most of the file. Lines are never modified once written, so an index that
+# describes a prefix of the file is still valid for readers; bytes past the
+# last newline belong to an append in progress and are ignored. The index
+# records the file's size and inode; a writer (holding the lock) rescans and
+# repairs it when they don't match, e.g. after a crash between the two writes.
+JSONL_COMPACT_RATIO = 0.5
+JSONL_COMPACT_MIN_BYTES = 1024 * 1024
+_JSONL_INDEX = {}
+
+
+def _jsonl_line(rec):
+    if has_orjson:
+        try:
+            return orjson.dumps(rec, default=_jsonable) + b"\n"
+        except TypeError:
+            pass
+    return json.dumps(rec, ensure_ascii=False, separators=(",", ":"), default=_jsonable).encode("utf-8") + b"\n"
+
+
+def _jsonl_loads(raw):
+    return orjson.loads(raw) if has_orjson else json.loads(raw.decode("utf-8"))
+
+
+def _index_path(path):
+    return path.with_suffix(".idx")
+
+
+def _read_jsonl(path):
+    """All records, latest version of each id, in order of first appearance."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    # drop a trailing partial line (another instance is appending)
+    raw = raw[:raw.rfind(b"\n") + 1]
+    records = {}
+    for line in raw.split(b"\n"):
+        if line.strip():
+            rec = _jsonl_loads(line)
+            records[rec.get("id")] = rec
+    return list(records.values())
+
+
+def _scan_jsonl(path, base=None):
+    """Index the complete lines of the file, continuing after `base` (a valid prefix index) if given."""
+    idx = copy.deepcopy(base) if base else {"size": 0, "live": 0, "offsets": {}}
+    offsets = idx["offsets"]
+    pos = idx["size"]
+    with open(path, "rb") as f:
+        f.seek(pos)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            if line.strip():
+                key = str(_jsonl_loads(line).get("id"))
+                if key in offsets:
+                    idx["live"] -= offsets[key][1]
+                offsets[key] = [pos, len(line) - 1]
+                idx["live"] += len(line) - 1
+            pos += len(line)
+    idx["size"] = pos
+    return idx
+
+
+def _load_index(path, locked=False):
+    """Index of the store. With locked=True (caller holds file_lock) it is exact and repaired on disk."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return {"size": 0, "live": 0, "offsets": {}}
+    stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+    hit = _JSONL_INDEX.get(path)
+    if hit and hit[0] == stamp and (not locked or hit[1]["size"] == st.st_size):
+        return hit[1]
+    try:
+        idx = json.loads(_index_path(path).read_bytes())
+        if idx.get("ino") not in (None, 0, st.st_ino) or idx["size"] > st.st_size:
+            idx = None  # index of a replaced file (compaction in progress)
+    except (OSError, ValueError, KeyError):
+        idx = None
+    on_disk = idx is not None and idx["size"] == st.st_size
+    if not on_disk:
+        # lines appended after the index was written (or no usable index): scan only those
+        idx = _scan_jsonl(path, idx)
+        idx["ino"] = st.st_ino
+    if locked and not on_disk:
+        if idx["size"] < st.st_size:
+            # partial line left by an interrupted append
+            with open(path, "r+b") as f:
+                f.truncate(idx["size"])
+            st = os.stat(path)
+            stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        _write_index(path, idx)
+    _JSONL_INDEX[path] = (stamp, idx)
+    return idx
+
+
+def _write_index(path, idx):
+    idx["ino"] = os.stat(path).st_ino
+    ipath = _index_path(path)
+    tmp = ipath.with_name(f"{ipath.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(json.dumps(idx, separators=(",", ":")).encode("utf-8"))
+    _replace(tmp, ipath)
+
+
+def _fetch_jsonl(path, key, locked=False):
+    """(record, index entry) for key, read through mmap; (None, None) if absent."""
+    for _ in range(5):
+        idx = _load_index(path, locked)
+        ent = idx["offsets"].get(str(key))
+        if ent is None:
+            return None, None
+        off, length = ent
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            if st.st_ino == idx.get("ino", st.st_ino) and st.st_size >= off + length:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return _jsonl_loads(mm[off:off + length]), ent
+        # the file was replaced (compacted) after the index was read: reload
+        _JSONL_INDEX.pop(path, None)
+    raise ConflictError(f"Não foi possível ler {path.name}: arquivo em reorganização.")
+
+
+def _write_jsonl(path, records):
+    """Rewrite the whole store compacted (temp file + rename), then its index."""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    offsets = {}
+    pos = 0
+    with open(tmp, "wb") as f:
+        for rec in records:
+            line = _jsonl_line(rec)
+            offsets[str(rec.get("id"))] = [pos, len(line) - 1]
+            f.write(line)
+            pos += len(line)
+    _replace(tmp, path)
+    _write_index(path, {"size": pos, "live": pos - len(offsets), "offsets": offsets})
+
+
+def _append_jsonl(path, idx, records):
+    """Append new versions of `records` and repoint the index (caller holds the lock)."""
+    offsets = dict(idx["offsets"])
+    live = idx.get("live", 0)
+    before = _file_stamp(path)
+    with open(path, "ab") as f:
+        pos = f.seek(0, os.SEEK_END)
+        for rec in records:
+            line = _jsonl_line(rec)
+            old = offsets.get(str(rec.get("id")))
+            if old:
+                live -= old[1]
+            offsets[str(rec.get("id"))] = [pos, len(line) - 1]
+            live += len(line) - 1
+            f.write(line)
+            pos += len(line)
+    _write_index(path, {"size": pos, "live": live, "offsets": offsets})
+    if pos > JSONL_COMPACT_MIN_BYTES and live < pos * JSONL_COMPACT_RATIO:
+        _write_jsonl(path, _read_jsonl(path))
+    if DB_CACHE['enabled']:
+        hit = _DB_CACHE.get(path)
+        if hit and hit[0] == before:
+            # patch the server's in-memory copy instead of re-parsing the file
+            data = list(hit[1])
+            where = {r.get("id"): i for i, r in enumerate(data)}
+            for rec in compact_records("Atividades", records):
+                if rec.get("id") in where:
+                    data[where[rec.get("id")]] = rec
+                else:
+                    data.append(rec)
+            _DB_CACHE[path] = (_file_stamp(path), data, {})
+
+
+def read_activity(activity_id):
+    """One activity by id: a single mmap'd line with the JSONL store, else a lookup in the full list."""
+    path = DB_FILES["Atividades"]
+    if partitioned("Atividades"):
+        slug = _directory()["Atividades"].get(str(activity_id))
+        return None if slug is None else _records_by_key("Atividades", shard_path("Atividades", slug)).get(activity_id)
+    if path.suffix == ".jsonl":
+        return _fetch_jsonl(path, activity_id)[0]
+    return record_index("Atividades").get(activity_id)
+
+
+def _update_jsonl(path, keys, mutate, retries):
+    for attempt in range(retries):
+        changed = []
+        for k in keys:
+            rec, ent = _fetch_jsonl(path, k)
+            if rec is None:
+                continue
+            new = copy.deepcopy(rec)
+            mutate(new)
+            new["_rev"] = rec.get("_rev", 0) + 1
+            changed.append((k, ent, new))
+        if not changed:
+            return []
+        with file_lock(path):
+            fresh = _load_index(path, locked=True)
+            # every write appends a new line, so an unchanged offset means an unchanged record
+            if all(fresh["offsets"].get(str(k)) == ent for k, ent, _ in changed):
+                _append_jsonl(path, fresh, [new for _, _, new in changed])
+                return [new for _, _, new in changed]
+        _backoff(attempt)
+    raise ConflictError(f"Não foi possível salvar {path.name}: muitas alterações simultâneas.")
+
+
+def convert_activity_store(kind):
+    """Move activities between BD_ACT.json ("json") and BD_ACT.jsonl + BD_ACT.idx ("jsonl").
+
+    Close other instances first: they keep using the store they started with.
+    """
+    src = DB_FILES["Atividades"]
+    dst = ACTIVITY_JSONL if kind == "jsonl" else ACTIVITY_JSON
+    if src == dst:
+        return dst
+    if PARTITIONS["enabled"]:
+        raise DataError("Atividades particionadas por turma: desfaça as partições antes (--particoes unico).")
+    with file_lock(src):
+        records = _read_db(src)
+        if kind == "jsonl":
+            _write_jsonl(dst, records)
+        else:
+            _write_db(dst, records)
+        os.replace(src, src.with_name(src.name + ".bak"))
+        if src.suffix == ".jsonl":
+            _index_path(src).unlink(missing_ok=True)
+    DB_FILES["Atividades"] = dst
+    return dst
+
+
+def convert_db_format(fmt):
+    """One-shot conversion of every BD file to `fmt`, recorded in BD/formato.txt for later saves."""
+    if fmt not in DB_FORMATS:
+        raise ValueError(f"Formato desconhecido: {fmt} (use {', '.join(DB_FORMATS)})")
+    if fmt == "binary" and not has_msgpack:
+        raise DataError("O formato binário precisa do pacote msgpack (pip install msgpack).")
+    sizes = {}
+    for path in storage_paths():
+        with file_lock(path):
+            try:
+                data = _read_db(path)
+            except FileNotFoundError:
+                continue
+            before = path.stat().st_size
+            _write_db(path, data, fmt)
+            sizes[path.name] = (before, path.stat().st_size)
+    format_path().write_text(fmt, encoding="utf-8")
+    return sizes
+
+
+def compress_existing_submissions(codec=None):
+    """Compress stored submission texts above the threshold. Returns (activities touched, texts packed)."""
+    packed = 0
+    def apply(a):
+        nonlocal packed
+        for sub in a.get("submissions", []):
+            text = sub.get("text")
+            new = pack_text(unpack_text(text), codec)
+            if new != text:
+                sub["text"] = new
+                packed += 1
+    ids = [a.get("id") for a in load_activities()
+           if any(isinstance(s.get("text"), str) and len(s.get("text")) >= SUBMISSION_COMPRESS_MIN for s in a.get("submissions", []))]
+    written = update_records("Atividades", ids, apply) if ids else []
+    return len(written), packed
+
+
+# === Rotação de chave (job em lote) ===
+# rotate_key() generates secret.key.next (which new writes start using at
+# once, see _keyring), re-encrypts the top-level token fields of every file in
+# DB_FILES in chunks of ROTATE_CHUNK records across a process pool, and writes
+# each chunk back through update_records so concurrent edits are not lost.
+# BD/rotation.json records how many records of each file are done; running
+# the job again resumes from there (also after a crash during the final
+# switch-over), and an existing secret.key.next is never replaced. A final sweep picks up fields written with
+# the old key meanwhile, then the new key replaces secret.key with one rename.
+ROTATION_FILE = BD_DIR / "rotation.json"
+ROTATE_CHUNK = 500
+
+
+def _reencrypt_tokens(job):
+    """Process pool worker: [(token, ...)] -> {token: new token}."""
+    tokens, keys, legacy, new_key, scheme = job
+    return {t: _encrypt_with(_decrypt_with(t, keys, legacy), new_key, scheme) for t in tokens}
+
+
+def _rotate_chunk(role, keys, index, pool, ring, new_key, scheme, prefix):
+    """Re-encrypt the records `keys`, reading their tokens from `index` (one parse per pass)."""
+    tokens = set()
+    for k in keys:
+        for v in (index.get(k) or {}).values():
+            if is_token(v) and not v.startswith(prefix):
+                tokens.add(v)
+    if not tokens:
+        return 0
+    tokens = sorted(tokens)
+    per_job = max(1, len(tokens) // (getattr(pool, "_max_workers", 1) * 4) + 1)
+    jobs = [(tokens[i:i + per_job], ring["keys"], ring["legacy"], new_key, scheme) for i in range(0, len(tokens), per_job)]
+    mapping = {}
+    for part in (pool.map(_reencrypt_tokens, jobs) if pool else map(_reencrypt_tokens, jobs)):
+        mapping.update(part)
+    def apply(rec):
+        for f, v in list(rec.items()):
+            if isinstance(v, str) and v in mapping:
+                rec[f] = mapping[v]
+    update_records(role, keys, apply)
+    return len(mapping)
+
+
+def rotate_key(scheme="xor", workers=None, progress=None):
+    """Re-encrypt every BD file under a new key (and scheme). Resumable; returns fields re-encrypted."""
+    if scheme == "fernet" and not has_fernet:
+        raise DataError("O esquema fernet precisa do pacote cryptography (pip install cryptography).")
+    with file_lock(ROTATION_FILE):
+        KEYS_DIR.mkdir(exist_ok=True)
+        legacy = KEYS_DIR / "legacy.key"
+        if not legacy.exists():
+            legacy.write_bytes(key_path().read_bytes())
+        nxt = next_key_path()
+        try:
+            state = _read_db(ROTATION_FILE)
+        except FileNotFoundError:
+            state = None
+        except Exception as e:
+            raise DataError(f"rotation.json ilegível ({e}); a rotação em andamento não pode ser retomada.") from e
+        if state is None:
+            # writes may already use an existing .next key (see _keyring): adopt it, never replace it
+            if not nxt.exists():
+                tmp = nxt.with_name(nxt.name + ".tmp")
+                tmp.write_bytes(base64.b64encode(secrets.token_bytes(32)))
+                _replace(tmp, nxt)
+            state = {"key": key_id(_read_key(nxt)), "scheme": scheme, "done": {}}
+            _write_store(ROTATION_FILE, state)
+        elif not nxt.exists():
+            # interrupted between the switch-over and the cleanup
+            if key_id(load_key()) != state["key"]:
+                raise DataError("secret.key.next não encontrado: a rotação em andamento não pode ser retomada.")
+            ROTATION_FILE.unlink()
+            _KEYRING["checked"] = None
+            return 0
+        # an interrupted run is resumed with the scheme it started with
+        scheme = state["scheme"]
+        new_key = _read_key(next_key_path())
+        prefix = f"{'FERN' if scheme == 'fernet' else 'ENC'}@{key_id(new_key)}:"
+        _KEYRING["checked"] = None
+        ring = _keyring()
+        total = 0
+        # spawned (not forked) workers, so they don't inherit the lock above
+        pool = (concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+                if workers != 1 else None)
+        try:
+            for role in DB_FILES:
+                index = record_index(role)
+                keys = list(index)
+                for start in range(state["done"].get(role, 0), len(keys), ROTATE_CHUNK):
+                    chunk = keys[start:start + ROTATE_CHUNK]
+                    total += _rotate_chunk(role, chunk, index, pool, ring, new_key, scheme, prefix)
+                    state["done"][role] = start + len(chunk)
+                    _write_store(ROTATION_FILE, state)
+                    if progress:
+                        progress(role, state["done"][role], len(keys))
+            # instances that haven't re-read the keyring yet may still write with the old key
+            time.sleep(KEYRING_TTL)
+            for role in DB_FILES:
+                index = record_index(role)
+                keys = list(index)
+                for start in range(0, len(keys), ROTATE_CHUNK):
+                    total += _rotate_chunk(role, keys[start:start + ROTATE_CHUNK], index, pool, ring, new_key, scheme, prefix)
+        finally:
+            if pool:
+                pool.shutdown()
+        # switch over: the old key stays in keys/ for tokens still in flight or in backups
+        old = load_key()
+        (KEYS_DIR / f"{key_id(old)}.key").write_bytes(base64.b64encode(old))
+        (KEYS_DIR / "scheme").write_text(scheme, encoding="utf-8")
+        _replace(next_key_path(), key_path())
+        ROTATION_FILE.unlink()
+        _KEYRING["checked"] = None
+    return total
+
+
+# === Backups incrementais (snapshots) ===
+# A backup folder holds objects/ (zlib-compressed chunks named by their
+# SHA-256) and snapshots/<UTC time>.json manifests listing, for every file
+# under BD/, its size, mtime and chunk hashes. Files are cut into chunks at
+# line boundaries chosen by the content (a line whose CRC ends in
+# BACKUP_CHUNK_BITS zero bits, within min/max sizes), so editing one record of
+# BD_A.json only produces the chunk(s) around it; single-line files (compact,
+# binary) fall back to BACKUP_CHUNK_MAX pieces. Files whose size and mtime
+# match the previous snapshot are not even read. Only chunks missing from
+# objects/ are written, so a snapshot costs roughly what changed.
+# Snapshots and pruning take the same lock on the backup folder, so a prune
+# never drops a chunk a running snapshot has just found and referenced.
+# The encryption keys (secret.key, secret.key.next, keys/) are not backed up
+# with the data they protect, and a restore leaves them alone: copy them
+# somewhere else yourself.
+BACKUP_DIR = Path(os.environ.get("BD_BACKUP_DIR") or (BASE_DIR / "BD_backups"))
+BACKUP_CHUNK_BITS = 6
+BACKUP_CHUNK_MIN = 16 * 1024
+BACKUP_CHUNK_MAX = 1024 * 1024
+BACKUP_LOCK_TIMEOUT = 600.0  # a prune may wait for a whole snapshot
+_BACKUP_SKIP = (".lock", ".tmp")
+_BACKUP_KEYS = ("secret.key", "secret.key.next", "keys")
+
+
+def _backup_files(root):
+    """Relative paths of the files under root worth backing up (never the keys)."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        top = Path(dirpath) == Path(root)
+        dirnames[:] = sorted(d for d in dirnames if Path(dirpath, d).resolve() != BACKUP_DIR.resolve()
+                             and not (top and d in _BACKUP_KEYS))
+        for name in sorted(filenames):
+            if not name.endswith(_BACKUP_SKIP) and not (top and name in _BACKUP_KEYS):
+                yield Path(dirpath, name).relative_to(root).as_posix()
+
+
+def _backup_lock(dest):
+    return file_lock(dest / "backup", timeout=BACKUP_LOCK_TIMEOUT)
+
+
+def _chunks(data):
+    mask = (1 << BACKUP_CHUNK_BITS) - 1
+    start = pos = 0
+    for line in data.splitlines(keepends=True):
+        pos += len(line)
+        size = pos - start
+        if size >= BACKUP_CHUNK_MAX or (size >= BACKUP_CHUNK_MIN and zlib.crc32(line) & mask == 0):
+            while pos - start > BACKUP_CHUNK_MAX:
+                yield data[start:start + BACKUP_CHUNK_MAX]
+                start += BACKUP_CHUNK_MAX
+            yield data[start:pos]
+            start = pos
+    while start < len(data):
+        yield data[start:start + BACKUP_CHUNK_MAX]
+        start += BACKUP_CHUNK_MAX
+
+
+def _object_path(dest, digest):
+    return dest / "objects" / digest[:2] / digest
+
+
+def list_snapshots(dest=None):
+    dest = Path(dest or BACKUP_DIR)
+    return sorted(p.stem for p in (dest / "snapshots").glob("*.json"))
+
+
+def _load_manifest(dest, name):
+    return json.loads((dest / "snapshots" / f"{name}.json").read_bytes())
+
+
+def create_snapshot(dest=None):
+    """Back up BD/ into dest. Returns (snapshot name, bytes of new chunks written)."""
+    dest = Path(dest or BACKUP_DIR)
+    (dest / "snapshots").mkdir(parents=True, exist_ok=True)
+    with _backup_lock(dest):
+        return _create_snapshot(dest)
+
+
+def _create_snapshot(dest):
+    previous = list_snapshots(dest)
+    prev_files = _load_manifest(dest, previous[-1])["files"] if previous else {}
+    files = {}
+    written = 0
+    for rel in _backup_files(BD_DIR):
+        path = BD_DIR / rel
+        try:
+            st = path.stat()
+            old = prev_files.get(rel)
+            if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+                files[rel] = old
+                continue
+            data = path.read_bytes()
+        except OSError:
+            continue  # removed while we were walking
+        hashes = []
+        for chunk in _chunks(data):
+            digest = hashlib.sha256(chunk).hexdigest()
+            obj = _object_path(dest, digest)
+            if not obj.exists():
+                obj.parent.mkdir(parents=True, exist_ok=True)
+                tmp = obj.with_name(obj.name + ".tmp")
+                tmp.write_bytes(zlib.compress(chunk, 6))
+                _replace(tmp, obj)
+                written += len(chunk)
+            hashes.append(digest)
+        files[rel] = {"size": len(data), "mtime_ns": st.st_mtime_ns, "chunks": hashes}
+    name = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    manifest = dest / "snapshots" / f"{name}.json"
+    tmp = manifest.with_name(manifest.name + ".tmp")
+    tmp.write_bytes(json.dumps({"created": name, "files": files}, separators=(",", ":")).encode("utf-8"))
+    _replace(tmp, manifest)
+    return name, written
+
+
+def restore_snapshot(name, target=None, dest=None):
+    """Recreate BD/ (or target) exactly as in snapshot `name`. Close the app first. Returns files restored."""
+    dest = Path(dest or BACKUP_DIR)
+    target = Path(target or BD_DIR)
+    with _backup_lock(dest):
+        return _restore_snapshot(dest, name, target)
+
+
+def _restore_snapshot(dest, name, target):
+    files = _load_manifest(dest, name)["files"]
+    for rel, info in files.items():
+        path = target / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            for digest in info["chunks"]:
+                f.write(zlib.decompress(_object_path(dest, digest).read_bytes()))
+        _replace(tmp, path)
+    if target.exists():
+        for rel in set(_backup_files(target)) - set(files):
+            (target / rel).unlink()
+    return len(files)
+
+
+def prune_snapshots(keep_last=24, keep_daily=30, dest=None):
+    """Keep the newest keep_last snapshots plus the last one of each of keep_daily days; drop unused chunks.
+
+    Returns (snapshots removed, chunks removed).
+    """
+    dest = Path(dest or BACKUP_DIR)
+    if not (dest / "snapshots").exists():
+        return 0, 0
+    with _backup_lock(dest):
+        return _prune_snapshots(dest, keep_last, keep_daily)
+
+
+def _prune_snapshots(dest, keep_last, keep_daily):
+    names = list_snapshots(dest)
+    keep = set(names[-keep_last:]) if keep_last else set()
+    by_day = {}
+    for n in names:
+        by_day[n[:8]] = n  # names sort by time, so the last one of the day wins
+    keep.update(sorted(by_day.values())[-keep_daily:] if keep_daily else [])
+    removed = [n for n in names if n not in keep]
+    for n in removed:
+        (dest / "snapshots" / f"{n}.json").unlink()
+    live = set()
+    for n in keep:
+        for info in _load_manifest(dest, n)["files"].values():
+            live.update(info["chunks"])
+    chunks = 0
+    for obj in (dest / "objects").glob("*/*"):
+        if obj.name not in live:
+            obj.unlink()
+            chunks += 1
+    return len(removed), chunks
+
+
+# Data operations marked with @data_op run locally, or are forwarded to the
+# local data server when the app was started with --conectar (see DataClient).
+DATA_OPS = {}
+DATA_CLIENT = None
+
+
+def data_op(fn):
+    sig = inspect.signature(fn)
+    DATA_OPS[fn.__name__] = fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if DATA_CLIENT is not None:
+            params = sig.bind(*args, **kwargs).arguments
+            return DATA_CLIENT.call(fn.__name__, **params)
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+# === Registros compactos ===
+# The data server keeps whole BD files parsed in memory (DB_CACHE), where a
+# dict per record (and per grade and submission) costs far more than its data.
+# There the records are kept as __slots__ objects instead, with categorical
+# values (turma/curso/... tokens, subjects, dates, usernames) interned so equal
+# strings share one object. They are mutable mappings, so the handlers keep
+# using rec.get(k) / rec[k] / setdefault() unchanged; unknown keys go to a
+# small per-record dict. _jsonable() turns them back into the JSON shape.
+_MISSING = object()
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Record(MutableMapping):
+    __slots__ = ("_extra",)
+    FIELDS = ()
+    INTERNED = frozenset()
+
+    def __init__(self, data=()):
+        self._extra = None
+        fields, interned = self._fieldset, self.INTERNED
+        for k, v in (data.items() if isinstance(data, MutableMapping) else data):
+            if k in fields:
+                setattr(self, k, _intern(v) if k in interned else v)
+            else:
+                self[k] = v
+
+    def __getitem__(self, key):
+        if key in self._fieldset:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in self._fieldset:
+            return getattr(self, key, default)
+        return default if self._extra is None else self._extra.get(key, default)
+
+    def __setitem__(self, key, value):
+        if key in self._fieldset:
+            setattr(self, key, _intern(value) if key in self.INTERNED else value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._fieldset:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for k in self.FIELDS:
+            if hasattr(self, k):
+                yield k
+        if self._extra:
+            yield from self._extra
+
+    def items(self):
+        # a list rather than a view: one pass over the slots, no __getitem__ per key
+        pairs = []
+        for k in self.FIELDS:
+            v = getattr(self, k, _MISSING)
+            if v is not _MISSING:
+                pairs.append((k, v))
+        if self._extra:
+            pairs.extend(self._extra.items())
+        return pairs
+
+    def __len__(self):
+        return sum(hasattr(self, k) for k in self.FIELDS) + len(self._extra or ())
+
+    def setdefault(self, key, default=None):
+        # dict semantics: hand back the stored object, which may be interned
+        try:
+            return self[key]
+        except KeyError:
+            self[key] = default
+            return self[key]
+
+    def copy(self):
+        return dict(self.items())
+
+    def __deepcopy__(self, memo):
+        return type(self)(copy.deepcopy(dict(self.items()), memo))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.items())!r})"
+
+
+def _record_type(name, fields, interned=()):
+    return type(name, (Record,), {"__slots__": fields, "FIELDS": fields, "_fieldset": frozenset(fields),
+                                  "INTERNED": frozenset(interned)})
+
+
+Nota = _record_type("Nota", ("sem1", "sem2"))
+Aluno = _record_type("Aluno", ("username", "password", "name", "age", "email", "cpf", "curso", "turma",
+                               "semestre", "periodo", "grades", "_rev"),
+                     ("curso", "turma", "semestre", "periodo"))
+Submissao = _record_type("Submissao", ("student", "text", "date", "grade", "graded_by"),
+                         ("student", "date", "graded_by"))
+Atividade = _record_type("Atividade", ("id", "title", "description", "deadline", "comments", "submissions",
+                                       "attachments", "target", "_rev"), ("deadline",))
+
+
+def _compact_aluno(rec):
+    st = Aluno(rec)
+    grades = st.get("grades")
+    if isinstance(grades, dict):
+        st["grades"] = {sys.intern(subj): Nota(sems) if isinstance(sems, dict) else sems
+                        for subj, sems in grades.items()}
+    return st
+
+
+def _compact_atividade(rec):
+    act = Atividade(rec)
+    subs = act.get("submissions")
+    if isinstance(subs, list):
+        act["submissions"] = [s if isinstance(s, Record) else Submissao(s) for s in subs]
+    for key in ("comments",):
+        items = act.get(key)
+        if isinstance(items, list):
+            act[key] = [{k: _intern(v) if k in ("author", "date") else v for k, v in c.items()}
+                        if isinstance(c, dict) else c for c in items]
+    target = act.get("target")
+    if isinstance(target, dict):
+        act["target"] = {k: _intern(v) for k, v in target.items()}
+    return act
+
+
+RECORD_TYPES = {"Aluno": _compact_aluno, "Atividades": _compact_atividade}
+
+
+def compact_records(role, data):
+    """Slotted copies of the plain records of `role`; other roles (and non-lists) are returned unchanged."""
+    make = RECORD_TYPES.get(role)
+    if make is None or not isinstance(data, list):
+        return data
+    return [make(r) if isinstance(r, dict) else r for r in data]
+
+
+def _role_of(path):
+    if path.parent.parent == PARTITION_DIR:
+        return "Atividades" if path.name == ACTIVITY_JSON.name else "Aluno"
+    return next((role for role, p in DB_FILES.items() if p == path), None)
+
+
+def _jsonable(obj):
+    """`default=` hook for the JSON/msgpack encoders."""
+    if isinstance(obj, Record):
+        return dict(obj.items())
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+# In-memory copy of the parsed files, keyed by (mtime, size). Only the data
+# server enables it: its handlers never mutate what load_db returns.
+DB_CACHE = {'enabled': False}
+_DB_CACHE = {}
+
+
+def _file_stamp(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+@instrumented('storage.load_db')
+@data_op
+def load_db(role, turma=None):
+    """Records of `role`; with `turma`, only that turma's ("" = no turma).
+
+    Partitioned roles read just the turma's shard then, and every shard without it.
+    """
+    if partitioned(role):
+        if turma is not None:
+            return _load_path(role, shard_path(role, turma_shard(turma)))
+        return [r for slug in shards(role) for r in _load_path(role, shard_path(role, slug))]
+    data = _load_path(role, DB_FILES[role])
+    if turma is None:
+        return data
+    return [r for r in data if _turma_of(role, r) == turma]
+
+
+def _load_path(role, path):
+    if DB_CACHE['enabled']:
+        try:
+            stamp = _file_stamp(path)
+        except OSError:
+            return []
+        hit = _DB_CACHE.get(path)
+        if hit and hit[0] == stamp:
+            return hit[1]
+    try:
+        data = _read_db(path)
     except Exception:
         return []
+    if DB_CACHE['enabled']:
+        data = compact_records(role, data)
+        _DB_CACHE[path] = (stamp, data, {})
+    return data
+
+
+def record_index(role):
+    """{key: record} for role (memoized alongside the cached file when DB_CACHE is on)."""
+    if partitioned(role):
+        return {r.get(RECORD_KEYS[role]): r for r in load_db(role)}
+    return _records_by_key(role, DB_FILES[role])
+
+
+def _records_by_key(role, path):
+    data = _load_path(role, path)
+    key_field = RECORD_KEYS[role]
+    hit = _DB_CACHE.get(path)
+    if hit is not None and hit[1] is data:
+        if not hit[2]:
+            hit[2].update((r.get(key_field), r) for r in data)
+        return hit[2]
+    return {r.get(key_field): r for r in data}
 
 
 def load_activities():
@@ -327,6 +1651,9 @@ def load_activities():
 
 def save_activities(data):
     save_db("Atividades", data)
+    # a wholesale rewrite can change anything: rebuild the derived files on next read
+    HOME_SUMMARY_FILE.unlink(missing_ok=True)  # the new gen also invalidates BD/resumo/
+    SEARCH_FILE.unlink(missing_ok=True)
 
 
 import datetime
@@ -368,10 +1695,2224 @@ def format_date(d):
     return d.isoformat()
 
 
+@instrumented('storage.save_db')
+@data_op
 def save_db(role, data):
+    if partitioned(role):
+        with file_lock(PARTITION_DIRECTORY):
+            _save_partitioned(role, data)
+    else:
+        path = DB_FILES[role]
+        with file_lock(path):
+            _write_db(path, data)
+    if role == "Aluno":
+        # a wholesale save is how a student changes turma
+        _sync_gradebook_turmas(data)
+
+
+def _replace(tmp, path):
+    for attempt in range(10):
+        try:
+            os.replace(tmp, path)
+            return
+        except PermissionError:
+            # Windows refuses to replace a file another process has open; retry briefly
+            time.sleep(0.02 * (attempt + 1))
+    os.replace(tmp, path)
+
+
+def _write_db(path, data, fmt=None):
+    """Write via temp file + rename so readers never see a half-written file."""
+    # never persist the plaintext that get_field_str memoizes as '_dec_<field>'
+    rows = [{k: v for k, v in r.items() if not k.startswith("_dec_")} if isinstance(r, MutableMapping) else r for r in data]
+    if path.suffix == ".jsonl":
+        _write_jsonl(path, rows)
+    else:
+        _write_store(path, rows, fmt)
+    if DB_CACHE['enabled']:
+        # records that are already compact are kept as they are (memo included)
+        _DB_CACHE[path] = (_file_stamp(path), compact_records(_role_of(path), data), {})
+
+
+def _write_store(path, obj, fmt=None):
+    """Atomically write any JSON-shaped object in the configured BD format."""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(encode_db(obj, fmt))
+    _replace(tmp, path)
+
+
+# === Concorrência (várias instâncias na mesma pasta BD) ===
+# Each record carries a '_rev' counter. Writers compute their change without
+# holding anything, then take a short advisory lock on the file, check that
+# the revisions they started from are still current (compare-and-swap) and
+# write; on conflict they back off and retry on fresh data. The lock is per
+# file because a JSON file can only be rewritten whole.
+RECORD_KEYS = {
+    "Aluno": "username",
+    "Professor": "username",
+    "Administrativo": "username",
+    "Atividades": "id",
+}
+LOCK_TIMEOUT = 10.0
+CAS_RETRIES = 8
+
+
+class DataError(Exception):
+    """Base for errors the UI reports when data can't be read or saved."""
+
+
+class ConflictError(DataError):
+    """A write could not be applied after CAS_RETRIES attempts (or the lock timed out)."""
+
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextlib.contextmanager
+def file_lock(path, timeout=LOCK_TIMEOUT):
+    """Exclusive advisory lock on a sidecar '<file>.lock' (not reentrant)."""
+    lock_path = Path(f"{path}.lock")
+    fh = open(lock_path, "a+")
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    fh.seek(0)
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise ConflictError(f"Tempo esgotado aguardando {lock_path.name}")
+                time.sleep(random.uniform(0.002, 0.01))
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+    finally:
+        fh.close()
+
+
+def _backoff(attempt):
+    time.sleep(random.uniform(0, 0.005 * (2 ** attempt)))
+
+
+def update_records(role, keys, mutate, retries=CAS_RETRIES):
+    """Apply mutate(record) to the records of `role` identified by `keys`.
+
+    Records missing from the file are skipped. Returns the records as written.
+    Raises ConflictError if other writers keep winning for `retries` attempts.
+    """
+    if partitioned(role):
+        # one CAS per shard touched: a turma's records never rewrite the others
+        where = _directory()[role]
+        groups = {}
+        for k in keys:
+            if str(k) in where:
+                groups.setdefault(where[str(k)], set()).add(k)
+        return [rec for slug, ks in groups.items()
+                for rec in _update_path(role, shard_path(role, slug), ks, mutate, retries)]
+    path = DB_FILES[role]
+    if path.suffix == ".jsonl":
+        return _update_jsonl(path, set(keys), mutate, retries)
+    return _update_path(role, path, set(keys), mutate, retries)
+
+
+def _update_path(role, path, keys, mutate, retries):
+    key_field = RECORD_KEYS[role]
+    for attempt in range(retries):
+        current = _load_path(role, path)
+        changed = {}
+        for rec in current:
+            k = rec.get(key_field)
+            if k in keys:
+                new = copy.deepcopy(rec)
+                mutate(new)
+                new["_rev"] = rec.get("_rev", 0) + 1
+                changed[k] = (rec.get("_rev", 0), new)
+        if not changed:
+            return []
+        with file_lock(path):
+            fresh = list(_load_path(role, path))
+            ok = True
+            for i, rec in enumerate(fresh):
+                k = rec.get(key_field)
+                if k in changed:
+                    if rec.get("_rev", 0) != changed[k][0]:
+                        ok = False
+                        break
+                    fresh[i] = changed[k][1]
+            if ok:
+                _write_db(path, fresh)
+                return [new for _, new in changed.values()]
+        _backoff(attempt)
+    raise ConflictError(f"Não foi possível salvar {path.name}: muitas alterações simultâneas.")
+
+
+def append_record(role, make_record):
+    """Append make_record(current_records) under the lock; it may return None to abort.
+
+    Used where the new record depends on the others (next activity id, unique username).
+    """
+    if partitioned(role):
+        return _append_partitioned(role, make_record)
     path = DB_FILES[role]
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    with file_lock(path):
+        current = list(load_db(role))
+        rec = make_record(current)
+        if rec is None:
+            return None
+        rec.setdefault("_rev", 1)
+        if path.suffix == ".jsonl":
+            _append_jsonl(path, _load_index(path, locked=True), [rec])
+            return rec
+        current.append(rec)
+        _write_db(path, current)
+        return rec
+
+
+# === Partições por turma (BD/turmas) ===
+# With the partitioned layout, students and activities live in
+# BD/turmas/<turma>/BD_A.json and BD_ACT.json (activities by target['turma']);
+# students without a turma and activities not aimed at one go to the _geral
+# shard. diretorio.json maps every username / activity id to its shard, so a
+# lookup, an update or a new id never has to read the other shards, and each
+# shard has its own lock and CAS. Records stay in the shard they were created
+# in. Not combined with the JSONL activity store.
+GLOBAL_SHARD = "_geral"
+_DIRECTORY = {}
+
+
+def partitioned(role):
+    return PARTITIONS["enabled"] and role in PARTITIONED_ROLES
+
+
+def turma_shard(turma):
+    return turma_slug(turma) if turma else GLOBAL_SHARD
+
+
+def shard_path(role, slug):
+    return PARTITION_DIR / slug / (ACTIVITY_JSON.name if role == "Atividades" else DB_FILES[role].name)
+
+
+def _turma_of(role, rec):
+    if role == "Atividades":
+        return (rec.get("target") or {}).get("turma") or ""
+    return get_field_str(rec, "turma")
+
+
+def _directory():
+    stamp = _file_stamp(PARTITION_DIRECTORY)
+    if _DIRECTORY.get("stamp") != stamp:
+        _DIRECTORY.update(stamp=stamp, data=_read_db(PARTITION_DIRECTORY))
+    return _DIRECTORY["data"]
+
+
+def shards(role):
+    return sorted(set(_directory()[role].values()))
+
+
+def role_stamp(role):
+    """Changes whenever any file holding `role` changes (for change detection and caches)."""
+    if partitioned(role):
+        return (_file_stamp(PARTITION_DIRECTORY),) + tuple(_file_stamp(shard_path(role, slug)) for slug in shards(role))
+    return _file_stamp(DB_FILES[role])
+
+
+def turma_activities_stamp(turma):
+    """role_stamp for only the files turma_activities(turma) reads."""
+    if not partitioned("Atividades"):
+        return role_stamp("Atividades")
+    stamps = [_file_stamp(PARTITION_DIRECTORY)]
+    for slug in sorted({turma_shard(turma), GLOBAL_SHARD}):
+        path = shard_path("Atividades", slug)
+        stamps.append(_file_stamp(path) if path.exists() else None)
+    return tuple(stamps)
+
+
+def storage_paths():
+    paths = [p for role, p in DB_FILES.items() if not partitioned(role)]
+    if PARTITIONS["enabled"]:
+        paths.append(PARTITION_DIRECTORY)
+        paths += [shard_path(role, slug) for role in PARTITIONED_ROLES for slug in shards(role)]
+    return paths
+
+
+def _save_partitioned(role, data):
+    """Rewrite every shard of `role` from `data` (caller holds the directory lock)."""
+    key_field = RECORD_KEYS[role]
+    directory = _read_db(PARTITION_DIRECTORY)
+    groups = {slug: [] for slug in set(directory[role].values())}
+    for rec in data:
+        groups.setdefault(turma_shard(_turma_of(role, rec)), []).append(rec)
+    for slug, recs in groups.items():
+        path = shard_path(role, slug)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(path):
+            _write_db(path, recs)
+    directory[role] = {str(r.get(key_field)): slug for slug, recs in groups.items() for r in recs}
+    _write_store(PARTITION_DIRECTORY, directory)
+
+
+def _append_partitioned(role, make_record):
+    key_field = RECORD_KEYS[role]
+    with file_lock(PARTITION_DIRECTORY):
+        directory = _read_db(PARTITION_DIRECTORY)
+        # the directory has every key, which is all the callers look at (next id, username taken)
+        keys = directory[role]
+        rec = make_record([{key_field: int(k) if role == "Atividades" else k} for k in keys])
+        if rec is None:
+            return None
+        rec.setdefault("_rev", 1)
+        slug = turma_shard(_turma_of(role, rec))
+        path = shard_path(role, slug)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(path):
+            current = list(_load_path(role, path))
+            current.append(rec)
+            _write_db(path, current)
+        keys[str(rec.get(key_field))] = slug
+        _write_store(PARTITION_DIRECTORY, directory)
+    return rec
+
+
+def convert_partitions(kind):
+    """Split BD_A.json and BD_ACT.json into per-turma shards ("turma") or merge them back ("unico").
+
+    Close other instances first: they keep using the layout they started with.
+    """
+    if (kind == "turma") == PARTITIONS["enabled"]:
+        return
+    if kind == "turma":
+        if DB_FILES["Atividades"].suffix == ".jsonl":
+            raise DataError("Converta as atividades para JSON antes (--armazenamento-atividades json).")
+        PARTITION_DIR.mkdir(exist_ok=True)
+        with file_lock(PARTITION_DIRECTORY):
+            data = {role: load_db(role) for role in PARTITIONED_ROLES}
+            _write_store(PARTITION_DIRECTORY, {role: {} for role in PARTITIONED_ROLES})
+            PARTITIONS["enabled"] = True
+            for role in PARTITIONED_ROLES:
+                _save_partitioned(role, data[role])
+                DB_FILES[role].replace(DB_FILES[role].with_name(DB_FILES[role].name + ".bak"))
+        return
+    with file_lock(PARTITION_DIRECTORY):
+        data = {role: load_db(role) for role in PARTITIONED_ROLES}
+        for role in PARTITIONED_ROLES:
+            with file_lock(DB_FILES[role]):
+                _write_db(DB_FILES[role], data[role])
+        PARTITIONS["enabled"] = False
+    # the shards stay around as a backup, out of the way of a later split
+    PARTITION_DIR.replace(PARTITION_DIR.with_name(f"turmas.{time.time_ns()}.bak"))
+
+
+# === Consultas de dados (sem interface) ===
+# Kept outside start_app() so the same logic can be reused by the views and
+# exercised headless (see benchmark.py).
+USER_FIELDS = ("name", "email", "cpf", "curso", "turma", "semestre", "periodo", "age")
+
+
+def find_user(users, username, password):
+    """Return the stored record matching username/password, or None."""
+    for u in users:
+        if u.get("username") != username:
+            continue
+        stored = u.get("password")
+        stored_plain = decrypt_field(stored) if isinstance(stored, str) else stored
+        if stored_plain == password:
+            return u
+    return None
+
+
+class LazyUser(dict):
+    """User record for the UI that decrypts USER_FIELDS on first access and memoizes them.
+
+    Behaves like the decrypted copy login used to build eagerly, so views keep
+    using user.get('name') / user['turma'] / get_field_str(user, ...).
+    """
+
+    def __init__(self, record, role):
+        super().__init__(record)
+        self._encrypted = {k for k in USER_FIELDS if record.get(k) is not None}
+        dict.__setitem__(self, "_role", role)
+
+    def _reveal(self, key):
+        if key in self._encrypted:
+            self._encrypted.discard(key)
+            dict.__setitem__(self, key, migrate_decrypt_field(dict.__getitem__(self, key)))
+
+    def _reveal_all(self):
+        for k in list(self._encrypted):
+            self._reveal(k)
+
+    def __getitem__(self, key):
+        self._reveal(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        self._reveal(key)
+        return dict.get(self, key, default)
+
+    def __setitem__(self, key, value):
+        self._encrypted.discard(key)
+        dict.__setitem__(self, key, value)
+
+    def items(self):
+        self._reveal_all()
+        return dict.items(self)
+
+    def values(self):
+        self._reveal_all()
+        return dict.values(self)
+
+    def copy(self):
+        self._reveal_all()
+        return dict(self)
+
+
+def filter_by_turma(students, turma):
+    """Students whose (decrypted) turma equals `turma`."""
+    return [s for s in students if get_field_str(s, 'turma') == turma]
+
+
+def submission_rates(students, acts, turma):
+    """Percent of the turma's activities each student submitted. Returns (relevant_students, percents)."""
+    relevant = filter_by_turma(students, turma)
+    # relevant activities are those targeted at this turma
+    rel_acts = [a for a in acts if (a.get('target') or {}).get('turma') == turma]
+    total = len(rel_acts)
+    # one pass over the submissions instead of one per student
+    submitters = [{sb.get('student') for sb in a.get('submissions', [])} for a in rel_acts]
+    perc = []
+    for s in relevant:
+        uname = s.get('username')
+        submitted = sum(uname in who for who in submitters)
+        perc.append((submitted / total * 100) if total > 0 else 0)
+    return relevant, perc
+
+
+# === Operações de dados usadas pelas telas ===
+# Every read and write the views need, as named operations so they can run
+# in-process or on the data server (@data_op).
+@data_op
+def login_lookup(role, username, password):
+    if partitioned(role):
+        slug = _directory()[role].get(username)
+        return None if slug is None else find_user(_load_path(role, shard_path(role, slug)), username, password)
+    return find_user(load_db(role), username, password)
+
+
+@data_op
+def home_summary(username, turma):
+    return materialized_home_summary(username, turma)
+
+
+@data_op
+def turma_roster(turma):
+    return load_db("Aluno", turma)
+
+
+@data_op
+def turma_activities(turma):
+    """Activities aimed at `turma` plus the ones not aimed at any turma."""
+    untargeted = load_db("Atividades", "")
+    return load_db("Atividades", turma) + untargeted if turma else untargeted
+
+
+def activity_visible(user, act):
+    """The turma_activities rule for one activity: students see their turma's and the untargeted ones."""
+    turma = (act.get("target") or {}).get("turma")
+    return user.get('_role') != 'Aluno' or not turma or turma == get_field_str(user, 'turma')
+
+
+@data_op
+def turma_submission_rates(turma):
+    return submission_rates(load_db("Aluno", turma), load_db("Atividades", turma), turma)
+
+
+@data_op
+def get_activity(activity_id):
+    return read_activity(activity_id)
+
+
+@data_op
+def create_user(role, user_obj):
+    """Append user_obj unless the username is taken (returns None then)."""
+    username = user_obj.get("username")
+    created = append_record(role, lambda users: None if any(x.get("username") == username for x in users) else user_obj)
+    if created is not None and role == "Aluno":
+        _student_rows([username])  # gets a gradebook row now, not on the first grade
+    return created
+
+
+@data_op
+def add_comment(activity_id, author, text):
+    comment = {"author": author, "text": text, "date": datetime.date.today().isoformat()}
+    pos = {}
+    def apply(a):
+        pos["i"] = len(a.setdefault("comments", []))
+        a["comments"].append(comment)
+    written = update_records("Atividades", [activity_id], apply)
+    if written:
+        def bump(summ):
+            _summary_bucket(summ, written[0])["comments"] += 1
+            _feed_push(summ, written[0], [comment])
+        _bump_home_summary(bump)
+        _index_documents([_search_entry(f"c:{activity_id}:{pos['i']}", activity_id, "comment", text, author)])
+    return written
+
+
+@data_op
+def create_activity(fields, attachment=None):
+    """Append a new activity with the next free id; `attachment` is copied into ATTACH_DIR."""
+    def make_activity(acts):
+        # next id is taken under the file lock so concurrent creators don't collide
+        aid = max([a.get("id", 0) for a in acts], default=0) + 1
+        attachments = []
+        if attachment:
+            try:
+                src_str = str(attachment)
+                dstname = f"act_{aid}_" + os.path.basename(src_str)
+                dst = ATTACH_DIR / dstname
+                import shutil
+                shutil.copyfile(src_str, str(dst))
+                attachments.append(dstname)
+            except Exception:
+                pass
+        rec = {"id": aid, "comments": [], "submissions": [], "attachments": attachments}
+        rec.update(fields)
+        return rec
+    rec = append_record("Atividades", make_activity)
+    if rec is not None:
+        _bump_home_summary(lambda summ: _summary_add_activity(summ, rec))
+        _index_documents(_activity_entries(rec))
+    return rec
+
+
+@data_op
+def add_submission(activity_id, submission):
+    text = submission.get("text")
+    submission = dict(submission, text=pack_text(text))
+    student = submission.get("student")
+    first = {}
+    def apply(a):
+        subs = a.setdefault("submissions", [])
+        first["value"] = not any(s.get("student") == student for s in subs)
+        first["pos"] = len(subs)
+        subs.append(submission)
+    written = update_records("Atividades", [activity_id], apply)
+    if written and first["value"]:
+        t = _turma_of("Atividades", written[0])
+        def bump(st):
+            st["submitted"][t] = st["submitted"].get(t, 0) + 1
+        _bump_student_summary(student, bump)
+    if written:
+        _index_documents([_search_entry(f"s:{activity_id}:{first['pos']}", activity_id, "submission", text, student)])
+        _index_similarity(activity_id, first["pos"], student, text)
+    return written
+
+
+@data_op
+def grade_submission(activity_id, student, date, grade, graded_by):
+    def apply(a):
+        for s in a.setdefault("submissions", []):
+            if s.get("student") == student and s.get("date") == date:
+                s["grade"] = grade
+                s["graded_by"] = graded_by
+    return update_records("Atividades", [activity_id], apply)
+
+
+@data_op
+def set_student_grade(username, subj, sem_key, grade):
+    return _write_grades(subj, sem_key, {username: grade})
+
+
+@data_op
+def save_turma_grades(subj, sem, values):
+    """values: {username: text typed by the professor}; blanks are skipped. Returns the usernames changed."""
+    grades, bad = {}, []
+    for uname, text in values.items():
+        if text == '':
+            continue
+        try:
+            grades[uname] = float(text)
+        except (TypeError, ValueError):
+            bad.append(uname)
+            continue
+        if not valid_grade(grades[uname]):
+            bad.append(uname)
+    if bad:
+        raise DataError("Nota inválida (use 0 a 10) para: " + ", ".join(bad))
+    return _write_grades(subj, 'sem1' if sem == '1' else 'sem2', grades)
+
+
+# === Resumo da tela inicial (materializado) ===
+# BD/BD_RESUMO.json holds what student_home shows, kept current by the write
+# paths (create_activity, add_submission, add_comment) instead of being
+# recomputed from every activity on each render. It is kept per turma ("" for
+# the activities not aimed at any turma), the same split students see in their
+# list: activity and comment totals, the first HOME_UPCOMING deadlines and a
+# comment feed ("recent", a bounded deque of the last COMMENT_FEED_SIZE
+# comments), so the home never walks the comment lists themselves. A student's
+# home adds up their turma's bucket and the "" bucket. What is per student
+# (activities submitted and comments seen, per bucket) lives in a small file
+# per student in BD/resumo/, so a render reads two small files however many
+# activities and students exist. If BD_RESUMO.json is missing it is rebuilt
+# from a full scan of the activities under its lock, with a new "gen"; student
+# files of an older gen are rebuilt from a scan on first use (seen counts restart).
+HOME_SUMMARY_FILE = BD_DIR / "BD_RESUMO.json"
+HOME_STUDENT_DIR = BD_DIR / "resumo"
+HOME_UPCOMING = 5
+COMMENT_FEED_SIZE = 20
+HOME_FEED_SHOWN = 3
+COMMENTS_PAGE = 20
+
+
+def _deadline_order(item):
+    return parse_date(item.get("deadline")) or datetime.date.max
+
+
+def _summary_bucket(summ, act):
+    """The per-turma part of the summary that `act` counts in."""
+    return summ["turmas"].setdefault(_turma_of("Atividades", act),
+                                     {"activities": 0, "comments": 0, "upcoming": [], "recent": []})
+
+
+def _feed_push(summ, act, comments):
+    bucket = _summary_bucket(summ, act)
+    feed = deque(bucket["recent"], maxlen=COMMENT_FEED_SIZE)
+    for c in comments:
+        # seq orders the feeds of different buckets when a home merges them
+        summ["seq"] += 1
+        feed.append({"activity": act.get("id"), "title": act.get("title"), "author": c.get("author"),
+                     "text": c.get("text"), "date": c.get("date"), "seq": summ["seq"]})
+    bucket["recent"] = list(feed)
+
+
+def _summary_add_activity(summ, act):
+    bucket = _summary_bucket(summ, act)
+    bucket["activities"] += 1
+    bucket["comments"] += len(act.get("comments", []))
+    _feed_push(summ, act, act.get("comments", []))
+    d = parse_date(act.get("deadline"))
+    if d is None:
+        return
+    upcoming = bucket["upcoming"] + [{"id": act.get("id"), "title": act.get("title"), "deadline": act.get("deadline")}]
+    upcoming.sort(key=_deadline_order)
+    bucket["upcoming"] = upcoming[:HOME_UPCOMING]
+
+
+def rebuild_home_summary():
+    """Rebuild BD_RESUMO.json from the activities; the caller holds its file_lock."""
+    summ = {"gen": secrets.token_hex(4), "seq": 0, "turmas": {}}
+    for a in iter_records("Atividades"):
+        _summary_add_activity(summ, a)
+    _write_store(HOME_SUMMARY_FILE, summ)
+    return summ
+
+
+def _read_home_summary():
+    try:
+        return _read_db(HOME_SUMMARY_FILE)
+    except Exception:
+        return None  # derived data: rebuilt by the caller
+
+
+def _load_home_summary():
+    summ = _read_home_summary()
+    if summ is None:
+        with file_lock(HOME_SUMMARY_FILE):
+            summ = _read_home_summary() or rebuild_home_summary()
+    return summ
+
+
+def _bump_home_summary(change):
+    """Apply change(summary) after a successful write to Atividades."""
+    with file_lock(HOME_SUMMARY_FILE):
+        summ = _read_home_summary()
+        if summ is None:
+            # the rebuild already sees the write that triggered this
+            rebuild_home_summary()
+            return
+        change(summ)
+        _write_store(HOME_SUMMARY_FILE, summ)
+
+
+def _student_summary_path(username):
+    return HOME_STUDENT_DIR / f"{turma_slug(username)}.json"  # same safe-name scheme as the ledgers
+
+
+def _read_student_summary(username, gen):
+    try:
+        st = _read_db(_student_summary_path(username))
+    except Exception:
+        return None
+    return st if st.get("gen") == gen else None
+
+
+def _rebuild_student_summary(username, gen):
+    """Count `username`'s submitted activities per turma with one scan; the caller holds the file's lock."""
+    submitted = {}
+    for a in iter_records("Atividades"):
+        if any(s.get("student") == username for s in a.get("submissions", [])):
+            t = _turma_of("Atividades", a)
+            submitted[t] = submitted.get(t, 0) + 1
+    st = {"gen": gen, "submitted": submitted, "seen": {}, "seen_total": {}}
+    HOME_STUDENT_DIR.mkdir(exist_ok=True)
+    _write_store(_student_summary_path(username), st)
+    return st
+
+
+def _load_student_summary(username, gen):
+    st = _read_student_summary(username, gen)
+    if st is None:
+        HOME_STUDENT_DIR.mkdir(exist_ok=True)
+        with file_lock(_student_summary_path(username)):
+            st = _read_student_summary(username, gen) or _rebuild_student_summary(username, gen)
+    return st
+
+
+def _bump_student_summary(username, change):
+    """Apply change(student summary) unless it returns False (nothing to write)."""
+    path = _student_summary_path(username)
+    HOME_STUDENT_DIR.mkdir(exist_ok=True)
+    with file_lock(path):
+        gen = _load_home_summary()["gen"]
+        st = _read_student_summary(username, gen)
+        if st is None:
+            # the rebuild already sees the write that triggered this
+            _rebuild_student_summary(username, gen)
+            return
+        if change(st) is not False:
+            _write_store(path, st)
+
+
+def materialized_home_summary(username, turma):
+    """Pending count, next deadlines, comment totals and newest-first comment feed for a student of `turma`."""
+    summ = _load_home_summary()
+    st = _load_student_summary(username, summ["gen"])
+    names = [turma, ""] if turma else [""]
+    buckets = [summ["turmas"].get(t) or {"activities": 0, "comments": 0, "upcoming": [], "recent": []} for t in names]
+    activities = sum(b["activities"] for b in buckets)
+    comments = sum(b["comments"] for b in buckets)
+    upcoming = sorted((u for b in buckets for u in b["upcoming"]), key=_deadline_order)[:HOME_UPCOMING]
+    recent = sorted((c for b in buckets for c in b["recent"]), key=lambda c: c["seq"], reverse=True)
+    return {"pending": max(0, activities - sum(st["submitted"].get(t, 0) for t in names)), "upcoming": upcoming,
+            "comments": comments, "unread": max(0, comments - sum(st["seen_total"].get(t, 0) for t in names)),
+            "recent": recent[:COMMENT_FEED_SIZE]}
+
+
+def home_summary_stamp(username):
+    return _file_stamp(HOME_SUMMARY_FILE), _file_stamp(_student_summary_path(username))
+
+
+@data_op
+def mark_comments_seen(username, activity):
+    """Record that `username` has seen the current comments of `activity`."""
+    aid = str(activity.get("id"))
+    t = _turma_of("Atividades", activity)
+    n = len(activity.get("comments", []))
+    seen = _read_student_summary(username, _load_home_summary()["gen"])
+    if seen is not None and seen["seen"].get(aid) == n:
+        return  # reopening an activity without new comments writes nothing
+    def change(st):
+        if st["seen"].get(aid) == n:
+            return False
+        st["seen_total"][t] = st["seen_total"].get(t, 0) + n - st["seen"].get(aid, 0)
+        st["seen"][aid] = n
+    _bump_student_summary(username, change)
+
+
+# === Busca (índice invertido) ===
+# BD/BD_BUSCA.json maps each term to {document: term frequency} for activity
+# titles and descriptions, comments and submission texts; new documents are
+# appended to BD/BD_BUSCA.log (one JSON line each) by create_activity,
+# add_submission and add_comment, and folded into the .json once the log
+# passes SEARCH_MERGE_BYTES. Applying a log line twice gives the same index,
+# so readers can't go wrong while a merge swaps the files. Terms are
+# lowercased and accent-free ("exercício" matches "exercicio"); results are
+# ranked with BM25. Submissions only show up for professors, admins and the
+# student who wrote them.
+SEARCH_FILE = BD_DIR / "BD_BUSCA.json"
+SEARCH_LOG = BD_DIR / "BD_BUSCA.log"
+SEARCH_MERGE_BYTES = 1024 * 1024
+SEARCH_TITLE_WEIGHT = 3
+SEARCH_VERSION = 2  # bump when tokenize() changes: older indexes are rebuilt
+_STOPWORDS = frozenset("""a o e de da do das dos em no na nos nas num numa um uma uns umas para pra por
+    com sem que se ao aos as os ou mais mas como foi ser sao esta este isso essa esse ja nao sim
+    the of and to in""".split())
+_WORD_RE = re.compile(r"\w+")
+_SEARCH = {"stamp": None, "offset": 0, "index": None}
+
+
+def _singular(word):
+    # plural endings, so "exercícios" finds "exercício" and "funções" "função";
+    # -re/-se/-ze singulars lose their "e" so they meet plurals that drop "es"
+    # ("análise"/"análises" -> "analis", "flor"/"flores" -> "flor")
+    if len(word) <= 3:
+        return word
+    if not word.endswith("s"):
+        return word[:-1] if word.endswith(("re", "se", "ze")) else word
+    if word.endswith(("oes", "aes")):
+        return word[:-3] + "ao"
+    if word.endswith(("ais", "eis", "ois")):
+        return word[:-2] + "l"
+    if word.endswith("ns"):
+        return word[:-2] + "m"
+    if word.endswith(("res", "zes", "ses")):
+        return word[:-2]
+    return word[:-1]
+
+
+def tokenize(text):
+    """Lowercase, accent-free, singular words of `text` without Portuguese stopwords."""
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return [_singular(t) for t in _WORD_RE.findall(text) if len(t) > 1 and t not in _STOPWORDS]
+
+
+def _search_entry(doc_id, activity, kind, text, student=None, title=""):
+    terms = {}
+    for t in tokenize(title) * SEARCH_TITLE_WEIGHT + tokenize(text):
+        terms[t] = terms.get(t, 0) + 1
+    return {"id": doc_id, "doc": [activity, kind, student, sum(terms.values())], "terms": terms}
+
+
+def _activity_entries(a):
+    aid = a.get("id")
+    entries = [_search_entry(f"a:{aid}", aid, "activity", a.get("description"), title=a.get("title"))]
+    for i, c in enumerate(a.get("comments", [])):
+        entries.append(_search_entry(f"c:{aid}:{i}", aid, "comment", c.get("text"), c.get("author")))
+    for i, sub in enumerate(a.get("submissions", [])):
+        entries.append(_search_entry(f"s:{aid}:{i}", aid, "submission", submission_text(sub), sub.get("student")))
+    return entries
+
+
+def _search_apply(index, entry):
+    docs, postings = index["docs"], index["postings"]
+    old = docs.get(entry["id"])
+    if old == entry["doc"]:
+        return  # documents never change once indexed: this is a replayed log line
+    if old is not None:
+        index["total_len"] -= old[3]
+        for t in [t for t, p in postings.items() if entry["id"] in p]:
+            del postings[t][entry["id"]]
+    docs[entry["id"]] = entry["doc"]
+    index["total_len"] += entry["doc"][3]
+    for t, tf in entry["terms"].items():
+        postings.setdefault(t, {})[entry["id"]] = tf
+
+
+def rebuild_search_index():
+    index = {"version": SEARCH_VERSION, "docs": {}, "postings": {}, "total_len": 0}
+    for a in iter_records("Atividades"):
+        for entry in _activity_entries(a):
+            _search_apply(index, entry)
+    _write_store(SEARCH_FILE, index)
+    SEARCH_LOG.write_bytes(b"")
+    return index
+
+
+def _search_index():
+    """The index (base file + log), re-reading only log lines appended since the last call."""
+    try:
+        st = SEARCH_FILE.stat()
+    except OSError:
+        with file_lock(SEARCH_LOG):
+            rebuild_search_index()
+        st = SEARCH_FILE.stat()
+    stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+    try:
+        log_size = SEARCH_LOG.stat().st_size
+    except OSError:
+        log_size = 0
+    if _SEARCH["stamp"] != stamp or log_size < _SEARCH["offset"]:
+        index = _read_db(SEARCH_FILE)
+        if index.get("version") != SEARCH_VERSION:
+            # terms from an older tokenize() would not match today's queries
+            with file_lock(SEARCH_LOG):
+                index = _read_db(SEARCH_FILE)
+                if index.get("version") != SEARCH_VERSION:
+                    index = rebuild_search_index()
+            st = SEARCH_FILE.stat()
+            stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+            log_size = SEARCH_LOG.stat().st_size
+        _SEARCH.update(stamp=stamp, offset=0, index=index)
+    if log_size > _SEARCH["offset"]:
+        with open(SEARCH_LOG, "rb") as f:
+            f.seek(_SEARCH["offset"])
+            raw = f.read(log_size - _SEARCH["offset"])
+        raw = raw[:raw.rfind(b"\n") + 1]  # an append in progress
+        for line in raw.splitlines():
+            if line.strip():
+                _search_apply(_SEARCH["index"], _jsonl_loads(line))
+        _SEARCH["offset"] += len(raw)
+    return _SEARCH["index"]
+
+
+def _index_documents(entries):
+    """Append new/changed documents to the search log (merging it when large)."""
+    with file_lock(SEARCH_LOG):
+        if not SEARCH_FILE.exists():
+            # the rebuild already sees the write that triggered this
+            rebuild_search_index()
+            return
+        with open(SEARCH_LOG, "ab") as f:
+            f.write(b"".join(_jsonl_line(e) for e in entries))
+            size = f.tell()
+        if size > SEARCH_MERGE_BYTES:
+            index = _search_index()
+            _write_store(SEARCH_FILE, index)
+            SEARCH_LOG.write_bytes(b"")
+
+
+@data_op
+def search(query, role=None, username=None, limit=20, activities=None):
+    """Ranked [{'activity', 'kind', 'student', 'score'}] for `query` (BM25 over the inverted index).
+
+    activities: ids of the activities the caller may open (None = all).
+    """
+    index = _search_index()
+    docs, postings = index["docs"], index["postings"]
+    if not docs:
+        return []
+    n = len(docs)
+    avg_len = index["total_len"] / n or 1
+    k1, b = 1.2, 0.75
+    scores = {}
+    for t in set(tokenize(query)):
+        posting = postings.get(t)
+        if not posting:
+            continue
+        idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+        for doc_id, tf in posting.items():
+            dl = docs[doc_id][3]
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avg_len))
+    staff = role in ("Professor", "Administrativo")
+    visible = ((d, sc) for d, sc in scores.items()
+               if (activities is None or docs[d][0] in activities)
+               and (docs[d][1] != "submission" or staff or docs[d][2] == username))
+    return [{"activity": docs[d][0], "kind": docs[d][1], "student": docs[d][2], "score": round(sc, 4)}
+            for d, sc in heapq.nlargest(limit, visible, key=lambda x: x[1])]
+
+
+# === Respostas parecidas (MinHash + LSH) ===
+# Each submission gets a MinHash signature of its 3-word shingles when it is
+# saved. The signature is cut into LSH_BANDS bands; submissions sharing any
+# band hash land in the same bucket and only those candidates are compared,
+# so flagging a new submission never walks all the others. Per activity,
+# BD/similaridade/<id>.json keeps the signatures, the buckets and the pairs
+# whose estimated similarity (share of equal signature values, an estimate of
+# the Jaccard index) reaches SIMILARITY_FLAG. Pairs from the same student
+# (resubmissions) are not flagged.
+SIMILARITY_DIR = BD_DIR / "similaridade"
+MINHASH_PERM = 64
+LSH_BANDS = 16  # 16 bands of 4 rows: pairs above ~50% similarity very likely share a bucket
+SIMILARITY_FLAG = 0.7
+SHINGLE_WORDS = 3
+_MERSENNE = (1 << 61) - 1
+_coef_rng = random.Random(61)
+_MINHASH_COEF = [(_coef_rng.randrange(1, _MERSENNE), _coef_rng.randrange(_MERSENNE)) for _ in range(MINHASH_PERM)]
+
+
+def shingles(text):
+    words = tokenize(text)
+    grams = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))} if words else set()
+    return {int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "big") for g in grams}
+
+
+def minhash(text):
+    """MinHash signature (MINHASH_PERM 32-bit ints) of the text's shingles; None for empty text."""
+    hashes = shingles(text)
+    if not hashes:
+        return None
+    return [min((a * h + b) % _MERSENNE for h in hashes) & 0xFFFFFFFF for a, b in _MINHASH_COEF]
+
+
+def _lsh_keys(sig):
+    rows = MINHASH_PERM // LSH_BANDS
+    return [f"{band}:{hashlib.blake2b(repr(sig[band * rows:(band + 1) * rows]).encode('ascii'), digest_size=8).hexdigest()}"
+            for band in range(LSH_BANDS)]
+
+
+def _similarity_path(activity_id):
+    return SIMILARITY_DIR / f"{activity_id}.json"
+
+
+def _similarity_add(state, pos, student, sig):
+    state["sigs"][str(pos)] = [student, sig]
+    candidates = set()
+    for key in _lsh_keys(sig):
+        bucket = state["buckets"].setdefault(key, [])
+        candidates.update(bucket)
+        bucket.append(pos)
+    for other in sorted(candidates):
+        other_student, other_sig = state["sigs"][str(other)]
+        if other_student == student:
+            continue
+        est = sum(1 for x, y in zip(sig, other_sig) if x == y) / MINHASH_PERM
+        if est >= SIMILARITY_FLAG:
+            state["pairs"].append([other, pos, round(est, 2)])
+
+
+def rebuild_similarity(activity_id):
+    state = {"sigs": {}, "buckets": {}, "pairs": []}
+    act = read_activity(activity_id) or {}
+    for pos, sub in enumerate(act.get("submissions", [])):
+        sig = minhash(submission_text(sub))
+        if sig:
+            _similarity_add(state, pos, sub.get("student"), sig)
+    SIMILARITY_DIR.mkdir(exist_ok=True)
+    _write_store(_similarity_path(activity_id), state)
+    return state
+
+
+def _index_similarity(activity_id, pos, student, text):
+    sig = minhash(text)
+    if sig is None:
+        return
+    SIMILARITY_DIR.mkdir(exist_ok=True)
+    path = _similarity_path(activity_id)
+    with file_lock(path):
+        if not path.exists():
+            # the rebuild already sees the submission just written
+            rebuild_similarity(activity_id)
+            return
+        state = _read_db(path)
+        _similarity_add(state, pos, student, sig)
+        _write_store(path, state)
+
+
+@data_op
+def similar_submissions(activity_id):
+    """Flagged near-duplicate pairs of the activity: [{'positions': [i, j], 'students': [a, b], 'similarity': s}]."""
+    try:
+        state = _read_db(_similarity_path(activity_id))
+    except Exception:
+        SIMILARITY_DIR.mkdir(exist_ok=True)
+        with file_lock(_similarity_path(activity_id)):
+            state = rebuild_similarity(activity_id)
+    return [{"positions": [i, j], "students": [state["sigs"][str(i)][0], state["sigs"][str(j)][0]], "similarity": sim}
+            for i, j, sim in state["pairs"]]
+
+
+# === Boletim em colunas (BD/boletim) ===
+# Grades live outside BD_A.json, one column file per (matéria, semestre):
+# <id>.sem1.col / <id>.sem2.col are little-endian float64 arrays indexed by
+# the student's row, NaN meaning "no grade". alunos.json maps row ->
+# [username, turma] and disciplinas.json maps id -> subject; both only grow, so
+# rows and ids never move (a student's turma is updated in place when a save
+# of BD_A changes it, see _sync_gradebook_turmas). Filling a subject column rewrites that one file and a
+# report card reads 8 bytes per column. The 'grades' dicts older versions kept
+# in the student records are imported the first time the store is used;
+# `--migrar-notas` then removes them from BD_A.json.
+GRADEBOOK_DIR = BD_DIR / "boletim"
+GRADEBOOK_STUDENTS = GRADEBOOK_DIR / "alunos.json"
+GRADEBOOK_SUBJECTS = GRADEBOOK_DIR / "disciplinas.json"
+SEM_KEYS = ("sem1", "sem2")
+DEFAULT_SUBJECTS = ("Matemática", "Português", "Programação")
+NO_GRADE = float("nan")
+GRADE_MIN, GRADE_MAX = 0.0, 10.0
+
+
+def valid_grade(value):
+    """True for a finite number on the 0-10 scale (NaN is the column's "no grade", never a grade)."""
+    return isinstance(value, (int, float)) and math.isfinite(value) and GRADE_MIN <= value <= GRADE_MAX
+_GRADEBOOK = {}
+
+
+def _column_path(subject_id, sem_key):
+    return GRADEBOOK_DIR / f"{subject_id}.{sem_key}.col"
+
+
+def _read_column(path):
+    col = array.array("d")
+    try:
+        col.frombytes(path.read_bytes())
+    except OSError:
+        return col
+    if sys.byteorder == "big":
+        col.byteswap()
+    return col
+
+
+def _write_column(path, col):
+    if sys.byteorder == "big":
+        col = array.array("d", col)
+        col.byteswap()
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(col.tobytes())
+    _replace(tmp, path)
+
+
+def _read_cell(path, row):
+    try:
+        with open(path, "rb") as f:
+            f.seek(row * 8)
+            raw = f.read(8)
+    except OSError:
+        return None
+    if len(raw) < 8:
+        return None
+    v = struct.unpack("<d", raw)[0]
+    return None if math.isnan(v) else v
+
+
+def _import_legacy_grades():
+    """Build the gradebook from the 'grades' dicts in the student records (caller holds the lock)."""
+    students, subjects, columns = [], {}, {}
+    for st in iter_records("Aluno"):
+        row = len(students)
+        students.append([st.get("username"), get_field_str(st, "turma")])
+        for subj, sems in (st.get("grades") or {}).items():
+            sid = subjects.setdefault(subj, len(subjects))
+            for sem_key in SEM_KEYS:
+                try:
+                    v = float((sems or {}).get(sem_key))
+                except (TypeError, ValueError):
+                    continue  # blank or free text: no number to keep
+                if not valid_grade(v):
+                    continue
+                col = columns.setdefault((sid, sem_key), array.array("d"))
+                col.extend([NO_GRADE] * (row + 1 - len(col)))
+                col[row] = v
+    for (sid, sem_key), col in columns.items():
+        _write_column(_column_path(sid, sem_key), col)
+    _write_store(GRADEBOOK_SUBJECTS, list(subjects))
+    # written last: its presence marks a finished import
+    _write_store(GRADEBOOK_STUDENTS, students)
+
+
+def _ensure_gradebook():
+    if GRADEBOOK_STUDENTS.exists():
+        return
+    GRADEBOOK_DIR.mkdir(parents=True, exist_ok=True)
+    with file_lock(GRADEBOOK_STUDENTS):
+        if not GRADEBOOK_STUDENTS.exists():
+            _import_legacy_grades()
+
+
+def _gradebook_dict(path):
+    """(entries, {key: position}) of alunos.json or disciplinas.json, re-read only when the file changes."""
+    _ensure_gradebook()
+    try:
+        stamp = _file_stamp(path)
+    except OSError:
+        return [], {}
+    hit = _GRADEBOOK.get(path)
+    if hit and hit[0] == stamp:
+        return hit[1], hit[2]
+    entries = _read_db(path)
+    index = {(e[0] if isinstance(e, list) else e): i for i, e in enumerate(entries)}
+    _GRADEBOOK[path] = (stamp, entries, index)
+    return entries, index
+
+
+def _register(path, keys, make):
+    """{key: position} in a dictionary file, appending make(missing_keys) for the keys it lacks."""
+    entries, index = _gradebook_dict(path)
+    if all(k in index for k in keys):
+        return index
+    with file_lock(path):
+        _GRADEBOOK.pop(path, None)
+        entries, index = _gradebook_dict(path)
+        missing = [k for k in dict.fromkeys(keys) if k not in index]
+        if missing:
+            _write_store(path, entries + make(missing))
+            entries, index = _gradebook_dict(path)
+    return index
+
+
+def _student_rows(usernames):
+    def make(missing):
+        # only students graded before they had a row get here (older BD)
+        recs = record_index("Aluno")
+        return [[u, get_field_str(recs.get(u) or {}, "turma")] for u in missing]
+    return _register(GRADEBOOK_STUDENTS, usernames, make)
+
+
+def _write_grades(subj, sem_key, grades):
+    """Store {username: grade or None} in the (subj, sem_key) column and move BD_NOTAS. Returns the usernames changed."""
+    if sem_key not in SEM_KEYS:
+        raise DataError(f"Semestre inválido: {sem_key}")
+    if not grades:
+        return []
+    bad = [u for u, v in grades.items() if v is not None and not valid_grade(v)]
+    if bad:
+        raise DataError("Nota inválida (use 0 a 10) para: " + ", ".join(bad))
+    rows = _student_rows(list(grades))
+    sid = _register(GRADEBOOK_SUBJECTS, [subj], list)[subj]
+    path = _column_path(sid, sem_key)
+    moves = []
+    # column and BD_NOTAS change under both locks, so the stats always match
+    # the columns (and _sync_gradebook_turmas sees them in step)
+    with file_lock(path), file_lock(GRADE_STATS_FILE):
+        students, _ = _gradebook_dict(GRADEBOOK_STUDENTS)
+        col = _read_column(path)
+        need = max(rows[u] for u in grades) + 1
+        if len(col) < need:
+            col.extend([NO_GRADE] * (need - len(col)))
+        for uname, v in grades.items():
+            row = rows[uname]
+            old = None if math.isnan(col[row]) else col[row]
+            new = None if v is None else float(v)
+            if old != new:
+                col[row] = NO_GRADE if new is None else new
+                moves.append((uname, students[row][1], old, new))
+        if moves:
+            _write_column(path, col)
+            if not GRADE_STATS_FILE.exists():
+                # the rebuild already sees the column just written
+                rebuild_grade_stats()
+            else:
+                stats = _load_grade_stats()
+                for _, turma, old, new in moves:
+                    _stats_move(stats, f"{turma}|{subj}|{sem_key}", old, new)
+                _write_store(GRADE_STATS_FILE, stats)
+    return [uname for uname, *_ in moves]
+
+
+def _sync_gradebook_turmas(students):
+    """Record the new turma of students whose turma changed, moving their grades between BD_NOTAS buckets."""
+    if not GRADEBOOK_STUDENTS.exists():
+        return  # the first import reads the turmas from the records
+    entries, rows = _gradebook_dict(GRADEBOOK_STUDENTS)
+    changed = {}
+    for st in students:
+        row = rows.get(st.get("username"))
+        if row is not None and entries[row][1] != get_field_str(st, "turma"):
+            changed[row] = get_field_str(st, "turma")
+    if not changed:
+        return
+    with file_lock(GRADE_STATS_FILE):
+        with file_lock(GRADEBOOK_STUDENTS):
+            _GRADEBOOK.pop(GRADEBOOK_STUDENTS, None)
+            entries, _ = _gradebook_dict(GRADEBOOK_STUDENTS)
+            moved = {row: (entries[row][1], turma) for row, turma in changed.items() if entries[row][1] != turma}
+            entries = [[e[0], moved[row][1]] if row in moved else e for row, e in enumerate(entries)]
+            _write_store(GRADEBOOK_STUDENTS, entries)
+        if not moved or not GRADE_STATS_FILE.exists():
+            return  # a later rebuild reads the new turmas
+        stats = _load_grade_stats()
+        subjects, _ = _gradebook_dict(GRADEBOOK_SUBJECTS)
+        for sid, subj in enumerate(subjects):
+            for sem_key in SEM_KEYS:
+                col = _read_column(_column_path(sid, sem_key))
+                for row, (old, new) in moved.items():
+                    if row < len(col) and not math.isnan(col[row]):
+                        _stats_move(stats, f"{old}|{subj}|{sem_key}", col[row], None)
+                        _stats_move(stats, f"{new}|{subj}|{sem_key}", None, col[row])
+        _write_store(GRADE_STATS_FILE, stats)
+
+
+@data_op
+def report_card(username):
+    """{subject: {"sem1": grade or None, "sem2": ...}} of one student."""
+    _, rows = _gradebook_dict(GRADEBOOK_STUDENTS)
+    subjects, _ = _gradebook_dict(GRADEBOOK_SUBJECTS)
+    row = rows.get(username)
+    return {subj: {k: None if row is None else _read_cell(_column_path(sid, k), row) for k in SEM_KEYS}
+            for sid, subj in enumerate(subjects)}
+
+
+@data_op
+def grade_column(subj, sem_key, usernames):
+    """{username: grade or None} of one (subject, semester) column for the given students."""
+    _, rows = _gradebook_dict(GRADEBOOK_STUDENTS)
+    _, sids = _gradebook_dict(GRADEBOOK_SUBJECTS)
+    col = _read_column(_column_path(sids[subj], sem_key)) if subj in sids else array.array("d")
+    out = {}
+    for uname in usernames:
+        row = rows.get(uname)
+        v = col[row] if row is not None and row < len(col) else NO_GRADE
+        out[uname] = None if math.isnan(v) else v
+    return out
+
+
+@data_op
+def gradebook_subjects():
+    return list(_gradebook_dict(GRADEBOOK_SUBJECTS)[0]) or list(DEFAULT_SUBJECTS)
+
+
+def migrate_grades_to_gradebook():
+    """Move the 'grades' left in the student records into the gradebook. Returns the students cleaned."""
+    legacy = [s for s in load_db("Aluno") if "grades" in s]
+    if not legacy:
+        return 0
+    _ensure_gradebook()
+    # the automatic import already holds them; this also keeps anything an older
+    # version wrote to the records afterwards, where the gradebook has no grade
+    for subj in {subj for s in legacy for subj in (s.get("grades") or {})}:
+        for sem_key in SEM_KEYS:
+            cells = {}
+            for s in legacy:
+                try:
+                    cells[s.get("username")] = float(((s.get("grades") or {}).get(subj) or {}).get(sem_key))
+                except (TypeError, ValueError):
+                    pass
+            cells = {u: v for u, v in cells.items() if valid_grade(v)}
+            current = grade_column(subj, sem_key, list(cells))
+            _write_grades(subj, sem_key, {u: v for u, v in cells.items() if current[u] is None})
+    update_records("Aluno", [s.get("username") for s in legacy], lambda st: st.pop("grades", None))
+    return len(legacy)
+
+
+# === Estatísticas de notas (agregados por turma, matéria e semestre) ===
+# BD/BD_NOTAS.json keeps, for every "turma|matéria|sem1", the count, sum and
+# sum of squares of the numeric grades plus a histogram keyed by the grade
+# rounded to 0.1. Each grade write only moves its old value out of and its new
+# value into one bucket, so means, standard deviations, min/max and
+# distributions never need a scan (or a decrypt) of BD_A. Min and max come
+# from the histogram, so they are the extreme grades rounded to 0.1. Values
+# that are not finite numbers never enter the aggregates. If the file is
+# missing (or holds a non-numeric sum) it is rebuilt from the gradebook columns.
+GRADE_STATS_FILE = BD_DIR / "BD_NOTAS.json"
+
+
+def _stats_move(stats, key, old, new):
+    agg = stats.setdefault(key, {"count": 0, "sum": 0.0, "sumsq": 0.0, "hist": {}})
+    for v, sign in ((old, -1), (new, 1)):
+        if v is None or not math.isfinite(v):
+            continue  # one NaN/inf would turn the sums into null for good
+        agg["count"] += sign
+        agg["sum"] += sign * v
+        agg["sumsq"] += sign * v * v
+        b = f"{v:.1f}"
+        agg["hist"][b] = agg["hist"].get(b, 0) + sign
+        if not agg["hist"][b]:
+            del agg["hist"][b]
+    if not agg["count"]:
+        del stats[key]
+
+
+def rebuild_grade_stats():
+    stats = {}
+    students, _ = _gradebook_dict(GRADEBOOK_STUDENTS)
+    subjects, _ = _gradebook_dict(GRADEBOOK_SUBJECTS)
+    for sid, subj in enumerate(subjects):
+        for sem_key in SEM_KEYS:
+            for row, v in enumerate(_read_column(_column_path(sid, sem_key))):
+                if math.isfinite(v):
+                    _stats_move(stats, f"{students[row][1]}|{subj}|{sem_key}", None, v)
+    _write_store(GRADE_STATS_FILE, stats)
+    return stats
+
+
+def _load_grade_stats():
+    try:
+        stats = _read_db(GRADE_STATS_FILE)
+    except Exception:
+        return rebuild_grade_stats()
+    if any(not isinstance(agg.get(f), (int, float)) for agg in stats.values() for f in ("sum", "sumsq")):
+        return rebuild_grade_stats()  # written with a NaN/inf sum by an older version
+    return stats
+
+
+@data_op
+def grade_stats(turma=None):
+    """Per (turma, matéria, semestre): count, mean, std, min, max and histogram; all turmas if turma is None.
+
+    min and max are read from the 0.1-step histogram, so they are rounded to 0.1.
+    """
+    out = []
+    for key, agg in sorted(_load_grade_stats().items()):
+        t, subj, sem_key = key.rsplit("|", 2)
+        if turma is not None and t != turma:
+            continue
+        n = agg["count"]
+        mean = agg["sum"] / n
+        values = [float(b) for b in agg["hist"]]
+        out.append({"turma": t, "subject": subj, "sem": sem_key, "count": n, "mean": mean,
+                    "std": max(agg["sumsq"] / n - mean * mean, 0.0) ** 0.5,
+                    "min": min(values), "max": max(values), "hist": agg["hist"]})
+    return out
+
+
+# === Livro de faltas (bitsets por turma) ===
+# One small file per turma in BD/faltas/ instead of an ever-growing
+# 'attendance' list inside every student record. Students get a fixed
+# position in the turma's roster; each marked date is an int bitset over the
+# roster ("by_day") and each student an int bitset over the marked dates
+# ("by_student"), both stored as hex. Marking a day is one locked write of one
+# small file, and absence totals per day, student or period are popcounts.
+# Every roll call gets a date, including one with nobody absent, so rates are
+# taken over the days that had a roll call. Dates are stored as ISO
+# YYYY-MM-DD, and re-taking a day's roll call replaces that day's column, so
+# a mistaken absence can be corrected.
+ATTENDANCE_DIR = BD_DIR / "faltas"
+
+
+def turma_slug(turma):
+    """File-system safe, collision-free name for a turma."""
+    clean = re.sub(r"[^A-Za-z0-9_-]+", "_", turma or "")[:40] or "sem_turma"
+    return f"{clean}-{hashlib.sha1((turma or '').encode('utf-8')).hexdigest()[:8]}"
+
+
+def _popcount(n):
+    return n.bit_count() if hasattr(n, "bit_count") else bin(n).count("1")
+
+
+def _ledger_path(turma):
+    return ATTENDANCE_DIR / f"{turma_slug(turma)}.json"
+
+
+def load_ledger(turma):
+    try:
+        return _read_db(_ledger_path(turma))
+    except FileNotFoundError:
+        return {"turma": turma, "roster": [], "dates": [], "by_day": [], "by_student": [], "marked_by": []}
+    except DataError:
+        raise
+    except Exception as e:
+        # never hand back an empty ledger that mark_absences would write over the history
+        raise DataError(f"Livro de faltas da turma {turma} ilegível: {e}") from e
+
+
+def _ledger_mark(ledger, date, usernames, marked_by, replace=True):
+    roster = ledger["roster"]
+    pos = {u: i for i, u in enumerate(roster)}
+    for u in usernames:
+        if u not in pos:
+            pos[u] = len(roster)
+            roster.append(u)
+            ledger["by_student"].append("0")
+    if date in ledger["dates"]:
+        d = ledger["dates"].index(date)
+    else:
+        d = len(ledger["dates"])
+        ledger["dates"].append(date)
+        ledger["by_day"].append("0")
+        ledger["marked_by"].append(marked_by)
+    day_bits = int(ledger["by_day"][d], 16)
+    if replace and day_bits:
+        mask = ~(1 << d)
+        ledger["by_student"] = [format(int(b, 16) & mask, "x") for b in ledger["by_student"]]
+        day_bits = 0
+    for u in usernames:
+        i = pos[u]
+        day_bits |= 1 << i
+        ledger["by_student"][i] = format(int(ledger["by_student"][i], 16) | (1 << d), "x")
+    ledger["by_day"][d] = format(day_bits, "x")
+    ledger["marked_by"][d] = marked_by
+
+
+@data_op
+def mark_absences(turma, date, usernames, marked_by, replace=True):
+    """Record a roll call: `usernames` (possibly none) absent on `date` (one write).
+
+    The roll call replaces any earlier one for the same day; replace=False adds
+    the students to that day's absences instead.
+    """
+    day = parse_date(date)
+    if day is None:
+        raise DataError(f"Data inválida: {date}")
+    ATTENDANCE_DIR.mkdir(exist_ok=True)
+    path = _ledger_path(turma)
+    with file_lock(path):
+        ledger = load_ledger(turma)
+        _ledger_mark(ledger, day.isoformat(), usernames, marked_by, replace)
+        _write_store(path, ledger)
+
+
+@data_op
+def attendance_report(turma, start=None, end=None):
+    """Absences per student and for the class between ISO dates start/end (inclusive)."""
+    ledger = load_ledger(turma)
+    period = 0
+    total = 0
+    days = 0
+    for d, date in enumerate(ledger["dates"]):
+        if (start and date < start) or (end and date > end):
+            continue
+        period |= 1 << d
+        days += 1
+        total += _popcount(int(ledger["by_day"][d], 16))
+    students = {}
+    for u, bits in zip(ledger["roster"], ledger["by_student"]):
+        n = _popcount(int(bits, 16) & period)
+        students[u] = {"absences": n, "rate": (n / days) if days else 0.0}
+    return {"turma": turma, "days": days, "total_absences": total, "students": students}
+
+
+def migrate_attendance_to_ledger():
+    """Move the legacy per-student 'attendance' lists into the turma ledgers. Returns entries moved."""
+    moved = 0
+    students = [s for s in load_db("Aluno") if s.get("attendance")]
+    days = {}
+    for st in students:
+        turma = get_field_str(st, "turma")
+        for entry in st["attendance"]:
+            if entry.get("status", "absent") == "absent" and parse_date(entry.get("date") or ""):
+                day = days.setdefault((turma, entry["date"]), ([], entry.get("marked_by")))
+                day[0].append(st.get("username"))
+                moved += 1
+    for (turma, date), (names, marked_by) in days.items():
+        # added to whatever the ledger already holds for that day
+        mark_absences(turma, date, names, marked_by, replace=False)
+    if students:
+        update_records("Aluno", [s.get("username") for s in students], lambda st: st.pop("attendance", None))
+    return moved
+
+
+# === Exportação de notas e faltas (CSV em streaming) ===
+# Students are read one record at a time (iter_records), decrypted
+# EXPORT_BATCH at a time and written out as rows, so the student records are
+# never all in memory. The subject columns come from BD_NOTAS, the grades from
+# the gradebook columns (one float per student each), the absences
+# from the turma ledgers (one count per student kept while exporting) and the
+# submission counts from one streamed pass over the activities. Per-turma
+# exports keep at most EXPORT_OPEN_FILES files open, reopening a turma's file
+# for appending when its students come up again.
+EXPORT_BATCH = 500
+EXPORT_OPEN_FILES = 16
+EXPORT_FIELDS = ("name", "turma", "curso", "semestre", "periodo")
+
+
+def _batched(items, n):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == n:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _decrypted_students(turma=None):
+    for batch in _batched(iter_records("Aluno"), EXPORT_BATCH):
+        for st in batch:
+            plain = {f: decrypt_field(st.get(f)) or "" for f in EXPORT_FIELDS}
+            if turma is None or plain["turma"] == turma:
+                yield st, plain
+
+
+def _submitted_counts():
+    """{student: {turma: activities submitted}}, from one streamed pass over the activities."""
+    counts = {}
+    for a in iter_records("Atividades"):
+        t = _turma_of("Atividades", a)
+        for student in {s.get("student") for s in a.get("submissions", [])}:
+            per = counts.setdefault(student, {})
+            per[t] = per.get(t, 0) + 1
+    return counts
+
+
+def _gradebook_rows(turma, subjects):
+    summ = _load_home_summary()
+    submitted_by = _submitted_counts()
+    _, rows = _gradebook_dict(GRADEBOOK_STUDENTS)
+    _, sids = _gradebook_dict(GRADEBOOK_SUBJECTS)
+    # n floats per column, whatever the number of students exported
+    columns = [_read_column(_column_path(sids[subj], k)) if subj in sids else array.array("d")
+               for subj in subjects for k in SEM_KEYS]
+    ledgers = {}
+    for st, plain in _decrypted_students(turma):
+        t = plain["turma"]
+        if t not in ledgers:
+            rep = attendance_report(t)
+            # just the counts: one int per student of the turma
+            ledgers[t] = {"days": rep["days"], "absences": {u: v["absences"] for u, v in rep["students"].items()}}
+        uname = st.get("username")
+        absences = ledgers[t]["absences"].get(uname, 0)
+        # only the activities the student can see: their turma's and the untargeted ones
+        names = {t, ""}
+        submitted = sum(n for k, n in submitted_by.get(uname, {}).items() if k in names)
+        assigned = sum(b["activities"] for k, b in summ["turmas"].items() if k in names)
+        r = rows.get(uname)
+        row = [t, uname, plain["name"], plain["curso"], plain["semestre"], plain["periodo"]]
+        for col in columns:
+            v = col[r] if r is not None and r < len(col) else NO_GRADE
+            row.append("" if math.isnan(v) else v)
+        row += [absences, ledgers[t]["days"], submitted, max(0, assigned - submitted)]
+        yield t, row
+
+
+def export_gradebook(dest, turma=None, per_turma=False):
+    """Write grades, absences and submission status as CSV. Returns the number of students written.
+
+    dest is a file, or with per_turma=True a folder that gets one <turma>.csv each.
+    """
+    subjects = sorted({r["subject"] for r in grade_stats(turma)})
+    header = ["turma", "usuario", "nome", "curso", "semestre", "periodo"]
+    for subj in subjects:
+        header += [f"{subj} sem1", f"{subj} sem2"]
+    header += ["faltas", "dias_chamada", "atividades_entregues", "atividades_pendentes"]
+    dest = Path(dest)
+    files = {}       # open handles, least recently used first
+    started = set()  # files that already have their header
+    count = 0
+    try:
+        if per_turma:
+            dest.mkdir(parents=True, exist_ok=True)
+        for t, row in _gradebook_rows(turma, subjects):
+            key = t if per_turma else None
+            if key in files:
+                files[key] = files.pop(key)
+            else:
+                if len(files) >= EXPORT_OPEN_FILES:
+                    files.pop(next(iter(files)))[0].close()
+                # students come in file order: a turma seen before is reopened for appending
+                fh = open(dest / f"{turma_slug(t)}.csv" if per_turma else dest, "a" if key in started else "w",
+                          newline="", encoding="utf-8" if key in started else "utf-8-sig")
+                files[key] = (fh, csv.writer(fh, delimiter=";"))
+                if key not in started:
+                    started.add(key)
+                    files[key][1].writerow(header)
+            files[key][1].writerow(row)
+            count += 1
+        if not started and not per_turma:
+            with open(dest, "w", newline="", encoding="utf-8-sig") as fh:
+                csv.writer(fh, delimiter=";").writerow(header)
+    finally:
+        for fh, _ in files.values():
+            fh.close()
+    return count
+
+
+# === Servidor de dados local (opcional) ===
+# `python main.py --servidor` keeps one parsed, indexed copy of BD in memory and
+# serves the @data_op operations to any number of desktop clients started with
+# `python main.py --conectar 127.0.0.1:8765`. Protocol: one JSON object per
+# line, {"op": name, "params": {...}} -> {"ok": bool, "result"|"error": ...}.
+DATA_SERVER_PORT = 8765
+DATA_SERVER_LINE_LIMIT = 64 * 1024 * 1024
+
+
+class RemoteError(DataError):
+    """The data server could not be reached or failed to run an operation."""
+
+
+async def _serve_data_client(reader, writer, executor):
+    import asyncio
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                req = json.loads(line)
+                fn = DATA_OPS[req["op"]]
+                params = req.get("params") or {}
+                result = await loop.run_in_executor(executor, lambda: fn(**params))
+                resp = {"ok": True, "result": result}
+            except ConflictError as e:
+                resp = {"ok": False, "kind": "conflict", "error": str(e)}
+            except Exception as e:
+                resp = {"ok": False, "kind": "error", "error": f"{type(e).__name__}: {e}"}
+            writer.write(json.dumps(resp, ensure_ascii=False, default=_jsonable).encode("utf-8") + b"\n")
+            await writer.drain()
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        writer.close()
+
+
+def run_data_server(host="127.0.0.1", port=DATA_SERVER_PORT):
+    """Run the data server until interrupted (Ctrl+C)."""
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    DB_CACHE['enabled'] = True
+    # one worker: the server owns the data and applies operations in order,
+    # the event loop stays free to accept and parse requests meanwhile
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    async def main_loop():
+        server = await asyncio.start_server(lambda r, w: _serve_data_client(r, w, executor), host, port, limit=DATA_SERVER_LINE_LIMIT)
+        print(f"Servidor de dados em {host}:{port} (BD: {BD_DIR})")
+        async with server:
+            await server.serve_forever()
+    try:
+        asyncio.run(main_loop())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown()
+
+
+class DataClient:
+    """Blocking client for the data server with a small pool of persistent connections.
+
+    Safe to use from several threads; each call borrows one connection.
+    """
+
+    def __init__(self, host="127.0.0.1", port=DATA_SERVER_PORT, pool_size=4, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        return sock, sock.makefile("rb")
+
+    def _release(self, conn):
+        if self._idle.qsize() < self.pool_size:
+            self._idle.put(conn)
+        else:
+            self._discard(conn)
+
+    def _discard(self, conn):
+        try:
+            conn[1].close()
+            conn[0].close()
+        except OSError:
+            pass
+
+    def call(self, op, **params):
+        payload = json.dumps({"op": op, "params": params}, ensure_ascii=False).encode("utf-8") + b"\n"
+        for attempt in range(2):
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                try:
+                    conn = self._connect()
+                except OSError as e:
+                    raise RemoteError(f"Servidor de dados indisponível ({self.host}:{self.port}): {e}")
+            try:
+                conn[0].sendall(payload)
+                line = conn[1].readline()
+                if not line:
+                    raise ConnectionError("conexão encerrada pelo servidor")
+            except OSError as e:
+                # stale pooled connection (server restarted): retry once on a fresh one
+                self._discard(conn)
+                if attempt == 0:
+                    continue
+                raise RemoteError(f"Falha na comunicação com o servidor de dados: {e}")
+            self._release(conn)
+            resp = json.loads(line)
+            if resp.get("ok"):
+                return resp.get("result")
+            if resp.get("kind") == "conflict":
+                raise ConflictError(resp.get("error"))
+            raise RemoteError(resp.get("error"))
+
+    def close(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+def connect_data_server(address):
+    """Route the @data_op operations of this process through the server at 'host:port'."""
+    global DATA_CLIENT
+    host, _, port = address.rpartition(":")
+    DATA_CLIENT = DataClient(host or "127.0.0.1", int(port or DATA_SERVER_PORT))
+    return DATA_CLIENT
+
+
+# === Notificações de alterações (atualização ao vivo) ===
+# A watcher thread polls the mtime of the activity files; when one changes
+# (another instance, the data server or this app wrote it) it diffs the
+# activities against the previous snapshot and publishes fine-grained events
+# on CHANGES. Student records are not watched: no view follows them live. Open
+# views subscribe and patch their own rows; callbacks run on the Tk thread
+# through CHANGES.pump().
+WATCH_INTERVAL = 1.5        # seconds between mtime checks
+WATCH_DISPATCH_MS = 250     # how often the Tk loop drains queued events
+
+
+class ChangeBus:
+    """Thread-safe publish, Tk-thread dispatch. Events are dicts with a 'type' key."""
+
+    def __init__(self):
+        self._subs = {}
+        self._next = 0
+        self._queue = queue.Queue()
+
+    def subscribe(self, callback, owner=None, types=None):
+        """Call callback(event) for events of `types` (all if None) while `owner` widget exists."""
+        self._next += 1
+        self._subs[self._next] = (callback, owner, set(types) if types else None)
+        return self._next
+
+    def unsubscribe(self, token):
+        self._subs.pop(token, None)
+
+    def publish(self, event):
+        self._queue.put(event)
+
+    def dispatch(self):
+        while True:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            for token, (callback, owner, types) in list(self._subs.items()):
+                if owner is not None:
+                    try:
+                        alive = owner.winfo_exists()
+                    except Exception:
+                        alive = False
+                    if not alive:
+                        # the view was destroyed: drop its subscription
+                        self._subs.pop(token, None)
+                        continue
+                if types is not None and event.get("type") not in types:
+                    continue
+                try:
+                    callback(event)
+                except Exception:
+                    pass
+
+    def pump(self, root, interval_ms=WATCH_DISPATCH_MS):
+        """Drain queued events on the Tk thread every interval_ms."""
+        def tick():
+            self.dispatch()
+            root.after(interval_ms, tick)
+        root.after(interval_ms, tick)
+
+
+CHANGES = ChangeBus()
+
+
+def _activity_signature(a):
+    return {
+        "rev": a.get("_rev"),
+        "fields": (a.get("title"), a.get("description"), a.get("deadline"), json.dumps(a.get("target"), sort_keys=True)),
+        "subs": {(s.get("student"), s.get("date")): s.get("grade") for s in a.get("submissions", [])},
+        "comments": len(a.get("comments", [])),
+    }
+
+
+def diff_activities(old, acts):
+    """Compare the snapshot `old` ({id: signature}) with `acts`. Returns (new_snapshot, events)."""
+    new = {}
+    events = []
+    for a in acts:
+        aid = a.get("id")
+        prev = old.get(aid)
+        if prev is not None and prev["rev"] is not None and prev["rev"] == a.get("_rev"):
+            new[aid] = prev
+            continue
+        sig = _activity_signature(a)
+        new[aid] = sig
+        if prev is None:
+            events.append({"type": "activity_added", "activity_id": aid, "activity": a})
+            continue
+        if sig["fields"] != prev["fields"]:
+            events.append({"type": "activity_changed", "activity_id": aid, "activity": a})
+        for key, grade in sig["subs"].items():
+            if key not in prev["subs"]:
+                events.append({"type": "submission_added", "activity_id": aid, "student": key[0], "activity": a})
+            elif prev["subs"][key] != grade:
+                events.append({"type": "submission_graded", "activity_id": aid, "student": key[0], "grade": grade, "activity": a})
+        if sig["comments"] > prev["comments"]:
+            events.append({"type": "comment_added", "activity_id": aid, "added": sig["comments"] - prev["comments"], "activity": a})
+    for aid in old:
+        if aid not in new:
+            events.append({"type": "activity_removed", "activity_id": aid})
+    return new, events
+
+
+class ChangeWatcher(threading.Thread):
+    """Background mtime poller for the activity files (with `turma`, only a student's shards)."""
+
+    def __init__(self, bus=CHANGES, interval=WATCH_INTERVAL, turma=None):
+        super().__init__(daemon=True, name="bd-watcher")
+        self.bus = bus
+        self.interval = interval
+        self.turma = turma
+        self._stop_evt = threading.Event()
+        self._stamp_seen = None
+        self._snapshot = None
+
+    def _stamp(self):
+        try:
+            return role_stamp("Atividades") if self.turma is None else turma_activities_stamp(self.turma)
+        except OSError:
+            return None
+
+    def _load(self):
+        return load_db("Atividades") if self.turma is None else turma_activities(self.turma)
+
+    def poll(self):
+        stamp = self._stamp()
+        if self._snapshot is not None and stamp == self._stamp_seen:
+            return
+        self._stamp_seen = stamp
+        try:
+            acts = self._load()
+        except DataError:
+            return
+        first = self._snapshot is None
+        self._snapshot, events = diff_activities(self._snapshot or {}, acts)
+        if not first:
+            for ev in events:
+                self.bus.publish(ev)
+
+    def run(self):
+        self.poll()
+        while not self._stop_evt.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                pass
+
+    def stop(self):
+        self._stop_evt.set()
+
+
+# === Pré-carregamento após o login ===
+PREFETCH_POLL_MS = 30
+
+
+class Prefetcher:
+    """Loads what the first screens need on a worker thread right after login.
+
+    Results are queued and collected on the Tk thread by an after() poll, like
+    ChangeBus events. Each one remembers the stamp of the file(s) it was read
+    from and get() only hands it out while they are unchanged; otherwise
+    (or if it isn't ready yet) the view loads the data itself as before.
+    """
+
+    def __init__(self, user, role):
+        self.user = user
+        self.role = role
+        # raw tokens, read here so the worker never touches the LazyUser
+        self.raw = {k: dict.get(user, k) for k in USER_FIELDS}
+        self.ready = {}
+        self._waiting = []
+        self._queue = queue.Queue()
+        self._done = threading.Event()
+
+    def jobs(self):
+        username = self.user.get("username")
+        jobs = []
+        if self.role == "Aluno":
+            turma = decrypt_field(self.raw.get("turma")) or ""
+            jobs.append(("summary", lambda: home_summary_stamp(username), lambda: home_summary(username, turma)))
+            jobs.append(("activities", lambda: turma_activities_stamp(turma), self._activities))
+        else:
+            jobs.append(("activities", lambda: role_stamp("Atividades"), self._activities))
+        jobs.append(("profile", None, self._profile))
+        if self.role in ("Professor", "Administrativo"):
+            jobs.append(("roster", lambda: role_stamp("Aluno"), self._roster))
+        return jobs
+
+    def _activities(self):
+        if self.role == "Aluno":
+            return turma_activities(decrypt_field(self.raw.get("turma")) or "")
+        return load_activities()
+
+    def _profile(self):
+        return {k: decrypt_field(v) for k, v in self.raw.items() if v is not None}
+
+    def _roster(self):
+        turma = decrypt_field(self.raw.get("turma")) or ""
+        roster = turma_roster(turma)
+        for st in roster:
+            get_field_str(st, "name")  # memoized on the record for the views
+        return turma, roster
+
+    def start(self, root):
+        threading.Thread(target=self._run, name="prefetch", daemon=True).start()
+        def poll():
+            self.collect()
+            self._notify()
+            if not self._done.is_set() or not self._queue.empty():
+                root.after(PREFETCH_POLL_MS, poll)
+        root.after(PREFETCH_POLL_MS, poll)
+        return self
+
+    def _run(self):
+        try:
+            for name, stamp_of, job in self.jobs():
+                try:
+                    # stamp taken first: a write during the load makes the result stale, never wrongly fresh
+                    try:
+                        stamp = stamp_of() if stamp_of else None
+                    except OSError:
+                        stamp = None
+                    value = job()
+                    if stamp_of and stamp is None:
+                        stamp = stamp_of()  # derived file built by the job itself
+                except Exception:
+                    continue  # the view will load it itself
+                self._queue.put((name, stamp_of, stamp, value))
+        finally:
+            self._done.set()
+
+    def collect(self):
+        """Move finished results into `ready` (Tk thread)."""
+        while True:
+            try:
+                name, stamp_of, stamp, value = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if name == "profile":
+                for k, v in value.items():
+                    self.user[k] = v
+            else:
+                self.ready[name] = (stamp_of, stamp, value)
+
+    def when_ready(self, name, callback, load):
+        """Call callback(value) on the Tk thread once `name` is in (or, if its job failed, with load())."""
+        self._waiting.append((name, callback, load))
+        self._notify()
+
+    def _notify(self):
+        finished = self._done.is_set() and self._queue.empty()
+        for item in list(self._waiting):
+            name, callback, load = item
+            if name in self.ready or finished:
+                self._waiting.remove(item)
+                callback(self.get(name, load))
+
+    def get(self, name, load):
+        self.collect()
+        hit = self.ready.get(name)
+        if hit is not None:
+            stamp_of, stamp, value = hit
+            try:
+                if stamp_of is None or stamp_of() == stamp:
+                    return value
+            except OSError:
+                pass
+            self.ready.pop(name, None)
+        return load()
+
+
+# === Lembretes de prazo ===
+REMINDER_HOUR = 8                        # reminders go off at 08:00...
+REMINDER_DAYS_BEFORE = (1, 0)            # ...the day before the deadline and on the day
+REMINDER_MAX_WAIT_MS = 6 * 3600 * 1000   # longer waits are armed in steps (Tk takes an int of ms)
+REMINDER_TOAST_MS = 8000
+
+
+class ReminderScheduler:
+    """Deadline reminders for the logged-in student: a min-heap and a single after() timer.
+
+    The heap holds (when, seq, activity_id, deadline) for the
+    activities the student still owes and only its top has a timer armed.
+    CHANGES events add, move or drop activities as they are created, changed or
+    submitted; nothing is rescanned. Dropped or moved entries stay in the heap
+    and are discarded when they reach the top (their deadline no longer matches
+    `pending`).
+    """
+
+    def __init__(self, root, user, notify):
+        self.root = root
+        self.user = user
+        self.notify = notify  # notify(title, text), called on the Tk thread
+        self.heap = []
+        self.pending = {}  # activity_id -> (deadline date, title)
+        self._seq = 0
+        self._timer = None
+        self._armed_for = None
+        self._token = None
+
+    def start(self, acts):
+        now = datetime.datetime.now()
+        for act in acts:
+            self._track(act, now)
+        self._token = CHANGES.subscribe(self._on_change, types=("activity_added", "activity_changed",
+                                                                 "activity_removed", "submission_added"))
+        self._arm()
+        return self
+
+    def stop(self):
+        if self._token is not None:
+            CHANGES.unsubscribe(self._token)
+            self._token = None
+        self._cancel()
+        self.heap.clear()
+        self.pending.clear()
+
+    def forget(self, activity_id):
+        """The student just submitted: no more reminders for it."""
+        self.pending.pop(activity_id, None)
+        self._arm()
+
+    def _track(self, act, now):
+        aid = act.get("id")
+        username = self.user.get("username")
+        d = parse_date(act.get("deadline"))
+        if (d is None or d < now.date() or not activity_visible(self.user, act)
+                or any(s.get("student") == username for s in act.get("submissions", []))):
+            self.pending.pop(aid, None)
+            return
+        known = self.pending.get(aid)
+        self.pending[aid] = (d, act.get("title"))
+        if known is not None and known[0] == d:
+            return  # same deadline: its entries are already in the heap
+        due = [datetime.datetime.combine(d - datetime.timedelta(days=n), datetime.time(REMINDER_HOUR))
+               for n in REMINDER_DAYS_BEFORE]
+        past = [when for when in due if when <= now]
+        # a reminder that went off earlier today (before login or creation) is given right away
+        catch_up = [now] if past and max(past).date() == now.date() else []
+        for when in catch_up + [when for when in due if when > now]:
+            self._seq += 1
+            heapq.heappush(self.heap, (when.timestamp(), self._seq, aid, d))
+
+    def _live(self, entry):
+        return self.pending.get(entry[2], (None,))[0] == entry[3]
+
+    def _cancel(self):
+        if self._timer is not None:
+            try:
+                self.root.after_cancel(self._timer)
+            except Exception:
+                pass
+        self._timer = self._armed_for = None
+
+    def _arm(self):
+        while self.heap and not self._live(self.heap[0]):
+            heapq.heappop(self.heap)
+        target = self.heap[0][0] if self.heap else None
+        if self._timer is not None and target == self._armed_for:
+            return
+        self._cancel()
+        if target is None:
+            return
+        self._armed_for = target
+        delay = max(0, min(int((target - time.time()) * 1000), REMINDER_MAX_WAIT_MS))
+        self._timer = self.root.after(delay, self._fire)
+
+    def _fire(self):
+        self._timer = self._armed_for = None
+        now = time.time()
+        while self.heap and self.heap[0][0] <= now:
+            entry = heapq.heappop(self.heap)
+            if not self._live(entry):
+                continue
+            title, n = self.pending[entry[2]][1], (entry[3] - datetime.date.today()).days
+            when = "hoje" if n <= 0 else ("amanhã" if n == 1 else f"em {n} dias")
+            self.notify("Lembrete de prazo", f"A atividade \"{title}\" vence {when}.")
+        self._arm()
+
+    def _on_change(self, event):
+        kind = event.get("type")
+        aid = event.get("activity_id")
+        if kind == "submission_added":
+            if event.get("student") == self.user.get("username"):
+                self.pending.pop(aid, None)
+        elif kind == "activity_removed":
+            self.pending.pop(aid, None)
+        elif event.get("activity") is not None:
+            self._track(event["activity"], datetime.datetime.now())
+        self._arm()
+
+
+# === Gravação em segundo plano ===
+# The Tk callbacks that save (do_mark, save_grades, do_grade, submit_resp)
+# hand the operation to WRITES instead of running it inline, so a slow disk or
+# a busy data server no longer freezes the window. One writer thread runs the
+# jobs in order. A job carries a key; while a job with that key is still
+# waiting, a new one is folded into it (merge(old_args, new_args), or last
+# write wins), so a burst of saves of the same grade column or attendance day
+# becomes one read-modify-write under the usual CAS/lock. Jobs with key None
+# (new submissions) never coalesce. Outcomes come back on the Tk thread through
+# CHANGES: "write_done" runs on_done(result) and "write_failed" runs
+# on_failed(error) and carries the label and the error; a coalesced job
+# reports to every caller folded into it. flush() is the barrier logout and
+# exit wait on.
+WRITE_FLUSH_TIMEOUT = 10.0   # seconds logout/exit wait for pending writes
+
+
+class WriteBehind:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._order = deque()   # slots in submission order
+        self._jobs = {}         # slot -> {"fn", "args", "label", "on_done": [...], "on_failed": [...]}
+        self._seq = 0
+        self._busy = False
+        self._thread = None
+
+    def submit(self, fn, *args, key=None, merge=None, label="", on_done=None, on_failed=None):
+        """Queue fn(*args); returns True if it was folded into a pending job."""
+        with self._cond:
+            job = self._jobs.get(("key", key)) if key is not None else None
+            folded = job is not None
+            if folded:
+                job["fn"] = fn
+                job["args"] = merge(job["args"], args) if merge else args
+                job["label"] = label
+            else:
+                self._seq += 1
+                slot = ("key", key) if key is not None else ("seq", self._seq)
+                job = self._jobs[slot] = {"fn": fn, "args": args, "label": label, "on_done": [], "on_failed": []}
+                self._order.append(slot)
+            if on_done is not None:
+                job["on_done"].append(on_done)
+            if on_failed is not None:
+                job["on_failed"].append(on_failed)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+            return folded
+
+    def pending(self):
+        with self._cond:
+            return len(self._order) + (1 if self._busy else 0)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._order:
+                    self._cond.wait()
+                job = self._jobs.pop(self._order.popleft())
+                self._busy = True
+            try:
+                result = job["fn"](*job["args"])
+            except Exception as e:
+                CHANGES.publish({"type": "write_failed", "label": job["label"], "error": str(e) or type(e).__name__,
+                                 "on_failed": job["on_failed"]})
+            else:
+                CHANGES.publish({"type": "write_done", "label": job["label"], "result": result, "on_done": job["on_done"]})
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Block until every queued write has run; False if `timeout` seconds passed first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._order or self._busy:
+                left = None if deadline is None else deadline - time.monotonic()
+                if left is not None and left <= 0:
+                    return False
+                self._cond.wait(left)
+            return True
+
+
+WRITES = WriteBehind()
+atexit.register(WRITES.flush, WRITE_FLUSH_TIMEOUT)
+
+
+def _merge_turma_grades(old, new):
+    """Later entries override earlier ones; a blank later entry keeps the earlier value."""
+    values = dict(old[2])
+    values.update({u: t for u, t in new[2].items() if t != ''})
+    return (new[0], new[1], values)
+
+
+def _grade_and_record(activity_id, student, date, grade, graded_by, subj, sem_key):
+    grade_submission(activity_id, student, date, grade, graded_by)
+    set_student_grade(student, subj, sem_key, grade)
+    return get_activity(activity_id)
+
+
+def _submit_and_reload(activity_id, submission):
+    add_submission(activity_id, submission)
+    return get_activity(activity_id)
 
 
 # === Interface de Login / Registro ===
@@ -379,10 +3920,36 @@ ensure_db_files()
 
 
 def start_app():
+    reset_style_registry()
+    start_app.prefetcher = None
+    start_app.reminders = None
+    start_app.watcher = None
     janela = tk.Tk()
     janela.title("Plataforma de Estudos")
+    install_contrast_hook(janela)
     janela.geometry("380x640")
     janela.configure(bg="#f0f0f0")
+    # live refresh: change events are delivered on the Tk thread; the watcher starts at login
+    CHANGES.pump(janela)
+
+    def on_write(event):
+        if event["type"] == "write_failed":
+            for callback in event["on_failed"]:
+                callback(event["error"])
+            messagebox.showerror(event.get("label") or "Gravar", f"Não foi possível salvar: {event.get('error')}")
+        else:
+            for callback in event["on_done"]:
+                callback(event.get("result"))
+    CHANGES.subscribe(on_write, owner=janela, types=("write_done", "write_failed"))
+
+    def on_close():
+        # wait for queued saves, then surface any failure before the window goes
+        if not WRITES.flush(WRITE_FLUSH_TIMEOUT):
+            if not messagebox.askyesno("Sair", "Ainda há gravações pendentes. Sair mesmo assim?"):
+                return
+        CHANGES.dispatch()
+        janela.destroy()
+    janela.protocol("WM_DELETE_WINDOW", on_close)
 
     # Dark header to mimic mobile mockup
     header = tk.Frame(janela, bg=THEME['header_bg'], height=60)
@@ -419,18 +3986,12 @@ def start_app():
 
     def toggle_contrast():
         ACCESSIBILITY['high_contrast'] = not ACCESSIBILITY.get('high_contrast')
-        # immediate feedback: change header bg and relayout
-        header.config(bg="#000000" if ACCESSIBILITY['high_contrast'] else "#1f1f1f")
+        apply_contrast(janela)
         speak('Contraste alto ativado' if ACCESSIBILITY['high_contrast'] else 'Contraste alto desativado')
 
     def toggle_large():
         ACCESSIBILITY['large_text'] = not ACCESSIBILITY.get('large_text')
-        # re-render current dashboard view if logged
-        try:
-            if getattr(start_app, 'current_user', None):
-                show_dashboard(start_app.current_user.get('_role'), start_app.current_user)
-        except Exception:
-            pass
+        apply_text_size()
         speak('Texto maior ativado' if ACCESSIBILITY['large_text'] else 'Texto maior desativado')
 
     tts_btn.config(command=toggle_tts)
@@ -441,6 +4002,18 @@ def start_app():
     apply_a11y(contrast_btn, 'Modo alto contraste')
     apply_a11y(large_btn, 'Aumentar texto')
 
+    # F12 toggles instrumentation together with the debug window
+    def toggle_perf_window(evt=None):
+        win = getattr(start_app, 'perf_window', None)
+        if win is not None and win.winfo_exists():
+            win.destroy()
+            start_app.perf_window = None
+            PERF['enabled'] = False
+            return
+        PERF['enabled'] = True
+        start_app.perf_window = show_perf_window(janela)
+    janela.bind('<F12>', toggle_perf_window)
+
     # Frames
     entry_frame = tk.Frame(janela, bg="#f0f0f0")
     login_frame = tk.Frame(janela, bg="#f0f0f0")
@@ -453,8 +4026,8 @@ def start_app():
     card = tk.Frame(login_frame, bg="white", bd=0, relief="ridge")
     card.place(relx=0.5, rely=0.45, anchor="center", width=320, height=300)
     tk.Label(card, text="", bg="white").pack()
-    tk.Label(card, text="Plataforma de estudos 8BIT-Devs", font=("Arial", 14, "bold"), bg="white", fg="#2f71d3").pack(pady=(8,2))
-    tk.Label(card, text="Login", font=("Arial", 12, "bold"), bg="white").pack(pady=4)
+    tk.Label(card, text="Plataforma de estudos 8BIT-Devs", font=get_font(14, "bold"), bg="white", fg="#2f71d3").pack(pady=(8,2))
+    tk.Label(card, text="Login", font=get_font(12, "bold"), bg="white").pack(pady=4)
 
     role_var = tk.StringVar(value="Aluno")
     roles = ["Aluno", "Professor", "Administrativo"]
@@ -478,6 +4051,26 @@ def start_app():
     msg_label.pack(pady=4)
 
 
+    def export_gradebook_popup():
+        from tkinter import filedialog, simpledialog
+        turma = simpledialog.askstring("Exportar Notas", "Turma (deixe em branco para todas, uma planilha por turma):")
+        if turma is None:
+            return
+        turma = turma.strip()
+        if turma:
+            dest = filedialog.asksaveasfilename(defaultextension=".csv", initialfile=f"notas_{turma}.csv")
+        else:
+            dest = filedialog.askdirectory()
+        if not dest:
+            return
+        try:
+            n = export_gradebook(dest, turma or None, per_turma=not turma)
+        except (DataError, OSError) as e:
+            messagebox.showerror("Exportar Notas", str(e))
+            return
+        messagebox.showinfo("Exportar Notas", f"{n} alunos exportados.")
+
+
     def register_user_admin(role_to_create):
         # pop-up para administrador criar usuário com dados adicionais
         popup = tk.Toplevel()
@@ -532,9 +4125,6 @@ def start_app():
             per = periodo_var.get()
             if not username or not password or not name:
                 return
-            users = load_db(role_to_create)
-            if any(x.get("username") == username for x in users):
-                return
             user_obj = {
                 "username": username,
                 "password": encrypt_field(password),
@@ -546,10 +4136,15 @@ def start_app():
                 "turma": encrypt_field(tur),
                 "semestre": encrypt_field(sem),
                 "periodo": encrypt_field(per),
-                "grades": {}
             }
-            users.append(user_obj)
-            save_db(role_to_create, users)
+            try:
+                # checked under the file lock so two admins can't create the same username
+                created = create_user(role_to_create, user_obj)
+            except DataError as e:
+                messagebox.showerror("Registrar", str(e))
+                return
+            if created is None:
+                return
             popup.destroy()
 
         tk.Button(popup, text="Criar", command=do_create, bg="#4CAF50", fg="white", width=12).pack(pady=8)
@@ -564,38 +4159,23 @@ def start_app():
             msg_label.config(text="Preencha usuário e senha para entrar.")
             return
 
-        users = load_db(role)
         # decrypt passwords if stored encrypted
-        match = None
-        for u in users:
-            stored = u.get("password")
-            stored_plain = decrypt_field(stored) if isinstance(stored, str) else stored
-            if u.get("username") == username and stored_plain == password:
-                # prepare a copy with decrypted fields for UI use
-                u_copy = dict(u)
-                # decrypt common fields
-                if u_copy.get("name") is not None:
-                    u_copy["name"] = decrypt_field(u_copy.get("name"))
-                if u_copy.get("email") is not None:
-                    u_copy["email"] = decrypt_field(u_copy.get("email"))
-                if u_copy.get("cpf") is not None:
-                    u_copy["cpf"] = decrypt_field(u_copy.get("cpf"))
-                if u_copy.get("curso") is not None:
-                    u_copy["curso"] = decrypt_field(u_copy.get("curso"))
-                if u_copy.get("turma") is not None:
-                    u_copy["turma"] = decrypt_field(u_copy.get("turma"))
-                if u_copy.get("semestre") is not None:
-                    u_copy["semestre"] = decrypt_field(u_copy.get("semestre"))
-                if u_copy.get("periodo") is not None:
-                    u_copy["periodo"] = decrypt_field(u_copy.get("periodo"))
-                if u_copy.get("age") is not None:
-                    u_copy["age"] = decrypt_field(u_copy.get("age"))
-                # grades remain as-is (encrypted or plaintext depending on implementation)
-                u_copy["_role"] = role
-                match = u_copy
-                break
+        try:
+            found = login_lookup(role, username, password)
+        except DataError as e:
+            msg_label.config(text=str(e))
+            return
+        # fields are decrypted lazily, only when a view reads them
+        match = LazyUser(found, role) if found else None
         if match:
             msg_label.config(text="", fg="green")
+            start_app.prefetcher = Prefetcher(match, role).start(janela)
+            # students only watch their turma's activities and the untargeted ones
+            start_app.watcher = ChangeWatcher(turma=get_field_str(match, 'turma') if role == "Aluno" else None)
+            start_app.watcher.start()
+            if role == "Aluno":
+                start_app.reminders = ReminderScheduler(janela, match, show_reminder)
+                start_app.prefetcher.when_ready("activities", start_app.reminders.start, lambda: visible_activities(match))
             show_dashboard(role, match)
             # wire bottom navigation to this user (if function present)
             try:
@@ -618,6 +4198,33 @@ def start_app():
 
 
     # --- Dashboard ---
+    def show_reminder(title, text):
+        toast = tk.Toplevel(janela)
+        toast.title(title)
+        toast.transient(janela)
+        toast.geometry(f"+{janela.winfo_rootx() + 20}+{janela.winfo_rooty() + 70}")
+        tk.Label(toast, text=text, font=get_font(11), wraplength=300, justify="left", padx=12, pady=10).pack()
+        tk.Button(toast, text="OK", command=toast.destroy).pack(pady=(0, 8))
+        toast.after(REMINDER_TOAST_MS, toast.destroy)
+        speak(text)
+
+    def visible_activities(user):
+        # students only load their turma's activities and the untargeted ones
+        if user.get('_role') == 'Aluno':
+            return turma_activities(get_field_str(user, 'turma'))
+        return load_activities()
+
+    def prefetched(name, load):
+        """Data warmed up by the login Prefetcher, or load() if it isn't there (or is stale)."""
+        pf = start_app.prefetcher
+        return pf.get(name, load) if pf is not None else load()
+
+    def prefetched_roster(turma):
+        pf_turma, roster = prefetched("roster", lambda: (None, None))
+        return roster if pf_turma == turma and roster is not None else turma_roster(turma)
+
+
+    @instrumented('view.show_dashboard')
     def show_dashboard(role, user):
         login_frame.pack_forget()
         for widget in dashboard_frame.winfo_children():
@@ -648,6 +4255,7 @@ def start_app():
                 admin_actions.pack(pady=6)
                 tk.Button(admin_actions, text="Criar Aluno", command=lambda: register_user_admin("Aluno"), width=15).pack(side="left", padx=6)
                 tk.Button(admin_actions, text="Criar Professor", command=lambda: register_user_admin("Professor"), width=15).pack(side="left", padx=6)
+                tk.Button(admin_actions, text="Exportar Notas (CSV)", command=export_gradebook_popup, width=20).pack(side="left", padx=6)
         # dashboard main area
         dashboard_frame.pack(fill="both", expand=True)
         # populate bottom bar (navigation + logout) and show it
@@ -690,11 +4298,15 @@ def start_app():
 
 
     # Student read-only view: subjects and two semesters
+    @instrumented('view.show_student_view')
     def show_student_view(user):
-        # For simplicity, store student grades inside student's JSON object under 'grades'
-        # Subjects example
-        subjects = ["Matemática", "Português", "Programação"]
-        grades = user.get("grades") or {}
+        # one row of every subject column in the gradebook
+        try:
+            grades = report_card(user.get("username"))
+        except DataError as e:
+            messagebox.showerror("Notas", str(e))
+            return
+        subjects = list(grades) or list(DEFAULT_SUBJECTS)
         for subj in subjects:
             g = grades.get(subj, {"sem1": None, "sem2": None})
             frame = tk.Frame(dashboard_frame)
@@ -707,6 +4319,7 @@ def start_app():
         tk.Label(dashboard_frame, text="(Sem1)   (Sem2)").pack(pady=6)
 
 
+    @instrumented('view.show_profile')
     def show_profile(user):
         # simple profile view (read-only)
         for w in dashboard_frame.winfo_children():
@@ -822,29 +4435,78 @@ def start_app():
 
 
     # ---------- Activities and student home ----------
+    @instrumented('view.student_home')
     def student_home(user):
         # top widgets: pending activities count, recent comments, next deadlines
-        acts = load_activities()
-        today = datetime.date.today()
-
-        pending = [a for a in acts if not any(s.get("student") == user.get("username") for s in a.get("submissions", []))]
-        dated = [a for a in acts if parse_date(a.get("deadline")) is not None]
-        upcoming = sorted(dated, key=lambda x: parse_date(x.get("deadline")) or datetime.date.max)[:5]
-        comments = []
-        for a in acts:
-            for c in a.get("comments", []):
-                comments.append({"activity": a.get("title"), "text": c.get("text")})
+        summary = prefetched("summary", lambda: home_summary(user.get("username"), get_field_str(user, 'turma')))
+        upcoming = summary["upcoming"]
         # mark current view for contextual help
         start_app.current_view = 'student_home'
         start_app.current_view_context = {}
 
         top = tk.Frame(dashboard_frame)
         top.pack(pady=6, fill="x", padx=12)
-        tk.Label(top, text=f"Atividades pendentes: {len(pending)}", bg="#ffefc6", font=get_font(11)).pack(fill="x", padx=6, pady=4)
-        tk.Label(top, text=f"Comentários recentes: {len(comments)}", bg="#e8f4ff", font=get_font(11)).pack(fill="x", padx=6, pady=4)
-        if upcoming:
-            nxt = upcoming[0]
-            tk.Label(top, text=f"Próxima entrega: {nxt.get('title')} em {nxt.get('deadline')}", bg="#ffdede", font=get_font(11)).pack(fill="x", padx=6, pady=4)
+        pending_lbl = tk.Label(top, text=f"Atividades pendentes: {summary['pending']}", bg="#ffefc6", font=get_font(11))
+        pending_lbl.pack(fill="x", padx=6, pady=4)
+        comments_lbl = tk.Label(top, text=f"Comentários não lidos: {summary['unread']}", bg="#e8f4ff", font=get_font(11))
+        comments_lbl.pack(fill="x", padx=6, pady=4)
+        feed_box = tk.Frame(top, bg="#e8f4ff")
+        feed_box.pack(fill="x", padx=6)
+        def show_feed(items):
+            for w in feed_box.winfo_children():
+                w.destroy()
+            for c in items[:HOME_FEED_SHOWN]:
+                tk.Label(feed_box, text=f"{c.get('title')}: {c.get('author')}: {c.get('text')}", bg="#e8f4ff", anchor="w").pack(fill="x", padx=12)
+        feed = summary["recent"][:HOME_FEED_SHOWN]
+        show_feed(feed)
+        next_lbl = tk.Label(top, text="", bg="#ffdede", font=get_font(11))
+        state = {"pending": summary["pending"], "comments": summary["unread"], "next": upcoming[0] if upcoming else None}
+
+        def show_next():
+            nxt = state["next"]
+            if nxt:
+                next_lbl.config(text=f"Próxima entrega: {nxt.get('title')} em {nxt.get('deadline')}")
+                next_lbl.pack(fill="x", padx=6, pady=4)
+            else:
+                next_lbl.pack_forget()
+        show_next()
+
+        # live refresh: patch the three counters instead of rebuilding the view
+        def on_change(ev):
+            kind = ev["type"]
+            act = ev.get("activity") or {}
+            if kind in ("activity_added", "comment_added") and not activity_visible(user, act):
+                return  # another turma's activity: not counted on this home
+            if kind == "activity_added":
+                state["pending"] += 1
+                state["comments"] += len(act.get("comments", []))
+                d = parse_date(act.get("deadline"))
+                cur = parse_date(state["next"].get("deadline")) if state["next"] else None
+                if d is not None and (cur is None or d < cur):
+                    state["next"] = act
+                    show_next()
+            elif kind == "submission_added":
+                if ev.get("student") != user.get("username"):
+                    return
+                # only the first submission of this student takes the activity off the pending list
+                if sum(1 for s in act.get("submissions", []) if s.get("student") == ev.get("student")) != 1:
+                    return
+                state["pending"] = max(0, state["pending"] - 1)
+            elif kind == "comment_added":
+                state["comments"] += ev.get("added", 1)
+                for c in act.get("comments", [])[-ev.get("added", 1):]:
+                    feed.insert(0, {"title": act.get("title"), "author": c.get("author"), "text": c.get("text")})
+                del feed[HOME_FEED_SHOWN:]
+                show_feed(feed)
+            else:
+                fresh = home_summary(user.get("username"), get_field_str(user, 'turma'))
+                state.update(pending=fresh["pending"], comments=fresh["unread"], next=fresh["upcoming"][0] if fresh["upcoming"] else None)
+                feed[:] = fresh["recent"]
+                show_feed(feed)
+                show_next()
+            pending_lbl.config(text=f"Atividades pendentes: {state['pending']}")
+            comments_lbl.config(text=f"Comentários não lidos: {state['comments']}")
+        CHANGES.subscribe(on_change, owner=top, types=("activity_added", "activity_removed", "activity_changed", "submission_added", "comment_added"))
 
         btns = tk.Frame(dashboard_frame)
         btns.pack(pady=8)
@@ -860,42 +4522,103 @@ def start_app():
         apply_a11y(b3, 'Ver notas')
         # offer quick narration for students
         if ACCESSIBILITY.get('tts'):
-            speak(f"Você tem {len(pending)} atividades pendentes. Próxima entrega: {upcoming[0].get('title') if upcoming else 'nenhuma'}")
+            speak(f"Você tem {summary['pending']} atividades pendentes. Próxima entrega: {upcoming[0].get('title') if upcoming else 'nenhuma'}")
 
 
+    @instrumented('view.show_activities_list')
     def show_activities_list(user):
         start_app.current_view = 'activities_list'
         start_app.current_view_context = {}
         for w in dashboard_frame.winfo_children():
             w.destroy()
         tk.Label(dashboard_frame, text="Atividades", font=get_font(14), bg="#f0f0f0").pack(pady=8)
-        acts = load_activities()
+        search_row = tk.Frame(dashboard_frame, bg="#f0f0f0")
+        search_row.pack(fill="x", padx=12)
+        query_e = tk.Entry(search_row, width=40)
+        query_e.pack(side="left", padx=4)
+        results_box = tk.Frame(dashboard_frame, bg="#f0f0f0")
+        results_box.pack(fill="x", padx=12)
+        kinds = {"activity": "Atividade", "comment": "Comentário", "submission": "Resposta"}
+        def do_search(_event=None):
+            for w in results_box.winfo_children():
+                w.destroy()
+            q = query_e.get().strip()
+            if not q:
+                return
+            try:
+                # same rule as the list below: students only reach their turma's activities
+                allowed = set(rows) if user.get('_role') == 'Aluno' else None
+                hits = search(q, user.get('_role'), user.get('username'), activities=allowed)
+            except DataError as e:
+                messagebox.showerror("Buscar", str(e))
+                return
+            if not hits:
+                tk.Label(results_box, text="Nada encontrado.", bg="#f0f0f0").pack(anchor="w")
+            for hit in hits:
+                # the listed activities already cover (almost) every hit: no per-hit lookup
+                row = rows.get(hit["activity"])
+                act = row["act"] if row is not None else (get_activity(hit["activity"]) or {})
+                who = f" ({hit['student']})" if hit["student"] else ""
+                tk.Button(results_box, text=f"{kinds.get(hit['kind'], hit['kind'])}{who}: {act.get('title')}", anchor="w", relief="flat",
+                          command=lambda a=act: show_activity_detail(user, a)).pack(fill="x")
+        query_e.bind("<Return>", do_search)
+        tk.Button(search_row, text="Buscar", command=do_search).pack(side="left")
+        apply_a11y(query_e, 'Buscar atividades, comentários e respostas')
+        acts = prefetched("activities", lambda: visible_activities(user))
         listf = tk.Frame(dashboard_frame, bg="#f0f0f0")
         listf.pack(fill="both", expand=True, padx=8, pady=6)
-        for a in acts:
+        rows = {}
+        def add_row(a):
             # card-like activity item
             frame = tk.Frame(listf, bg="white", bd=0, relief="flat")
             frame.pack(fill="x", padx=4, pady=8)
             inner = tk.Frame(frame, bg="white", bd=1, relief="groove")
             inner.pack(fill="x", padx=6, pady=6)
-            tk.Label(inner, text=a.get("title"), font=get_font(12), bg="white").pack(anchor="w", padx=8)
-            tk.Label(inner, text=f"Entrega: {a.get('deadline')}", bg="white", fg="#757575", font=get_font(10)).pack(anchor="w", padx=8)
-            btn = tk.Button(inner, text="Enviar Trabalho" if user.get('_role')=='Aluno' else "Ver", command=lambda act=a: show_activity_detail(user, act), bg="#2f97d3", fg="white")
+            title_lbl = tk.Label(inner, text=a.get("title"), font=get_font(12), bg="white")
+            title_lbl.pack(anchor="w", padx=8)
+            deadline_lbl = tk.Label(inner, text=f"Entrega: {a.get('deadline')}", bg="white", fg="#757575", font=get_font(10))
+            deadline_lbl.pack(anchor="w", padx=8)
+            row = {"frame": frame, "title": title_lbl, "deadline": deadline_lbl, "act": a}
+            btn = tk.Button(inner, text="Enviar Trabalho" if user.get('_role')=='Aluno' else "Ver", command=lambda: show_activity_detail(user, row["act"]), bg="#2f97d3", fg="white")
             btn.pack(anchor="e", padx=8, pady=6)
+            rows[a.get("id")] = row
+        for a in acts:
+            add_row(a)
+
+        # live refresh: add, patch or remove only the affected cards
+        def on_change(ev):
+            aid = ev.get("activity_id")
+            row = rows.get(aid)
+            if ev["type"] == "activity_removed":
+                if row:
+                    rows.pop(aid)["frame"].destroy()
+            elif row is None:
+                if ev["type"] == "activity_added" and activity_visible(user, ev["activity"]):
+                    add_row(ev["activity"])
+            else:
+                act = ev["activity"]
+                row["act"] = act
+                if ev["type"] == "activity_changed":
+                    row["title"].config(text=act.get("title"))
+                    row["deadline"].config(text=f"Entrega: {act.get('deadline')}")
+        CHANGES.subscribe(on_change, owner=listf)
         if ACCESSIBILITY.get('tts'):
             speak(f"Mostrando {len(acts)} atividades")
         tk.Button(dashboard_frame, text="Voltar", command=lambda: show_dashboard("Aluno", user)).pack(pady=6)
 
 
+    @instrumented('view.professor_tools')
     def professor_tools(user):
         # Simple tools: mark attendance and show performance
         start_app.current_view = 'professor_tools'
         start_app.current_view_context = {}
         for w in dashboard_frame.winfo_children():
             w.destroy()
-        tk.Label(dashboard_frame, text="Ferramentas do Professor", font=("Arial", 14, "bold")).pack(pady=8)
+        tk.Label(dashboard_frame, text="Ferramentas do Professor", font=get_font(14, "bold")).pack(pady=8)
         tk.Button(dashboard_frame, text="Marcar Faltas", command=lambda: mark_attendance_popup(user), width=20).pack(pady=6)
+        tk.Button(dashboard_frame, text="Relatório de Faltas", command=lambda: attendance_report_popup(user), width=20).pack(pady=6)
         tk.Button(dashboard_frame, text="Atribuir Notas", command=lambda: assign_grades_popup(user), width=20).pack(pady=6)
+        tk.Button(dashboard_frame, text="Estatísticas de Notas", command=lambda: grade_stats_popup(user), width=20).pack(pady=6)
         tk.Button(dashboard_frame, text="Ver Desempenho (Atividades)", command=lambda: show_performance_chart(user), width=30).pack(pady=6)
         tk.Button(dashboard_frame, text="Voltar", command=lambda: show_dashboard("Professor", user)).pack(pady=8)
 
@@ -914,13 +4637,12 @@ def start_app():
         # list students in the turma
         listf = tk.Frame(popup)
         listf.pack(fill="both", expand=True, pady=6)
-        students = load_db("Aluno")
         check_items = []
         def refresh_students():
             for c in listf.winfo_children():
                 c.destroy()
             tval = turma_e.get().strip() or get_field_str(user, 'turma')
-            filtered = [s for s in students if get_field_str(s, 'turma') == tval]
+            filtered = prefetched_roster(tval)
             check_items.clear()
             for s in filtered:
                 var = tk.IntVar(value=0)
@@ -933,51 +4655,99 @@ def start_app():
             d = date_e.get().strip()
             if not d:
                 return
-            # ensure date string is valid-ish
-            if parse_date(d) is None:
+            # ensure date string is valid; "2026-3-2" and "2026-03-02" are the same day
+            day = parse_date(d)
+            if day is None:
                 return
+            d = day.isoformat()
             # collect checked
+            # an empty selection is still a roll call (everyone present)
             checked = [item for item in check_items if item['var'].get() == 1]
-            if not checked:
+            tval = turma_e.get().strip() or get_field_str(user, 'turma')
+            # the popup (and the selection) stays until the write has landed
+            def marked(_):
+                if popup.winfo_exists():
+                    popup.destroy()
+            def failed(_):
+                if popup.winfo_exists():
+                    save_btn.config(state="normal")
+            save_btn.config(state="disabled")
+            WRITES.submit(mark_absences, tval, d, [item['username'] for item in checked], user.get('username'),
+                          key=('faltas', tval, d), label='Marcar Faltas',
+                          on_done=marked, on_failed=failed)
+        save_btn = tk.Button(popup, text="Salvar Faltas", command=do_mark, bg="#4CAF50", fg="white")
+        save_btn.pack(pady=8)
+
+
+    def attendance_report_popup(user):
+        popup = tk.Toplevel()
+        popup.title("Relatório de Faltas")
+        popup.geometry("420x420")
+        tk.Label(popup, text="Mês (YYYY-MM, em branco para todo o período):").pack(pady=4)
+        month_e = tk.Entry(popup)
+        month_e.insert(0, datetime.date.today().strftime("%Y-%m"))
+        month_e.pack()
+        tk.Label(popup, text="Turma: (deixe em branco para usar sua turma)").pack(pady=4)
+        turma_e = tk.Entry(popup)
+        turma_e.pack()
+        out = tk.Text(popup, height=16, width=50)
+        def show():
+            month = month_e.get().strip()
+            tval = turma_e.get().strip() or get_field_str(user, 'turma')
+            try:
+                rep = attendance_report(tval, month + "-01" if month else None, month + "-31" if month else None)
+            except DataError as e:
+                messagebox.showerror('Relatório de Faltas', str(e))
                 return
-            studs = load_db("Aluno")
-            changed = False
-            for item in checked:
-                uname = item['username']
-                for st in studs:
-                    if st.get('username') == uname:
-                        att = st.setdefault('attendance', [])
-                        att.append({'date': d, 'status': 'absent', 'marked_by': user.get('username')})
-                        changed = True
-            if changed:
-                save_db('Aluno', studs)
-            popup.destroy()
-        tk.Button(popup, text="Salvar Faltas", command=do_mark, bg="#4CAF50", fg="white").pack(pady=8)
+            lines = [f"Turma {tval}: {rep['total_absences']} faltas em {rep['days']} dias com chamada", ""]
+            for uname, info in sorted(rep['students'].items(), key=lambda kv: -kv[1]['absences']):
+                lines.append(f"{uname}: {info['absences']} faltas ({info['rate'] * 100:.0f}% dos dias)")
+            out.delete("1.0", tk.END)
+            out.insert(tk.END, "\n".join(lines))
+        tk.Button(popup, text="Gerar", command=show).pack(pady=6)
+        out.pack(fill="both", expand=True, padx=6, pady=6)
+        show()
 
 
+    def grade_stats_popup(user):
+        popup = tk.Toplevel()
+        popup.title("Estatísticas de Notas")
+        popup.geometry("480x420")
+        tk.Label(popup, text="Turma: (deixe em branco para usar sua turma; * para todas)").pack(pady=4)
+        turma_e = tk.Entry(popup)
+        turma_e.pack()
+        out = tk.Text(popup, height=18, width=60)
+        def show():
+            tval = turma_e.get().strip() or get_field_str(user, 'turma')
+            rows = grade_stats(None if tval in ('*', '') else tval)
+            lines = []
+            for r in rows:
+                # one bar per whole grade 0..10
+                bars = [0] * 11
+                for b, n in r['hist'].items():
+                    bars[min(int(float(b)), 10)] += n
+                lines.append(f"{r['turma']} · {r['subject']} · {r['sem']}: média {r['mean']:.2f} ± {r['std']:.2f} "
+                             f"(mín {r['min']:.1f}, máx {r['max']:.1f}, {r['count']} notas)")
+                lines.append("   " + " ".join(f"{i}:{n}" for i, n in enumerate(bars) if n))
+            out.delete("1.0", tk.END)
+            out.insert(tk.END, "\n".join(lines) or "Nenhuma nota lançada.")
+        tk.Button(popup, text="Atualizar", command=show).pack(pady=6)
+        out.pack(fill="both", expand=True, padx=6, pady=6)
+        show()
+
+
+    @instrumented('view.show_performance_chart')
     def show_performance_chart(user):
         # compute percent submissions per student in this turma (or per curso)
-        acts = load_activities()
-        students = load_db('Aluno')
         # determine professor's turma (decrypted)
         tval = get_field_str(user, 'turma') or user.get('turma')
         # build list of relevant students (compare decrypted turma)
-        relevant = [s for s in students if get_field_str(s, 'turma') == tval]
+        relevant, perc = turma_submission_rates(tval)
         if not relevant:
             messagebox.showinfo('Desempenho', 'Nenhum aluno encontrado para sua turma.')
             return
 
         names = [get_field_str(s, 'name') or s.get('username') for s in relevant]
-        # relevant activities are those targeted at this turma
-        rel_acts = [a for a in acts if (a.get('target') or {}).get('turma') == tval]
-        total = len(rel_acts)
-        perc = []
-        for s in relevant:
-            submitted = 0
-            for a in rel_acts:
-                if any(sb.get('student') == s.get('username') for sb in a.get('submissions', [])):
-                    submitted += 1
-            perc.append((submitted / total * 100) if total > 0 else 0)
 
         # try to show a matplotlib chart if available
         try:
@@ -1041,12 +4811,18 @@ def start_app():
             if not subj:
                 messagebox.showinfo('Atribuir Notas', 'Digite o nome da disciplina antes de carregar alunos.')
                 return
-            students = load_db('Aluno')
             tval = get_field_str(user, 'turma') or user.get('turma')
-            filtered = [s for s in students if get_field_str(s, 'turma') == tval]
+            filtered = prefetched_roster(tval)
             if not filtered:
                 messagebox.showinfo('Atribuir Notas', 'Nenhum aluno encontrado para sua turma.')
                 return
+            gkey = 'sem1' if sem == '1' else 'sem2'
+            try:
+                # just this subject/semester column, for the turma's rows
+                existing = grade_column(subj, gkey, [s.get('username') for s in filtered])
+            except DataError as e:
+                messagebox.showerror('Atribuir Notas', str(e))
+                return
             # header
             hdr = tk.Frame(students_frame)
             hdr.pack(fill='x')
@@ -1060,10 +4836,8 @@ def start_app():
                 ent = tk.Entry(row, width=10)
                 ent.pack(side='left')
                 # prefill existing grade if present
-                existing = s.get('grades', {}).get(subj, {})
-                gkey = 'sem1' if sem == '1' else 'sem2'
-                if existing and existing.get(gkey) is not None:
-                    ent.insert(0, str(existing.get(gkey)))
+                if existing.get(s.get('username')) is not None:
+                    ent.insert(0, str(existing[s.get('username')]))
                 entries[s.get('username')] = ent
 
         def save_grades():
@@ -1072,29 +4846,15 @@ def start_app():
             if not subj:
                 messagebox.showinfo('Atribuir Notas', 'Digite a disciplina antes de salvar.')
                 return
-            studs = load_db('Aluno')
-            changed = False
-            for st in studs:
-                uname = st.get('username')
-                if uname in entries:
-                    val = entries[uname].get().strip()
-                    if val == '':
-                        continue
-                    try:
-                        v = float(val)
-                    except Exception:
-                        v = val
-                    grades = st.setdefault('grades', {})
-                    subj_gr = grades.setdefault(subj, {})
-                    key = 'sem1' if sem == '1' else 'sem2'
-                    subj_gr[key] = v
-                    changed = True
-            if changed:
-                save_db('Aluno', studs)
-                speak('Notas salvas com sucesso')
-                messagebox.showinfo('Atribuir Notas', 'Notas salvas com sucesso.')
-            else:
-                messagebox.showinfo('Atribuir Notas', 'Nenhuma alteração realizada.')
+            values = {uname: ent.get().strip() for uname, ent in entries.items()}
+            def saved(written):
+                if written:
+                    speak('Notas salvas com sucesso')
+                    messagebox.showinfo('Atribuir Notas', 'Notas salvas com sucesso.')
+                else:
+                    messagebox.showinfo('Atribuir Notas', 'Nenhuma alteração realizada.')
+            WRITES.submit(save_turma_grades, subj, sem, values, key=('notas', subj, sem),
+                          merge=_merge_turma_grades, label='Atribuir Notas', on_done=saved)
 
         load_btn.config(command=load_students)
         save_btn = tk.Button(popup, text='Salvar Notas', command=save_grades, bg='#4CAF50', fg='white')
@@ -1103,16 +4863,60 @@ def start_app():
         apply_a11y(save_btn, 'Salvar notas')
 
 
+    @instrumented('view.show_activity_detail')
     def show_activity_detail(user, activity):
         for w in dashboard_frame.winfo_children():
             w.destroy()
-        tk.Label(dashboard_frame, text=activity.get("title"), font=("Arial", 14, "bold")).pack(pady=8)
+        tk.Label(dashboard_frame, text=activity.get("title"), font=get_font(14, "bold")).pack(pady=8)
         tk.Label(dashboard_frame, text=f"Descrição: {activity.get('description')}").pack(pady=4)
         tk.Label(dashboard_frame, text=f"Prazo: {activity.get('deadline')}").pack(pady=4)
         # show comments
-        tk.Label(dashboard_frame, text="Comentários:", font=("Arial", 11, "bold")).pack(pady=6)
-        for c in activity.get("comments", []):
-            tk.Label(dashboard_frame, text=f"- {c.get('author')}: {c.get('text')}").pack(anchor="w", padx=20)
+        all_comments = activity.get("comments", [])
+        tk.Label(dashboard_frame, text=f"Comentários ({len(all_comments)}):", font=get_font(11, "bold")).pack(pady=6)
+        # newest page first; older pages are added on demand
+        comments_box = tk.Frame(dashboard_frame)
+        comments_box.pack(fill="x")
+        older_btn = tk.Button(comments_box, text="", relief="flat")
+        shown = {"n": 0, "top": None}
+        def show_older():
+            end = len(all_comments) - shown["n"]
+            start = max(0, end - COMMENTS_PAGE)
+            older_btn.pack_forget()
+            top_lbl = None
+            for c in all_comments[start:end]:
+                lbl = tk.Label(comments_box, text=f"- {c.get('author')}: {c.get('text')}")
+                if shown["top"] is not None:
+                    lbl.pack(anchor="w", padx=20, before=shown["top"])
+                else:
+                    lbl.pack(anchor="w", padx=20)
+                top_lbl = top_lbl or lbl
+            shown["top"] = top_lbl or shown["top"]
+            shown["n"] += end - start
+            if shown["n"] < len(all_comments):
+                older_btn.config(text=f"Mostrar comentários anteriores ({len(all_comments) - shown['n']})", command=show_older)
+                older_btn.pack(anchor="w", padx=20, before=shown["top"])
+        show_older()
+        if user.get("_role") == "Aluno" and activity.get("comments"):
+            try:
+                mark_comments_seen(user.get("username"), activity)
+            except DataError:
+                pass
+        comment_row = tk.Frame(dashboard_frame)
+        comment_row.pack(pady=4)
+        comment_e = tk.Entry(comment_row, width=50)
+        comment_e.pack(side="left", padx=4)
+        def send_comment():
+            text = comment_e.get().strip()
+            if not text:
+                return
+            try:
+                add_comment(activity.get("id"), user.get("username"), text)
+                fresh = get_activity(activity.get("id"))
+            except DataError as e:
+                messagebox.showerror("Comentar", str(e))
+                return
+            show_activity_detail(user, fresh or activity)
+        tk.Button(comment_row, text="Comentar", command=send_comment).pack(side="left")
         # submission (student) or submissions overview (professor/admin)
         subm_frame = tk.Frame(dashboard_frame)
         subm_frame.pack(pady=8)
@@ -1123,18 +4927,26 @@ def start_app():
             text = resp.get("1.0", tk.END).strip()
             if not text:
                 return
-            acts = load_activities()
-            for a in acts:
-                if a.get("id") == activity.get("id"):
-                    a.setdefault("submissions", []).append({"student": user.get("username"), "text": text, "date": datetime.date.today().isoformat(), "grade": None})
-            save_activities(acts)
-            show_activity_detail(user, activity)
-        tk.Button(dashboard_frame, text="Enviar", command=submit_resp, bg="#4CAF50", fg="white").pack(pady=6)
+            sub = {"student": user.get("username"), "text": text, "date": datetime.date.today().isoformat(), "grade": None}
+            def sent(fresh):
+                if start_app.reminders is not None:
+                    start_app.reminders.forget(activity.get("id"))
+                # only redraw if the user is still looking at this activity
+                if send_btn.winfo_exists():
+                    show_activity_detail(user, fresh or activity)
+            def failed(_):
+                # the typed answer is still in the box: let the student retry
+                if send_btn.winfo_exists():
+                    send_btn.config(state="normal")
+            send_btn.config(state="disabled")
+            WRITES.submit(_submit_and_reload, activity.get("id"), sub, label="Enviar", on_done=sent, on_failed=failed)
+        send_btn = tk.Button(dashboard_frame, text="Enviar", command=submit_resp, bg="#4CAF50", fg="white")
+        send_btn.pack(pady=6)
 
         # If user is Professor or Administrativo, show submissions list and grading UI
         role = user.get("_role")
         if role in ("Professor", "Administrativo"):
-            tk.Label(dashboard_frame, text="\nSubmissões:", font=("Arial", 11, "bold")).pack(pady=6)
+            tk.Label(dashboard_frame, text="\nSubmissões:", font=get_font(11, "bold")).pack(pady=6)
             subs = activity.get("submissions", [])
             tk.Label(dashboard_frame, text=f"Total: {len(subs)}").pack()
             listf = tk.Frame(dashboard_frame)
@@ -1144,67 +4956,72 @@ def start_app():
                 sp = tk.Toplevel()
                 sp.title(f"Submissão de {sub.get('student')}")
                 sp.geometry("500x400")
-                tk.Label(sp, text=f"Aluno: {sub.get('student')}", font=("Arial", 11, "bold")).pack(pady=6)
+                tk.Label(sp, text=f"Aluno: {sub.get('student')}", font=get_font(11, "bold")).pack(pady=6)
                 tk.Label(sp, text=f"Data: {sub.get('date')}").pack()
                 txt = tk.Text(sp, height=12, width=60)
                 txt.pack(pady=8)
-                txt.insert("1.0", sub.get("text") or "")
+                txt.insert("1.0", submission_text(sub))
                 # grading controls
                 tk.Label(sp, text="Atribuir nota (0-10):").pack()
                 grade_var = tk.StringVar(value="" if sub.get("grade") is None else str(sub.get("grade")))
                 grade_entry = tk.Entry(sp, textvariable=grade_var, width=8)
                 grade_entry.pack()
                 tk.Label(sp, text="Matéria:").pack()
-                subj_var = tk.StringVar(value="Matemática")
-                subj_menu = tk.OptionMenu(sp, subj_var, "Matemática", "Português", "Programação")
+                try:
+                    subjects = gradebook_subjects()
+                except DataError:
+                    subjects = list(DEFAULT_SUBJECTS)
+                subj_var = tk.StringVar(value=subjects[0])
+                subj_menu = tk.OptionMenu(sp, subj_var, *subjects)
                 subj_menu.pack()
                 def do_grade():
                     try:
                         g = float(grade_var.get())
-                        if g < 0 or g > 10:
+                        if not valid_grade(g):
                             return
                     except Exception:
                         return
+                    # decide semester placement: if activity deadline in first half of year -> sem1 else sem2 (simple heuristic)
+                    # determine semester using C helper if available (faster), otherwise fallback to Python
+                    sem_key = "sem1"
+                    dl = activity.get("deadline")
+                    try:
+                        if has_semester_helper and isinstance(dl, str):
+                            # call C helper (returns 1 or 2)
+                            res = lib.semester_from_iso_date(dl.encode('ascii'))
+                            sem_key = "sem1" if res == 1 else ("sem2" if res == 2 else "sem1")
+                        else:
+                            ad = parse_date(dl)
+                            sem_key = "sem1" if ad and ad.month <= 6 else "sem2"
+                    except Exception:
+                        sem_key = "sem1"
                     # persist grade in activity submission and in student's record
-                    acts = load_activities()
-                    for a in acts:
-                        if a.get("id") == activity.get("id"):
-                            for s in a.setdefault("submissions", []):
-                                if s.get("student") == sub.get("student") and s.get("date") == sub.get("date"):
-                                    s["grade"] = g
-                                    s["graded_by"] = user.get("username")
-                    save_activities(acts)
-                    # update student DB
-                    students = load_db("Aluno")
-                    for st in students:
-                        if st.get("username") == sub.get("student"):
-                            # ensure grades structure
-                            st_grades = st.setdefault("grades", {})
-                            subj = subj_var.get()
-                            # decide semester placement: if activity deadline in first half of year -> sem1 else sem2 (simple heuristic)
-                            # determine semester using C helper if available (faster), otherwise fallback to Python
-                            sem_key = "sem1"
-                            dl = activity.get("deadline")
-                            try:
-                                if has_semester_helper and isinstance(dl, str):
-                                    # call C helper (returns 1 or 2)
-                                    res = lib.semester_from_iso_date(dl.encode('ascii'))
-                                    sem_key = "sem1" if res == 1 else ("sem2" if res == 2 else "sem1")
-                                else:
-                                    ad = parse_date(dl)
-                                    sem_key = "sem1" if ad and ad.month <= 6 else "sem2"
-                            except Exception:
-                                sem_key = "sem1"
-                            st_grades.setdefault(subj, {"sem1": None, "sem2": None})
-                            st_grades[subj][sem_key] = g
-                    save_db("Aluno", students)
-                    # refresh
+                    def graded(fresh):
+                        if subm_frame.winfo_exists():
+                            show_activity_detail(user, fresh or activity)
+                    WRITES.submit(_grade_and_record, activity.get("id"), sub.get("student"), sub.get("date"), g,
+                                  user.get("username"), subj_var.get(), sem_key,
+                                  key=("nota", activity.get("id"), sub.get("student"), sub.get("date")),
+                                  label="Salvar Nota", on_done=graded)
                     sp.destroy()
-                    show_activity_detail(user, activity)
                 tk.Button(sp, text="Salvar Nota", command=do_grade, bg="#4CAF50", fg="white").pack(pady=8)
 
-            for s in subs:
-                btn = tk.Button(listf, text=f"{s.get('student')} ({'nota: ' + str(s.get('grade')) if s.get('grade') is not None else 'sem nota'})", command=lambda ss=s: open_submission(ss))
+            try:
+                pairs = similar_submissions(activity.get("id")) if subs else []
+            except DataError:
+                pairs = []
+            flagged = {}
+            for p in pairs:
+                i, j = p["positions"]
+                flagged.setdefault(i, []).append((p["students"][1], p["similarity"]))
+                flagged.setdefault(j, []).append((p["students"][0], p["similarity"]))
+            if pairs:
+                tk.Label(dashboard_frame, text=f"Possíveis cópias: {len(pairs)} par(es)", fg="#b71c1c").pack()
+            for pos, s in enumerate(subs):
+                label = f"{s.get('student')} ({'nota: ' + str(s.get('grade')) if s.get('grade') is not None else 'sem nota'})"
+                if pos in flagged:
+                    label += "  ⚠ parecida com " + ", ".join(f"{other} ({sim:.0%})" for other, sim in flagged[pos])
+                btn = tk.Button(listf, text=label, command=lambda ss=s: open_submission(ss), bg="#ffdede" if pos in flagged else None)
                 btn.pack(fill="x", padx=8, pady=2)
 
         tk.Button(dashboard_frame, text="Voltar", command=lambda: show_activities_list(user)).pack(pady=6)
@@ -1257,53 +5074,87 @@ def start_app():
             de = desc.get().strip()
             if not t or not d:
                 return
-            acts = load_activities()
-            aid = max([a.get("id", 0) for a in acts], default=0) + 1
-            attachments = []
-            if attach_path.get("path"):
-                src = attach_path.get("path")
-                if src:
-                    try:
-                        src_str = str(src)
-                        dstname = f"act_{aid}_" + os.path.basename(src_str)
-                        dst = ATTACH_DIR / dstname
-                        import shutil
-                        shutil.copyfile(src_str, str(dst))
-                        attachments.append(dstname)
-                    except Exception:
-                        pass
             target = {"curso": t_curso.get().strip() or None, "turma": t_turma.get().strip() or None, "semestre": t_sem.get().strip() or None, "periodo": t_period.get().strip() or None}
-            acts.append({"id": aid, "title": t, "description": de, "deadline": d, "comments": [], "submissions": [], "attachments": attachments, "target": target})
-            save_activities(acts)
+            fields = {"title": t, "description": de, "deadline": d, "target": target}
+            try:
+                create_activity(fields, attach_path.get("path") or None)
+            except DataError as e:
+                messagebox.showerror("Criar Atividade", str(e))
+                return
             popup.destroy()
 
         tk.Button(popup, text="Criar", command=do_create_act, bg="#4CAF50", fg="white").pack(pady=8)
 
 
+    @instrumented('view.show_calendar')
     def show_calendar(user):
         # Simple calendar: group activities by date and list
         for w in dashboard_frame.winfo_children():
             w.destroy()
-        tk.Label(dashboard_frame, text="Calendário Escolar", font=("Arial", 14, "bold")).pack(pady=8)
-        acts = load_activities()
-        bydate = {}
-        for a in acts:
+        tk.Label(dashboard_frame, text="Calendário Escolar", font=get_font(14, "bold")).pack(pady=8)
+        acts = prefetched("activities", lambda: visible_activities(user))
+        calf = tk.Frame(dashboard_frame)
+        calf.pack(fill="x")
+        groups = {}   # date key -> frame holding the header and its activities
+        labels = {}   # activity id -> (label, date key)
+
+        def order(key):
+            # dated groups ascending, "Sem data" last
+            return (key == "Sem data", key)
+
+        def add_act(a):
             d = parse_date(a.get("deadline"))
             key = d.isoformat() if d else "Sem data"
-            bydate.setdefault(key, []).append(a)
-        for date in sorted([k for k in bydate.keys() if k != "Sem data"]):
-            tk.Label(dashboard_frame, text=date, font=("Arial", 11, "bold")).pack(anchor="w", padx=12)
-            for a in bydate.get(date, []):
-                tk.Label(dashboard_frame, text=f" - {a.get('title')}").pack(anchor="w", padx=24)
-        if "Sem data" in bydate:
-            tk.Label(dashboard_frame, text="Sem data", font=("Arial", 11, "bold")).pack(anchor="w", padx=12)
-            for a in bydate.get("Sem data", []):
-                tk.Label(dashboard_frame, text=f" - {a.get('title')}").pack(anchor="w", padx=24)
+            grp = groups.get(key)
+            if grp is None:
+                grp = tk.Frame(calf)
+                later = [k for k in groups if order(k) > order(key)]
+                if later:
+                    grp.pack(fill="x", before=groups[min(later, key=order)])
+                else:
+                    grp.pack(fill="x")
+                tk.Label(grp, text=key, font=get_font(11, "bold")).pack(anchor="w", padx=12)
+                groups[key] = grp
+            lbl = tk.Label(grp, text=f" - {a.get('title')}")
+            lbl.pack(anchor="w", padx=24)
+            labels[a.get("id")] = (lbl, key)
+
+        def remove_act(aid):
+            lbl, key = labels.pop(aid)
+            lbl.destroy()
+            if not any(k == key for _, k in labels.values()):
+                groups.pop(key).destroy()
+
+        for a in sorted(acts, key=lambda a: order(format_date(parse_date(a.get("deadline"))) or "Sem data")):
+            add_act(a)
+
+        # live refresh: move/insert/remove only the affected entries
+        def on_change(ev):
+            aid = ev.get("activity_id")
+            if aid in labels:
+                if ev["type"] == "activity_changed":
+                    remove_act(aid)
+                    add_act(ev["activity"])
+                elif ev["type"] == "activity_removed":
+                    remove_act(aid)
+            elif ev["type"] == "activity_added" and activity_visible(user, ev["activity"]):
+                add_act(ev["activity"])
+        CHANGES.subscribe(on_change, owner=calf, types=("activity_added", "activity_changed", "activity_removed"))
         tk.Button(dashboard_frame, text="Voltar", command=lambda: show_dashboard("Aluno", user)).pack(pady=8)
 
 
     def do_logout():
         # Show initial entry screen on logout
+        if not WRITES.flush(WRITE_FLUSH_TIMEOUT):
+            messagebox.showwarning("Sair", "Ainda há gravações pendentes; elas continuarão em segundo plano.")
+        CHANGES.dispatch()
+        start_app.prefetcher = None
+        if start_app.watcher is not None:
+            start_app.watcher.stop()
+            start_app.watcher = None
+        if start_app.reminders is not None:
+            start_app.reminders.stop()
+            start_app.reminders = None
         dashboard_frame.pack_forget()
         user_entry.delete(0, tk.END)
         pass_entry.delete(0, tk.END)
@@ -1314,7 +5165,7 @@ def start_app():
         except Exception:
             pass
     # initial entry screen: single button to choose login
-    tk.Label(entry_frame, text="Plataforma de Estudos", font=("Arial", 16, "bold")).pack(pady=20)
+    tk.Label(entry_frame, text="Plataforma de Estudos", font=get_font(16, "bold")).pack(pady=20)
     tk.Button(entry_frame, text="Entrar", command=lambda: (entry_frame.pack_forget(), login_frame.pack(fill="both", expand=True)), bg="#2196F3", fg="white", width=18).pack(pady=10)
     entry_frame.pack(fill="both", expand=True)
     janela.mainloop()
@@ -1361,4 +5212,70 @@ def salvar_atividades(data):
 
 
 if __name__ == "__main__":
-    start_app()
+    import argparse
+    parser = argparse.ArgumentParser(description="Plataforma de Estudos 8BIT-Devs")
+    parser.add_argument("--servidor", action="store_true", help="executa o servidor de dados local em vez da interface")
+    parser.add_argument("--host", default="127.0.0.1", help="endereço do servidor de dados (com --servidor)")
+    parser.add_argument("--porta", type=int, default=DATA_SERVER_PORT, help="porta do servidor de dados (com --servidor)")
+    parser.add_argument("--conectar", metavar="HOST:PORTA", help="usa um servidor de dados já em execução")
+    parser.add_argument("--converter-formato", choices=DB_FORMATS, help="converte os arquivos BD para o formato e sai")
+    parser.add_argument("--comprimir-envios", action="store_true", help="comprime os textos de submissões grandes já gravados e sai")
+    parser.add_argument("--armazenamento-atividades", choices=("json", "jsonl"), help="converte o armazenamento de atividades e sai")
+    parser.add_argument("--migrar-faltas", action="store_true", help="move as faltas gravadas nos alunos para o livro de faltas por turma e sai")
+    parser.add_argument("--particoes", choices=("turma", "unico"),
+                        help="divide alunos e atividades em um arquivo por turma (BD/turmas) ou junta de volta, e sai")
+    parser.add_argument("--migrar-notas", action="store_true", help="move as notas gravadas nos alunos para o boletim em colunas (BD/boletim) e sai")
+    parser.add_argument("--rotacionar-chave", nargs="?", const="xor", choices=("xor", "fernet"),
+                        help="gera uma nova secret.key e re-encripta todos os arquivos BD (retoma se interrompido) e sai")
+    parser.add_argument("--processos", type=int, help="processos usados por --rotacionar-chave (padrão: número de CPUs)")
+    parser.add_argument("--exportar-notas", metavar="DESTINO", help="exporta notas, faltas e entregas em CSV e sai")
+    parser.add_argument("--turma", help="com --exportar-notas: só esta turma")
+    parser.add_argument("--por-turma", action="store_true", help="com --exportar-notas: DESTINO é uma pasta com um CSV por turma")
+    parser.add_argument("--backup", action="store_true", help="grava um snapshot incremental de BD/ (pasta BD_BACKUP_DIR) e sai")
+    parser.add_argument("--listar-backups", action="store_true", help="lista os snapshots e sai")
+    parser.add_argument("--restaurar", metavar="SNAPSHOT", help="restaura BD/ (feche o aplicativo antes) para o snapshot e sai")
+    parser.add_argument("--podar-backups", nargs=2, type=int, metavar=("ULTIMOS", "DIAS"),
+                        help="mantém os ULTIMOS snapshots e um por dia dos últimos DIAS dias, e sai")
+    args = parser.parse_args()
+    maintenance = (args.armazenamento_atividades or args.converter_formato or args.comprimir_envios
+                   or args.migrar_faltas or args.migrar_notas or args.particoes or args.rotacionar_chave or args.exportar_notas
+                   or args.backup or args.listar_backups or args.restaurar or args.podar_backups)
+    if maintenance:
+        if args.armazenamento_atividades:
+            print(f"Atividades em {convert_activity_store(args.armazenamento_atividades)}")
+        if args.converter_formato:
+            for name, (before, after) in convert_db_format(args.converter_formato).items():
+                print(f"{name}: {before} -> {after} bytes")
+        if args.comprimir_envios:
+            acts, texts = compress_existing_submissions()
+            print(f"{texts} textos comprimidos em {acts} atividades")
+        if args.migrar_faltas:
+            print(f"{migrate_attendance_to_ledger()} faltas migradas")
+        if args.particoes:
+            convert_partitions(args.particoes)
+            print("Alunos e atividades: " + ("um arquivo por turma em BD/turmas" if args.particoes == "turma" else "BD_A.json e BD_ACT.json"))
+        if args.migrar_notas:
+            print(f"notas de {migrate_grades_to_gradebook()} alunos migradas")
+        if args.exportar_notas:
+            n = export_gradebook(args.exportar_notas, args.turma, args.por_turma)
+            print(f"{n} alunos exportados para {args.exportar_notas}")
+        if args.restaurar:
+            print(f"{restore_snapshot(args.restaurar)} arquivos restaurados de {args.restaurar}")
+        if args.backup:
+            name, written = create_snapshot()
+            print(f"Snapshot {name}: {written} bytes novos")
+        if args.podar_backups:
+            snaps, chunks = prune_snapshots(*args.podar_backups)
+            print(f"{snaps} snapshots e {chunks} blocos removidos")
+        if args.listar_backups:
+            print("\n".join(list_snapshots()))
+        if args.rotacionar_chave:
+            done = rotate_key(args.rotacionar_chave, args.processos,
+                              progress=lambda role, n, total: print(f"{role}: {n}/{total}", end="\r"))
+            print(f"\n{done} valores re-encriptados; nova chave {key_id(load_key())}")
+    elif args.servidor:
+        run_data_server(args.host, args.porta)
+    else:
+        if args.conectar:
+            connect_data_server(args.conectar)
+        start_app()
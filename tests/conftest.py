@@ -0,0 +1,18 @@
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+@pytest.fixture
+def main(tmp_path, monkeypatch):
+    """main.py re-imported against an empty BD/ under tmp_path."""
+    monkeypatch.setenv("BD_DIR", str(tmp_path / "BD"))
+    monkeypatch.setenv("BD_BACKUP_DIR", str(tmp_path / "backups"))
+    monkeypatch.delenv("BD_FORMAT", raising=False)
+    monkeypatch.delenv("BD_TEXT_CODEC", raising=False)
+    import main as module
+    return importlib.reload(module)
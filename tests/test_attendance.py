@@ -0,0 +1,53 @@
+import pytest
+
+
+def test_roll_call_without_absences_counts_as_a_day(main):
+    main.mark_absences("1A", "2026-03-02", ["ana"], "prof")
+    main.mark_absences("1A", "2026-03-03", [], "prof")
+    rep = main.attendance_report("1A")
+    assert rep["days"] == 2
+    assert rep["total_absences"] == 1
+    assert rep["students"]["ana"] == {"absences": 1, "rate": 0.5}
+
+
+def test_retaking_a_day_replaces_its_roll_call(main):
+    main.mark_absences("1A", "2026-03-02", ["ana", "bia"], "prof")
+    main.mark_absences("1A", "2026-03-03", ["ana"], "prof")
+    main.mark_absences("1A", "2026-03-02", ["bia"], "prof")
+    rep = main.attendance_report("1A")
+    assert rep["days"] == 2
+    assert rep["total_absences"] == 2
+    assert rep["students"]["ana"]["absences"] == 1
+    assert rep["students"]["bia"]["absences"] == 1
+
+
+def test_dates_are_stored_as_iso(main):
+    main.mark_absences("1A", "2025-1-5", ["ana"], "prof")
+    main.mark_absences("1A", "2025-01-05", ["bia"], "prof")
+    rep = main.attendance_report("1A", "2025-01-01", "2025-01-31")
+    assert rep["days"] == 1
+    assert rep["students"]["bia"]["absences"] == 1
+    with pytest.raises(main.DataError):
+        main.mark_absences("1A", "05/01/2025", ["ana"], "prof")
+
+
+def test_period_filter(main):
+    for day, absent in (("2026-02-27", ["ana"]), ("2026-03-02", ["ana"]), ("2026-03-03", [])):
+        main.mark_absences("1A", day, absent, "prof")
+    rep = main.attendance_report("1A", "2026-03-01", "2026-03-31")
+    assert rep["days"] == 2
+    assert rep["students"]["ana"]["absences"] == 1
+
+
+def test_missing_ledger_is_empty(main):
+    assert main.attendance_report("9Z")["days"] == 0
+
+
+def test_unreadable_ledger_is_not_overwritten(main):
+    main.mark_absences("1A", "2026-03-02", ["ana"], "prof")
+    path = main._ledger_path("1A")
+    path.write_bytes(path.read_bytes()[:20])
+    damaged = path.read_bytes()
+    with pytest.raises(main.DataError):
+        main.mark_absences("1A", "2026-03-03", ["bia"], "prof")
+    assert path.read_bytes() == damaged
@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture
+def activity(main):
+    return main.create_activity({"title": "Lista 1", "description": "", "deadline": "2026-12-01"})["id"]
+
+
+def test_interleaved_write_is_retried_not_lost(main, activity):
+    calls = []
+    def mutate(a):
+        calls.append(1)
+        if len(calls) == 1:
+            # another writer gets in between our read and our locked write
+            main.update_records("Atividades", [activity], lambda b: b.update(description="outro"))
+        a["title"] = "Lista 1 (revisada)"
+    main.update_records("Atividades", [activity], mutate)
+    a = main.get_activity(activity)
+    assert len(calls) == 2
+    assert (a["title"], a["description"]) == ("Lista 1 (revisada)", "outro")
+
+
+def test_writers_that_keep_winning_raise_conflict(main, activity, monkeypatch):
+    monkeypatch.setattr(main, "_backoff", lambda attempt: None)
+    def mutate(a):
+        main.update_records("Atividades", [activity], lambda b: b.update(description=str(b.get("_rev"))))
+    with pytest.raises(main.ConflictError):
+        main.update_records("Atividades", [activity], mutate, retries=3)
+
+
+def test_threads_do_not_lose_comments(main, activity):
+    def comment(n):
+        for i in range(10):
+            main.add_comment(activity, f"t{n}", f"comentário {i}")
+    threads = [threading.Thread(target=comment, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(main.get_activity(activity)["comments"]) == 40
+
+
+def test_processes_sharing_bd_do_not_lose_comments(main, activity):
+    script = ("import main\n"
+              "for i in range(10):\n"
+              f"    main.add_comment({activity}, 'p', str(i))\n")
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    procs = [subprocess.Popen([sys.executable, "-c", script], env=env, cwd=ROOT) for _ in range(3)]
+    assert all(p.wait(timeout=60) == 0 for p in procs)
+    assert len(main.get_activity(activity)["comments"]) == 30
+
+
+def test_concurrent_creates_get_distinct_ids(main):
+    ids = []
+    def create(n):
+        ids.append(main.create_activity({"title": f"A{n}", "description": "", "deadline": "2026-12-01"})["id"])
+    threads = [threading.Thread(target=create, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(ids) == list(range(1, 9))
+
+
+def test_lock_wait_times_out_with_conflict(main, tmp_path):
+    path = tmp_path / "arquivo.json"
+    with main.file_lock(path):
+        with pytest.raises(main.ConflictError):
+            with main.file_lock(path, timeout=0.05):
+                pass
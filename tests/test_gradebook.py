@@ -0,0 +1,74 @@
+import math
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def turma(main):
+    main.save_db("Aluno", [{"username": f"al{i}", "name": main.encrypt_field(f"Aluno {i}"),
+                            "turma": main.encrypt_field("T1")} for i in range(8)])
+    main._student_rows([f"al{i}" for i in range(8)])
+    return main
+
+
+def stats(main):
+    return {(r["turma"], r["subject"], r["sem"]): (r["count"], r["mean"]) for r in main.grade_stats()}
+
+
+def test_grades_round_trip_and_feed_the_stats(turma):
+    main = turma
+    assert sorted(main.save_turma_grades("Mat", "1", {"al0": "7", "al1": "9", "al2": ""})) == ["al0", "al1"]
+    assert main.report_card("al0")["Mat"] == {"sem1": 7.0, "sem2": None}
+    assert stats(main) == {("T1", "Mat", "sem1"): (2, 8.0)}
+    with pytest.raises(main.DataError):
+        main.save_turma_grades("Mat", "1", {"al0": "sete"})
+
+
+def test_concurrent_writes_keep_stats_in_step_with_the_column(turma):
+    main = turma
+    threads = [threading.Thread(target=main.set_student_grade, args=(f"al{i}", "Mat", "sem1", float(i)))
+               for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    column = main.grade_column("Mat", "sem1", [f"al{i}" for i in range(8)])
+    assert all(not math.isnan(v) for v in column.values())
+    assert stats(main)[("T1", "Mat", "sem1")] == (8, 3.5)
+
+
+def test_turma_change_moves_the_grades_between_buckets(turma):
+    main = turma
+    main.save_turma_grades("Mat", "1", {"al0": "7", "al1": "9"})
+    records = [dict(r) for r in main.load_db("Aluno")]
+    records[1]["turma"] = main.encrypt_field("T2")
+    main.save_db("Aluno", records)
+    assert stats(main) == {("T1", "Mat", "sem1"): (1, 7.0), ("T2", "Mat", "sem1"): (1, 9.0)}
+    main.GRADE_STATS_FILE.unlink()
+    assert stats(main) == {("T1", "Mat", "sem1"): (1, 7.0), ("T2", "Mat", "sem1"): (1, 9.0)}
+
+
+@pytest.mark.parametrize("text", ["nan", "inf", "-inf", "11", "-0.5"])
+def test_out_of_range_grades_are_refused_and_stats_still_load(turma, text):
+    main = turma
+    main.save_turma_grades("Mat", "1", {"al0": "7"})
+    with pytest.raises(main.DataError):
+        main.save_turma_grades("Mat", "1", {"al1": text})
+    with pytest.raises(main.DataError):
+        main.set_student_grade("al1", "Mat", "sem1", float(text))
+    assert stats(main) == {("T1", "Mat", "sem1"): (1, 7.0)}
+    assert main.grade_column("Mat", "sem1", ["al1"]) == {"al1": None}
+
+
+def test_stats_ignore_non_finite_values_and_heal_a_corrupted_file(turma):
+    main = turma
+    agg = {}
+    main._stats_move(agg, "T1|Mat|sem1", None, float("nan"))
+    main._stats_move(agg, "T1|Mat|sem1", None, float("inf"))
+    assert agg == {}
+    main.save_turma_grades("Mat", "1", {"al0": "7", "al1": "8"})
+    broken = main._read_db(main.GRADE_STATS_FILE)
+    broken["T1|Mat|sem1"].update(sum=None, sumsq=None)
+    main._write_store(main.GRADE_STATS_FILE, broken)
+    assert stats(main) == {("T1", "Mat", "sem1"): (2, 7.5)}
@@ -0,0 +1,60 @@
+import base64
+
+import pytest
+
+
+@pytest.fixture
+def students(main, monkeypatch):
+    monkeypatch.setattr(main, "KEYRING_TTL", 0)
+    main.save_db("Aluno", [{"username": f"al{i}", "name": main.encrypt_field(f"Aluno {i}")} for i in range(5)])
+    return main
+
+
+def names(main):
+    return [main.decrypt_field(r["name"]) for r in main.load_db("Aluno")]
+
+
+def test_rotation_reencrypts_under_the_new_key(students):
+    main = students
+    old = main.key_id(main.load_key())
+    assert main.rotate_key(workers=1) > 0
+    new = main.key_id(main.load_key())
+    assert new != old
+    assert all(r["name"].startswith(f"ENC@{new}:") for r in main.load_db("Aluno"))
+    assert names(main) == [f"Aluno {i}" for i in range(5)]
+    assert not main.ROTATION_FILE.exists() and not main.next_key_path().exists()
+
+
+def test_crash_after_switch_over_is_finished_on_next_run(students, monkeypatch):
+    main = students
+    real = main._replace
+    def crash(src, dst):
+        real(src, dst)
+        if dst == main.key_path():
+            raise RuntimeError("crash")
+    monkeypatch.setattr(main, "_replace", crash)
+    with pytest.raises(RuntimeError):
+        main.rotate_key(workers=1)
+    monkeypatch.setattr(main, "_replace", real)
+    assert main.ROTATION_FILE.exists() and not main.next_key_path().exists()
+    assert main.rotate_key(workers=1) == 0
+    assert not main.ROTATION_FILE.exists()
+    assert names(main) == [f"Aluno {i}" for i in range(5)]
+
+
+def test_existing_next_key_is_adopted(students):
+    main = students
+    raw = b"k" * 32
+    main.next_key_path().write_bytes(base64.b64encode(raw))
+    main.rotate_key(workers=1)
+    assert main.load_key() == raw
+    assert names(main) == [f"Aluno {i}" for i in range(5)]
+
+
+def test_unreadable_state_keeps_the_next_key(students):
+    main = students
+    main.next_key_path().write_bytes(base64.b64encode(b"k" * 32))
+    main.ROTATION_FILE.write_text("{", encoding="utf-8")
+    with pytest.raises(main.DataError):
+        main.rotate_key(workers=1)
+    assert main.next_key_path().read_bytes() == base64.b64encode(b"k" * 32)
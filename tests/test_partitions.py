@@ -0,0 +1,80 @@
+import pytest
+
+
+@pytest.fixture
+def school(main):
+    students = [{"username": f"al{i}", "password": main.encrypt_field(f"senha{i}"),
+                 "name": main.encrypt_field(f"Aluno {i}"), "turma": main.encrypt_field("T1" if i % 2 else "T2")}
+                for i in range(6)]
+    main.save_db("Aluno", students)
+    for title, turma in (("Frações", "T1"), ("Verbos", "T2"), ("Geral", None)):
+        fields = {"title": title, "description": title, "deadline": "2026-12-01"}
+        if turma:
+            fields["target"] = {"turma": turma}
+        main.create_activity(fields)
+    return main
+
+
+def usernames(records):
+    return sorted(r["username"] for r in records)
+
+
+def titles(records):
+    return sorted(r["title"] for r in records)
+
+
+def test_split_and_merge_keep_every_record(school):
+    main = school
+    before = (usernames(main.load_db("Aluno")), titles(main.load_activities()))
+    main.convert_partitions("turma")
+    assert main.partitioned("Aluno")
+    assert (usernames(main.load_db("Aluno")), titles(main.load_activities())) == before
+    assert usernames(main.turma_roster("T1")) == ["al1", "al3", "al5"]
+    assert titles(main.turma_activities("T1")) == ["Frações", "Geral"]
+    assert main.login_lookup("Aluno", "al3", "senha3") is not None
+    main.convert_partitions("unico")
+    assert not main.partitioned("Aluno")
+    assert (usernames(main.load_db("Aluno")), titles(main.load_activities())) == before
+
+
+def test_writes_after_split_land_in_the_right_shard(school):
+    main = school
+    main.convert_partitions("turma")
+    aid = next(a["id"] for a in main.load_activities() if a["title"] == "Verbos")
+    main.add_comment(aid, "prof", "leiam o capítulo 2")
+    assert main.get_activity(aid)["comments"][-1]["text"] == "leiam o capítulo 2"
+    assert titles(main.turma_activities("T2")) == ["Geral", "Verbos"]
+
+
+def test_home_summary_counts_only_visible_activities(school):
+    main = school
+    aid = next(a["id"] for a in main.load_activities() if a["title"] == "Verbos")
+    main.add_comment(aid, "prof", "só para a T2")
+    home = main.home_summary("al1", "T1")
+    assert home["pending"] == 2
+    assert home["unread"] == 0
+    assert {u["title"] for u in home["upcoming"]} == {"Frações", "Geral"}
+    assert main.home_summary("al2", "T2")["unread"] == 1
+
+
+def test_search_is_limited_to_the_allowed_activities(school):
+    main = school
+    allowed = {a["id"] for a in main.turma_activities("T1")}
+    hits = main.search("verbos", "Aluno", "al1", activities=allowed)
+    assert hits == []
+    assert main.search("verbos", "Professor")
+
+
+def test_student_watcher_only_reports_its_turma(school):
+    main = school
+    main.convert_partitions("turma")
+    events = []
+    bus = type("Bus", (), {"publish": lambda self, ev: events.append(ev)})()
+    watcher = main.ChangeWatcher(bus=bus, turma="T1")
+    watcher.poll()
+    main.create_activity({"title": "Poemas", "description": "", "deadline": "2026-12-02", "target": {"turma": "T2"}})
+    watcher.poll()
+    assert events == []
+    main.create_activity({"title": "Decimais", "description": "", "deadline": "2026-12-03", "target": {"turma": "T1"}})
+    watcher.poll()
+    assert [(ev["type"], ev["activity"]["title"]) for ev in events] == [("activity_added", "Decimais")]
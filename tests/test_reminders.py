@@ -0,0 +1,20 @@
+class FakeRoot:
+    def after(self, ms, fn):
+        return "timer"
+
+    def after_cancel(self, timer):
+        pass
+
+
+def test_reminders_follow_the_activity_list_visibility(main):
+    user = main.LazyUser({"username": "al1", "turma": main.encrypt_field("T1"),
+                          "curso": main.encrypt_field("Química")}, "Aluno")
+    acts = [{"id": "a1", "title": "Frações", "deadline": "2099-01-10", "target": {"turma": "T1", "curso": "Física"}},
+            {"id": "a2", "title": "Verbos", "deadline": "2099-01-10", "target": {"turma": "T2"}},
+            {"id": "a3", "title": "Geral", "deadline": "2099-01-10", "target": {"curso": "Física"}}]
+    shown = [a["id"] for a in acts if main.activity_visible(user, a)]
+    reminders = main.ReminderScheduler(FakeRoot(), user, lambda title, text: None).start(acts)
+    try:
+        assert sorted(reminders.pending) == sorted(shown) == ["a1", "a3"]
+    finally:
+        reminders.stop()
@@ -0,0 +1,19 @@
+def test_plural_and_singular_meet(main):
+    for plural, singular in (("análises", "análise"), ("flores", "flor"), ("funções", "função"), ("meses", "mês")):
+        assert main.tokenize(plural) == main.tokenize(singular)
+
+
+def test_search_finds_both_forms(main):
+    aid = main.create_activity({"title": "Análises de dados", "description": "gráficos", "deadline": "2026-12-01"})["id"]
+    assert [h["activity"] for h in main.search("análise")] == [aid]
+    assert [h["activity"] for h in main.search("análises")] == [aid]
+
+
+def test_index_from_an_older_tokenizer_is_rebuilt(main):
+    aid = main.create_activity({"title": "Análises", "description": "", "deadline": "2026-12-01"})["id"]
+    main.search("warm-up")
+    stale = main._read_db(main.SEARCH_FILE)
+    stale.pop("version")
+    stale["postings"] = {"analises": stale["postings"].pop("analis")}
+    main._write_store(main.SEARCH_FILE, stale)
+    assert [h["activity"] for h in main.search("análise")] == [aid]
@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def writes(main):
+    """A fresh queue whose worker is held on a gate job until gate.set()."""
+    queue = main.WriteBehind()
+    gate = threading.Event()
+    queue.submit(gate.wait)
+    queue.gate = gate
+    yield queue
+    gate.set()
+    queue.flush(5)
+
+
+def outcomes(main):
+    events = []
+    main.CHANGES.subscribe(events.append, types=("write_done", "write_failed"))
+    return events
+
+
+def test_same_key_is_coalesced_into_one_write(main, writes):
+    calls = []
+    def mark(*args):
+        calls.append(args)
+        return main.mark_absences(*args)
+    key = ("faltas", "1A", "2026-03-02")
+    assert not writes.submit(mark, "1A", "2026-03-02", ["ana"], "p1", key=key)
+    assert writes.submit(mark, "1A", "2026-03-02", ["bia"], "p2", key=key)
+    writes.gate.set()
+    assert writes.flush(5)
+    # the later roll call of the day replaces the earlier one
+    assert calls == [("1A", "2026-03-02", ["bia"], "p2")]
+    assert set(main.attendance_report("1A")["students"]) == {"bia"}
+
+
+def test_jobs_without_key_are_kept_in_order(main, writes):
+    calls = []
+    for i in range(3):
+        writes.submit(calls.append, i)
+    writes.gate.set()
+    assert writes.flush(5)
+    assert calls == [0, 1, 2]
+
+
+def test_flush_times_out_while_a_write_is_pending(writes):
+    assert not writes.flush(0.05)
+    assert writes.pending() == 1
+    writes.gate.set()
+    assert writes.flush(5)
+    assert writes.pending() == 0
+
+
+def test_outcomes_reach_every_caller(main, writes):
+    events = outcomes(main)
+    done, failed = [], []
+    def boom():
+        raise main.DataError("disco cheio")
+    writes.submit(lambda: 7, key="k", on_done=done.append)
+    writes.submit(lambda: 8, key="k", on_done=done.append)
+    writes.submit(boom, label="Enviar", on_failed=failed.append)
+    writes.gate.set()
+    writes.flush(5)
+    main.CHANGES.dispatch()
+    for ev in events:
+        for callback in ev.get("on_done", []) + ev.get("on_failed", []):
+            callback(ev.get("result", ev.get("error")))
+    assert done == [8, 8]
+    assert failed == ["disco cheio"]
+    assert [ev["label"] for ev in events if ev["type"] == "write_failed"] == ["Enviar"]
+
+
+def test_merge_turma_grades_keeps_earlier_value_for_blanks(main):
+    merged = main._merge_turma_grades(("Mat", "1", {"ana": "7", "bia": "5"}), ("Mat", "1", {"ana": "", "bia": "6", "caio": "9"}))
+    assert merged == ("Mat", "1", {"ana": "7", "bia": "6", "caio": "9"})